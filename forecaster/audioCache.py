@@ -0,0 +1,96 @@
+import os
+import re
+from datetime import datetime
+
+try:
+    from .cacheStore import CACHE_DIR, FORECAST_MAX_STALE, get_cache_store
+    from .tts import TTS_AUDIO_PREFIX
+except ImportError:
+    from cacheStore import CACHE_DIR, FORECAST_MAX_STALE, get_cache_store
+    from tts import TTS_AUDIO_PREFIX
+
+AUDIO_CACHE_MAX_BYTES = int(float(os.getenv('AUDIO_CACHE_MAX_MB', '50')) * 1024 * 1024)
+AUDIO_CACHE_MAX_FILES = int(os.getenv('AUDIO_CACHE_MAX_FILES', '100'))
+AUDIO_CACHE_MIN_AGE = 60  # seconds; don't evict a file that may have just been written for a forecast being cached
+LEGACY_AUDIO_PATTERN = re.compile(r'^\d{4}-\d{2}-\d{2}_.+\.wav$')  # the old per date and location audio files, e.g. 2025-06-01_38.9,-77.04.wav
+
+
+def mark_played(audio_file):
+    """
+    Record that a cached audio file was just played. The file's modification time is used as its
+    "last used" time (written or played, whichever is later) when choosing what to evict.
+    """
+    if os.path.dirname(os.path.abspath(audio_file)) == os.path.abspath(CACHE_DIR) and os.path.exists(audio_file):
+        os.utime(audio_file)
+
+
+def clean_audio_cache(max_bytes=AUDIO_CACHE_MAX_BYTES, max_files=AUDIO_CACHE_MAX_FILES):
+    """
+    Keep the forecast audio files in CACHE_DIR within the byte and file count budgets, evicting the least
+    recently played files first. Files used by a cached forecast that is unexpired (or still within
+    FORECAST_MAX_STALE, so it may be served stale) are never evicted.
+    Cached forecasts whose audio file no longer exists are removed, as are the older per date and
+    location audio files once no cached forecast uses them (audio is now shared by content hash).
+    Any other WAV files in CACHE_DIR are left alone.
+
+    Returns:
+      dict with the number of 'evicted' files, unused 'legacy' files removed, 'dangling' forecast entries
+      removed, and the remaining 'files' and 'bytes'
+    """
+    store = get_cache_store()
+    now_ts = int(datetime.now().timestamp())
+
+    entries = []
+    protected = set()
+    referenced = set()
+    for date, coord, entry in store.forecast_entries():
+        audio_file = os.path.abspath(os.path.join(CACHE_DIR, entry['wav']))
+        entries.append((date, coord, audio_file))
+        referenced.add(audio_file)
+        if entry['exp'] + FORECAST_MAX_STALE >= now_ts:
+            protected.add(audio_file)
+
+    files = []
+    legacy = 0
+    if os.path.isdir(CACHE_DIR):
+        with os.scandir(CACHE_DIR) as it:
+            for f in it:
+                if not f.is_file() or not f.name.endswith('.wav'):
+                    continue
+                path = os.path.abspath(f.path)
+                legacy_file = LEGACY_AUDIO_PATTERN.match(f.name)
+                if legacy_file and path not in referenced:
+                    os.remove(path)
+                    legacy += 1
+                    continue
+                if legacy_file or f.name.startswith(TTS_AUDIO_PREFIX):  # leave any other WAV files alone
+                    stat = f.stat()
+                    files.append((stat.st_mtime, stat.st_size, path))
+
+    files.sort()  # least recently used first
+    total_bytes = sum(size for _, size, _ in files)
+    total_files = len(files)
+    evicted = 0
+    for mtime, size, path in files:
+        if total_bytes <= max_bytes and total_files <= max_files:
+            break
+        if path in protected or now_ts - mtime < AUDIO_CACHE_MIN_AGE:
+            continue
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total_bytes -= size
+        total_files -= 1
+        evicted += 1
+
+    dangling = 0
+    for date, coord, audio_file in entries:
+        if not os.path.exists(audio_file):
+            store.delete_forecast(date, coord)
+            dangling += 1
+
+    if evicted or legacy or dangling:
+        print(f"Audio cache cleanup evicted {evicted} files, removed {legacy} unused per-date files and {dangling} forecasts without audio ({total_files} files, {round(total_bytes / 1024)} KB remaining)")
+
+    return {'evicted': evicted, 'legacy': legacy, 'dangling': dangling, 'files': total_files, 'bytes': total_bytes}
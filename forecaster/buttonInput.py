@@ -0,0 +1,181 @@
+import bisect
+import os
+import threading
+import time
+
+BUTTON_POLL_INTERVAL = float(os.getenv('BUTTON_POLL_MS', '20')) / 1000
+BUTTON_DEBOUNCE = float(os.getenv('BUTTON_DEBOUNCE_MS', '50')) / 1000
+LONG_PRESS_SECONDS = 1.5
+PRESS_DURING_PLAYBACK = os.getenv('PRESS_DURING_PLAYBACK', 'queue').lower()  # 'queue', 'cancel', or 'ignore'
+
+
+def press_day(duration):
+    """Short presses are for today's forecast, long presses for tomorrow's."""
+    if duration > LONG_PRESS_SECONDS:
+        return 'tomorrow'
+    return 'today'
+
+
+class ButtonWatcher:
+    """
+    Samples a pull-up button (value is False while pressed) at a low rate instead of spinning on it,
+    and only accepts a state change once it has been stable for the debounce time.
+    on_press is called with the press duration in seconds when the button is released.
+    """
+
+    def __init__(self, pin, on_press, poll_interval=BUTTON_POLL_INTERVAL, debounce=BUTTON_DEBOUNCE, clock=time.monotonic, sleep=time.sleep):
+        self.pin = pin
+        self.on_press = on_press
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+        self.clock = clock
+        self.sleep = sleep
+        self._stable = pin.value
+        self._candidate = self._stable
+        self._candidate_since = clock()
+        self._down_ts = None
+
+    def poll(self):
+        """
+        Sample the button once.
+
+        Returns:
+          the press duration if a press just finished, otherwise None
+        """
+        now = self.clock()
+        value = self.pin.value
+        if value != self._candidate:
+            self._candidate = value
+            self._candidate_since = now
+
+        if self._candidate != self._stable and now - self._candidate_since >= self.debounce:
+            self._stable = self._candidate
+            if not self._stable:
+                self._down_ts = self._candidate_since
+            elif self._down_ts is not None:
+                duration = self._candidate_since - self._down_ts
+                self._down_ts = None
+                self.on_press(duration)
+                return duration
+        return None
+
+    def run(self, stop_event=None):
+        while not (stop_event and stop_event.is_set()):
+            self.poll()
+            self.sleep(self.poll_interval)
+
+
+class ForecastWorker(threading.Thread):
+    """
+    Runs forecast requests off the input thread. What happens to a press that arrives while a
+    forecast is being retrieved or played depends on the policy:
+      'queue': play it once the current one finishes (only the latest waiting press is kept)
+      'cancel': stop the current playback and play the new one
+      'ignore': drop it
+    """
+
+    def __init__(self, handler, policy=PRESS_DURING_PLAYBACK, on_cancel=None):
+        super().__init__(name='forecast-worker', daemon=True)
+        if policy not in ['queue', 'cancel', 'ignore']:
+            raise ValueError(f"Invalid press during playback policy: {policy}")
+        self.handler = handler
+        self.policy = policy
+        self.on_cancel = on_cancel
+        self._condition = threading.Condition()
+        self._pending = None
+        self._busy = False
+        self._stopped = False
+
+    def submit(self, day):
+        """
+        Returns:
+          'started', 'queued', 'cancelled' (the current request was cancelled and this one queued), or 'ignored'
+        """
+        with self._condition:
+            if not self._busy and self._pending is None:
+                self._pending = day
+                self._condition.notify()
+                return 'started'
+            if self.policy == 'ignore':
+                return 'ignored'
+            self._pending = day
+            self._condition.notify()
+        if self.policy == 'cancel':
+            if self.on_cancel:
+                self.on_cancel()
+            return 'cancelled'
+        return 'queued'
+
+    def is_busy(self):
+        with self._condition:
+            return self._busy or self._pending is not None
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+
+    def run(self):
+        while True:
+            with self._condition:
+                while self._pending is None and not self._stopped:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+                day = self._pending
+                self._pending = None
+                self._busy = True
+            try:
+                self.handler(day)
+            except Exception as e:
+                print(f"  ERROR handling forecast request for {day}: {e}")
+            finally:
+                with self._condition:
+                    self._busy = False
+
+
+class SimulatedClock:
+    """A clock that only moves forward when sleep() is called, for replaying press timings quickly."""
+
+    def __init__(self, start=0.0):
+        self.now = start
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class SimulatedPin:
+    """
+    Stand-in for the button pin that replays press timings.
+
+    Args:
+      presses: list of (start, duration) tuples in seconds since the clock's start
+      clock: callable returning the current time
+      bounce: seconds of contact bounce to simulate at the start and end of each press
+    """
+
+    def __init__(self, presses, clock, bounce=0.0, bounce_period=0.003):
+        self.presses = sorted(presses)
+        self.clock = clock
+        self.bounce = bounce
+        self.bounce_period = bounce_period
+        self._next = 0  # presses before this one are over; the clock only moves forward
+
+    def add_press(self, start, duration):
+        bisect.insort(self.presses, (start, duration), lo=self._next)
+
+    @property
+    def value(self):
+        now = self.clock()
+        while self._next < len(self.presses) and now >= sum(self.presses[self._next]) + self.bounce:
+            self._next += 1
+        for start, duration in self.presses[self._next:self._next + 1]:
+            end = start + duration
+            if start <= now < end + self.bounce:
+                if self.bounce and (now < start + self.bounce or now >= end):
+                    return int((now - start) / self.bounce_period) % 2 == 1
+                return False
+        return True
@@ -0,0 +1,260 @@
+import fcntl
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+CACHE_DIR = os.getenv('CACHE_DIR', os.path.join(os.path.dirname(__file__), '.cache'))
+WEATHER_FORECAST_CACHE = os.path.join(CACHE_DIR, 'weather_forecast.json')
+WEATHER_CLIMATOLOGY_CACHE = os.path.join(CACHE_DIR, 'weather_climatology.json')
+WEATHER_CACHE_DB = os.path.join(CACHE_DIR, 'weather_cache.db')
+
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'sqlite').lower()  # 'sqlite' or 'json'
+CACHE_PURGE_INTERVAL = int(os.getenv('CACHE_PURGE_INTERVAL_MINUTES', '60')) * 60
+FORECAST_MAX_STALE = int(float(os.getenv('FORECAST_MAX_STALE_MINUTES', '240')) * 60)  # expired forecasts are kept (and may be served) this long
+
+
+def ensure_cache_dir():
+    os.makedirs(CACHE_DIR, exist_ok=True)
+
+
+class JsonCacheStore:
+    """
+    The original cache format: one JSON file for forecasts and one for climatology (see weather-cache-schema.txt).
+    Every read parses the whole file and every write rewrites it, so this is mainly kept as a migration source.
+    Writes are atomic and guarded by a lock file so separate processes don't lose each other's updates.
+    """
+
+    def __init__(self, forecast_file=WEATHER_FORECAST_CACHE, climatology_file=WEATHER_CLIMATOLOGY_CACHE):
+        self.forecast_file = forecast_file
+        self.climatology_file = climatology_file
+
+    def _load(self, cache_file):
+        ensure_cache_dir()
+        if os.path.exists(cache_file):
+            with open(cache_file, 'r') as f:
+                return json.load(f)
+        return {}
+
+    def _save(self, cache_file, data):
+        ensure_cache_dir()
+        temp_file = f"{cache_file}.{os.getpid()}.tmp"
+        with open(temp_file, 'w') as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_file, cache_file)
+
+    @contextmanager
+    def _update(self, cache_file):
+        ensure_cache_dir()
+        with open(cache_file + '.lock', 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                data = self._load(cache_file)
+                yield data
+                self._save(cache_file, data)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def get_forecast(self, date, coord):
+        return self._load(self.forecast_file).get(date, {}).get(coord)
+
+    def put_forecast(self, date, coord, entry):
+        with self._update(self.forecast_file) as cache:
+            cache.setdefault(date, {})[coord] = entry
+
+    def forecast_coords(self, date):
+        return list(self._load(self.forecast_file).get(date, {}).keys())
+
+    def forecast_entries(self):
+        for date, coords in self._load(self.forecast_file).items():
+            for coord, entry in coords.items():
+                yield date, coord, entry
+
+    def delete_forecast(self, date, coord):
+        with self._update(self.forecast_file) as cache:
+            if coord in cache.get(date, {}):
+                del cache[date][coord]
+                if not cache[date]:
+                    del cache[date]
+
+    def get_climatology(self, coord, units):
+        return self._load(self.climatology_file).get(coord, {}).get(units)
+
+    def put_climatology(self, coord, units, record):
+        with self._update(self.climatology_file) as cache:
+            cache.setdefault(coord, {})[units] = record
+
+    def climatology_coords(self, units):
+        return [coord for coord, entries in self._load(self.climatology_file).items() if units in entries]
+
+    def purge(self, now_ts):
+        removed = 0
+        with self._update(self.forecast_file) as cache:
+            for date in list(cache.keys()):
+                for coord in list(cache[date].keys()):
+                    if cache[date][coord]['exp'] < now_ts:
+                        del cache[date][coord]
+                        removed += 1
+                if not cache[date]:
+                    del cache[date]
+        return removed
+
+
+class SqliteCacheStore:
+    """
+    Indexed cache with point lookups by (date, coord) for forecasts and (coord, units) for climatology.
+    SQLite transactions make each write atomic and safe across threads and processes.
+    """
+
+    SCHEMA_VERSION = 3
+
+    def __init__(self, db_file=WEATHER_CACHE_DB):
+        ensure_cache_dir()
+        self.db_file = db_file
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_file, timeout=10, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self.created = self._create_schema()
+
+    def _create_schema(self):
+        with self._lock, self._conn:
+            version = self._conn.execute('PRAGMA user_version').fetchone()[0]
+            if version >= self.SCHEMA_VERSION:
+                return False
+            if version < 1:
+                self._create_schema_v1()
+            if version < 2:
+                self._conn.execute('ALTER TABLE forecast ADD COLUMN fp TEXT')
+            if version < 3:
+                # the single year of weekly averages is replaced by the multi-year climatology, rebuilt on demand
+                self._conn.execute('DROP TABLE IF EXISTS historical')
+                self._conn.execute('''CREATE TABLE climatology (
+                    coord TEXT NOT NULL,
+                    units TEXT NOT NULL,
+                    years TEXT NOT NULL,
+                    checked INTEGER NOT NULL,
+                    data TEXT NOT NULL,
+                    PRIMARY KEY (coord, units)
+                )''')
+            self._conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+            return version == 0
+
+    def _create_schema_v1(self):
+        self._conn.execute('''CREATE TABLE IF NOT EXISTS forecast (
+            date TEXT NOT NULL,
+            coord TEXT NOT NULL,
+            exp INTEGER NOT NULL,
+            txt TEXT NOT NULL,
+            wav TEXT NOT NULL,
+            PRIMARY KEY (date, coord)
+        )''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS forecast_exp ON forecast (exp)')
+        self._conn.execute('''CREATE TABLE IF NOT EXISTS historical (
+            year TEXT NOT NULL,
+            coord TEXT NOT NULL,
+            week INTEGER NOT NULL,
+            low INTEGER NOT NULL,
+            high INTEGER NOT NULL,
+            PRIMARY KEY (year, coord, week)
+        )''')
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def get_forecast(self, date, coord):
+        rows = self._query('SELECT exp, txt, wav, fp FROM forecast WHERE date = ? AND coord = ?', (date, coord))
+        if not rows:
+            return None
+        return {'exp': rows[0][0], 'txt': rows[0][1], 'wav': rows[0][2], 'fp': rows[0][3]}
+
+    def put_forecast(self, date, coord, entry):
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO forecast (date, coord, exp, txt, wav, fp) VALUES (?, ?, ?, ?, ?, ?)',
+                (date, coord, entry['exp'], entry['txt'], entry['wav'], entry.get('fp'))
+            )
+
+    def forecast_coords(self, date):
+        return [row[0] for row in self._query('SELECT coord FROM forecast WHERE date = ?', (date,))]
+
+    def forecast_entries(self):
+        for date, coord, exp, txt, wav, fp in self._query('SELECT date, coord, exp, txt, wav, fp FROM forecast'):
+            yield date, coord, {'exp': exp, 'txt': txt, 'wav': wav, 'fp': fp}
+
+    def delete_forecast(self, date, coord):
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM forecast WHERE date = ? AND coord = ?', (date, coord))
+
+    def get_climatology(self, coord, units):
+        rows = self._query('SELECT years, checked, data FROM climatology WHERE coord = ? AND units = ?', (coord, units))
+        if not rows:
+            return None
+        return {'years': rows[0][0].split(',') if rows[0][0] else [], 'checked': rows[0][1], 'data': rows[0][2]}
+
+    def put_climatology(self, coord, units, record):
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO climatology (coord, units, years, checked, data) VALUES (?, ?, ?, ?, ?)',
+                (coord, units, ','.join(record['years']), record['checked'], record['data'])
+            )
+
+    def climatology_coords(self, units):
+        return [row[0] for row in self._query('SELECT coord FROM climatology WHERE units = ?', (units,))]
+
+    def purge(self, now_ts):
+        with self._lock, self._conn:
+            return self._conn.execute('DELETE FROM forecast WHERE exp < ?', (now_ts,)).rowcount
+
+
+def migrate_json_cache(target, source=None):
+    """Copy every forecast from the JSON cache file into another cache store."""
+    source = source or JsonCacheStore()
+    forecasts = 0
+    for date, coord, entry in source.forecast_entries():
+        target.put_forecast(date, coord, entry)
+        forecasts += 1
+    print(f"Migrated {forecasts} forecasts from the JSON cache")
+
+
+_store = None
+_store_lock = threading.Lock()
+_last_purge = 0
+
+
+def get_cache_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            if CACHE_BACKEND == 'json':
+                _store = JsonCacheStore()
+            elif CACHE_BACKEND == 'sqlite':
+                _store = SqliteCacheStore()
+                if _store.created and os.path.exists(WEATHER_FORECAST_CACHE):
+                    migrate_json_cache(_store)
+            else:
+                raise ValueError(f"Unknown cache backend: {CACHE_BACKEND}")
+        return _store
+
+
+def purge_cache(force=False):
+    """
+    Remove forecasts that expired over FORECAST_MAX_STALE seconds ago, at most once every CACHE_PURGE_INTERVAL seconds.
+
+    Returns:
+      number of entries removed, or None if a purge wasn't due yet
+    """
+    global _last_purge
+    now = datetime.now()
+    now_ts = int(now.timestamp())
+    if not force and now_ts - _last_purge < CACHE_PURGE_INTERVAL:
+        return None
+    _last_purge = now_ts
+    removed = get_cache_store().purge(now_ts - FORECAST_MAX_STALE)
+    if removed:
+        print(f"Purged {removed} expired cache entries")
+    return removed
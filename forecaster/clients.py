@@ -0,0 +1,98 @@
+import os
+import threading
+
+HTTP_TIMEOUT = (float(os.getenv('HTTP_CONNECT_TIMEOUT', '5')), float(os.getenv('HTTP_READ_TIMEOUT', '15')))  # seconds
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', '4'))  # connections kept alive per upstream host
+GENAI_TIMEOUT = int(float(os.getenv('GENAI_TIMEOUT', '60')) * 1000)  # the Gemini SDK wants milliseconds
+
+_sessions = {}
+_genai_client = None
+_genai_types = None
+_lock = threading.Lock()
+
+
+def load_genai():
+    """
+    Import the Gemini SDK on first use. It takes several seconds to import on a Pi Zero, so it is
+    kept out of module import time (see warm_up()).
+    """
+    if _genai_types is not None:
+        return None, _genai_types
+    from google import genai
+    from google.genai import types
+    return genai, types
+
+
+def get_http_session(upstream):
+    """
+    Returns:
+      a long-lived, connection pooled requests.Session for the named upstream (e.g. 'forecast' or 'archive'),
+      so repeated requests reuse the TCP connection and TLS session instead of handshaking every time.
+    """
+    with _lock:
+        if upstream not in _sessions:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _sessions[upstream] = session
+        return _sessions[upstream]
+
+
+def http_get(upstream, url, timeout=None):
+    """
+    GET a URL using the pooled session for the upstream.
+
+    Args:
+      timeout: seconds left for this request (e.g. from a press's deadline); HTTP_TIMEOUT still caps the
+        connect and read timeouts
+
+    Raises:
+      requests.RequestException (an IOError) on connection problems and timeouts.
+    """
+    if timeout is None:
+        return get_http_session(upstream).get(url, timeout=HTTP_TIMEOUT)
+    return get_http_session(upstream).get(url, timeout=(min(HTTP_TIMEOUT[0], timeout), min(HTTP_TIMEOUT[1], timeout)))
+
+
+def genai_http_options(types, timeout=None):
+    """
+    Returns:
+      HttpOptions limiting one Gemini request to timeout seconds (and never more than GENAI_TIMEOUT), or None without a timeout
+    """
+    if timeout is None:
+        return None
+    return types.HttpOptions(timeout=min(GENAI_TIMEOUT, int(timeout * 1000)))
+
+
+def get_genai_client():
+    """Returns the shared Gemini client, creating it on first use."""
+    global _genai_client
+    with _lock:
+        if _genai_client is None:
+            genai, types = load_genai()
+            _genai_client = genai.Client(
+                api_key=os.getenv('GEN_AI_KEY'),
+                http_options=types.HttpOptions(timeout=GENAI_TIMEOUT)
+            )
+        return _genai_client
+
+
+def use_genai_client(client, types):
+    """
+    Use a stand-in Gemini client and types module (e.g. the fakes in test/benchmark.py) instead of the real SDK.
+    """
+    global _genai_client, _genai_types
+    with _lock:
+        _genai_client = client
+        _genai_types = types
+
+
+def warm_up():
+    """Import the Gemini SDK and HTTP stack, and create the shared clients, ahead of the first forecast request."""
+    get_http_session('forecast')
+    get_http_session('archive')
+    get_genai_client()
@@ -0,0 +1,150 @@
+import base64
+import math
+import os
+from array import array
+from datetime import datetime, timedelta
+
+CLIMATOLOGY_YEARS = int(os.getenv('CLIMATOLOGY_YEARS', '5'))  # most recent complete years averaged into the normals
+CLIMATOLOGY_SMOOTHING_DAYS = 3  # normals average this many calendar days on either side, so single odd days don't stand out
+CLIMATOLOGY_RETRY = 60 * 60 * 24  # seconds before trying again to add a year the archive didn't fully have yet
+CALENDAR_DAYS = 366
+
+# "MM-DD" => slot on a leap year calendar, so Feb 29 has its own slot and every other date has the same slot every year
+DAY_SLOTS = {(datetime(2000, 1, 1) + timedelta(days=i)).strftime('%m-%d'): i for i in range(CALENDAR_DAYS)}
+
+
+def day_slot(date):
+    return DAY_SLOTS[date.strftime('%m-%d')]
+
+
+def climatology_years(now, years=None):
+    """
+    Returns:
+      the most recent complete years (oldest first) that the climatology should cover
+    """
+    years = years or CLIMATOLOGY_YEARS
+    return [str(year) for year in range(now.year - years, now.year)]
+
+
+class Climatology:
+    """
+    Normal daily high and low temperatures for one location, from the daily archive highs and lows of each
+    included year on a 366 day calendar. Years are kept separately, so a new year can be added and the oldest
+    dropped without downloading the others again, and the smoothed normals are precomputed so looking up a
+    date is a single array index.
+    """
+
+    def __init__(self, highs=None, lows=None, checked=0):
+        self.highs = dict(highs or {})  # year => array of the high for each calendar day (NaN if the year doesn't have it)
+        self.lows = dict(lows or {})
+        self.checked = checked  # when years were last added (or found to be incomplete)
+        self._compute_normals()
+
+    def missing_years(self, wanted):
+        return [year for year in wanted if year not in self.years]
+
+    def add_daily(self, daily, wanted=None):
+        """
+        Add a year of Open-Meteo archive daily data for each year in wanted (default: all) that isn't
+        already included and has a value for every day.
+
+        Returns:
+          list of the years added
+        """
+        by_year = {}
+        for time, high, low in zip(daily['time'], daily['temperature_2m_max'], daily['temperature_2m_min']):
+            year = time[:4]
+            if year in self.highs or (wanted is not None and year not in wanted):
+                continue
+            by_year.setdefault(year, []).append((DAY_SLOTS[time[5:10]], high, low))
+
+        added = []
+        for year, days in sorted(by_year.items()):
+            expected = 366 if int(year) % 4 == 0 and (int(year) % 100 != 0 or int(year) % 400 == 0) else 365
+            if len(days) < expected or any(high is None or low is None for _, high, low in days):
+                print(f"Archive data for {year} is incomplete, leaving it out of the climatology for now")
+                continue
+            highs = array('f', [math.nan] * CALENDAR_DAYS)
+            lows = array('f', [math.nan] * CALENDAR_DAYS)
+            for slot, high, low in days:
+                highs[slot] = high
+                lows[slot] = low
+            self.highs[year] = highs
+            self.lows[year] = lows
+            added.append(year)
+
+        self._compute_normals()
+        return added
+
+    def keep_latest(self, count):
+        """
+        Drop all but the most recent count years, so the normals average exactly that many once they're all added.
+
+        Returns:
+          list of the years dropped
+        """
+        dropped = self.years[:-count] if count > 0 else list(self.years)
+        for year in dropped:
+            del self.highs[year]
+            del self.lows[year]
+        if dropped:
+            self._compute_normals()
+        return dropped
+
+    def _compute_normals(self):
+        self.years = sorted(self.highs)
+        high_sum = [0.0] * CALENDAR_DAYS
+        low_sum = [0.0] * CALENDAR_DAYS
+        count = [0] * CALENDAR_DAYS
+        for year in self.years:
+            for slot, (high, low) in enumerate(zip(self.highs[year], self.lows[year])):
+                if high == high:  # not NaN
+                    high_sum[slot] += high
+                    low_sum[slot] += low
+                    count[slot] += 1
+
+        self.normal_high = array('f', [0.0] * CALENDAR_DAYS)
+        self.normal_low = array('f', [0.0] * CALENDAR_DAYS)
+        for slot in range(CALENDAR_DAYS):
+            high = low = 0.0
+            days = 0
+            for offset in range(-CLIMATOLOGY_SMOOTHING_DAYS, CLIMATOLOGY_SMOOTHING_DAYS + 1):
+                i = (slot + offset) % CALENDAR_DAYS
+                high += high_sum[i]
+                low += low_sum[i]
+                days += count[i]
+            if days:
+                self.normal_high[slot] = high / days
+                self.normal_low[slot] = low / days
+
+    def normals(self, date):
+        """
+        Returns:
+          (normal low, normal high) for the calendar day of date, or None if no years have been added
+        """
+        if not self.years:
+            return None
+        slot = day_slot(date)
+        return round(self.normal_low[slot]), round(self.normal_high[slot])
+
+    def to_record(self):
+        """Compact form for the cache store: each year's highs and then lows as base64 encoded binary arrays."""
+        return {
+            'years': self.years,
+            'checked': self.checked,
+            'data': base64.b64encode(b''.join(self.highs[year].tobytes() + self.lows[year].tobytes() for year in self.years)).decode()
+        }
+
+    @classmethod
+    def from_record(cls, record):
+        data = base64.b64decode(record['data'])
+        year_size = CALENDAR_DAYS * array('f').itemsize
+        if len(data) != len(record['years']) * year_size * 2:
+            # stored in the older format of running sums, which can't drop a year; build it again
+            return cls()
+        highs, lows = {}, {}
+        for i, year in enumerate(record['years']):
+            highs[year], lows[year] = array('f'), array('f')
+            highs[year].frombytes(data[i * year_size * 2:i * year_size * 2 + year_size])
+            lows[year].frombytes(data[i * year_size * 2 + year_size:(i + 1) * year_size * 2])
+        return cls(highs, lows, record.get('checked', 0))
@@ -0,0 +1,77 @@
+import math
+import os
+from decimal import Decimal
+
+COORD_GRID_DEG = float(os.getenv('COORD_GRID_DEG', '0.01'))  # cache keys snap coordinates to this grid (0.01 degrees is about 1 km)
+COORD_MATCH_RADIUS_KM = float(os.getenv('COORD_MATCH_RADIUS_KM', '2'))  # a cached location this close is used for a new one
+EARTH_RADIUS_KM = 6371.0
+
+
+def grid_decimals(grid=None):
+    grid = grid or COORD_GRID_DEG
+    return max(0, -Decimal(str(grid)).normalize().as_tuple().exponent)
+
+
+def snap(value, grid=None):
+    grid = grid or COORD_GRID_DEG
+    return round(round(value / grid) * grid, grid_decimals(grid))
+
+
+def coord_key(lat, lng, grid=None):
+    """
+    Returns:
+      the "lat_lng" cache key for a location, snapped to the grid and always written with the same
+      number of decimal places, so 38.89 and 38.8904 share a key
+    """
+    decimals = grid_decimals(grid)
+    return f"{snap(lat, grid):.{decimals}f}_{snap(lng, grid):.{decimals}f}"
+
+
+def parse_coord(key):
+    lat, lng = key.split('_')
+    return float(lat), float(lng)
+
+
+def distance_km(a, b):
+    """Great circle (haversine) distance between two (lat, lng) points."""
+    lat1, lng1 = math.radians(a[0]), math.radians(a[1])
+    lat2, lng2 = math.radians(b[0]), math.radians(b[1])
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(h))
+
+
+def nearest_coord(key, candidates, radius_km=None):
+    """
+    Find the cached location closest to key.
+
+    Args:
+      key: "lat_lng" key to look near
+      candidates: iterable of "lat_lng" keys that are cached
+      radius_km: only consider candidates this close (default COORD_MATCH_RADIUS_KM)
+
+    Returns:
+      the closest candidate key within the radius, or None
+    """
+    radius_km = COORD_MATCH_RADIUS_KM if radius_km is None else radius_km
+    if radius_km <= 0:
+        return None
+    target = parse_coord(key)
+    # a degree of latitude is ~111 km, skip the trigonometry for anything clearly out of range
+    max_lat_deg = radius_km / 111.0
+    max_lng_deg = max_lat_deg / max(math.cos(math.radians(target[0])), 0.01)
+
+    best = None
+    best_distance = radius_km
+    for candidate in candidates:
+        try:
+            point = parse_coord(candidate)
+        except ValueError:
+            continue
+        lng_diff = abs(point[1] - target[1])
+        lng_diff = min(lng_diff, 360 - lng_diff)
+        if abs(point[0] - target[0]) > max_lat_deg or lng_diff > max_lng_deg:
+            continue
+        distance = distance_km(target, point)
+        if distance <= best_distance:
+            best, best_distance = candidate, distance
+    return best
@@ -1,92 +1,175 @@
 
 print("\nStarting Pi-Forecaster...")
-print("  setting up LEDs...")
+from startupProfile import step, report as report_startup_profile
 
-import board
-from digitalio import DigitalInOut, Direction, Pull
-import adafruit_dotstar
+print("  setting up LEDs and button...")
+
+with step("import dotenv, hardware"):
+    from dotenv import load_dotenv
+    load_dotenv()  # before anything reads its settings, HARDWARE included
+    from hardware import get_hardware
 
 COLOR_OFF = (0, 0, 0, 0)
 COLOR_WAITING = (0, 1, 0, 0.05)
 COLOR_NOT_READY = (30, 0, 0, 0.1)
 COLOR_WORKING = (40, 15, 0, 0.2)
 COLOR_TALKING = (0, 0, 50, 0.3)
-DOTSTAR_DATA = board.D5
-DOTSTAR_CLOCK = board.D6
-DOTSTAR_COUNT = 3
-dots = adafruit_dotstar.DotStar(DOTSTAR_CLOCK, DOTSTAR_DATA, DOTSTAR_COUNT)
+with step("init hardware (board, digitalio, adafruit_dotstar)"):
+    hardware = get_hardware()
 
 def set_dot_color(color):
-    for i in range(DOTSTAR_COUNT):
-        dots[i] = color
+    hardware.set_leds(color)
 
 set_dot_color(COLOR_NOT_READY)
 
 print("  importing other libraries...")
 import time
 import os
-from getWeather import get_forecast_data
-import subprocess
-
+import threading
+with step("import getWeather (pytz, cache store)"):
+    from getWeather import get_forecast_data
+    from clients import warm_up
+    from cacheStore import CACHE_DIR
+    from metrics import observe, span
+    from resilience import PRESS_DEADLINE, deadline
+with step("import prefetch, playback, audioCache, buttonInput, voiceTrigger"):
+    from prefetch import PrefetchScheduler, PREFETCH_ENABLED
+    from playback import PLAYBACK_MODE
+    from audioCache import mark_played
+    from buttonInput import ButtonWatcher, ForecastWorker, press_day
+    from voiceTrigger import VOICE_TRIGGER, listen_for_voice
 
-print("  setting up button...")
-button = DigitalInOut(board.D17)
-button.direction = Direction.INPUT
-button.pull = Pull.UP
 
-CACHE_DIR = os.path.join(os.path.dirname(__file__), '.cache')
 PROBLEM_AUDIO_FILE = os.path.join(os.path.dirname(__file__), 'problem.wav')
 
+player = None
+if PLAYBACK_MODE == 'stream':
+    print("  opening audio output stream...")
+    with step("open pyaudio output stream"):
+        player = hardware.create_player()
+
+playback_cancelled = threading.Event()
+
 
 def start():
+    prefetcher = None
+    worker = None
+    stop_listening = threading.Event()
     try:
+        worker = ForecastWorker(handle_request, on_cancel=stop_playback)
+        worker.start()
+        hardware.start()
         set_dot_color(COLOR_WAITING)
         print("  setup complete.\n")
+        report_startup_profile()
+        # the button is live now, so load the heavy libraries and create the shared clients in the background
+        threading.Thread(target=warm_up_libraries, name='warm-up', daemon=True).start()
+        if PREFETCH_ENABLED:
+            prefetcher = PrefetchScheduler()
+            prefetcher.start()
         print("Waiting for button press...\n")
-        btn_prev_state = button.value
-        btn_down_ts = 0
-        while True:
-            btn_state = button.value
-            if btn_state != btn_prev_state:
-                if not btn_state:
-                    btn_down_ts = time.time()
-                else:
-                    ts_diff = time.time() - btn_down_ts
-                    print("  button held for " + str(ts_diff) + " seconds...")
-                    day = "today"
-                    if ts_diff > 1.5:
-                        day = "tomorrow"
-                    get_weather(day)
-                    set_dot_color(COLOR_WAITING)
-                    print("\nWaiting for button press...\n")
-            btn_prev_state = btn_state
+
+        def on_press(duration):
+            print("  button held for " + str(round(duration, 2)) + " seconds...")
+            result = worker.submit(press_day(duration))
+            if result != 'started':
+                print("  forecast request " + result + " while another is in progress")
+
+        if VOICE_TRIGGER:
+            # the microphone is ignored while a forecast is being retrieved or played, so it can't trigger itself
+            threading.Thread(target=listen_for_voice, args=(worker.submit, worker.is_busy, stop_listening), name='voice-trigger', daemon=True).start()
+
+        ButtonWatcher(hardware.button, on_press, clock=hardware.clock, sleep=hardware.sleep).run()
     finally:
         print("Shutting down forecaster...")
+        stop_listening.set()
+        if worker:
+            worker.stop()
+        if prefetcher:
+            prefetcher.stop()
+        stop_playback()
+        if player:
+            player.close()
         set_dot_color(COLOR_OFF)
 
 
+def warm_up_libraries():
+    start_ts = time.time()
+    try:
+        warm_up()
+        print("  libraries warmed up in " + str(round(time.time() - start_ts, 1)) + " seconds")
+    except Exception as e:
+        print("  ERROR warming up libraries: " + str(e))
+
+
+def handle_request(day):
+    get_weather(day)
+    set_dot_color(COLOR_WAITING)
+    print("\nWaiting for button press...\n")
+
+
+def stop_playback():
+    playback_cancelled.set()
+    hardware.stop_playback()
+    if player:
+        player.stop()
+
+
 def get_weather(day="today"):
+    with span('button_press', day=day):
+        play_forecast(day)
+
+
+def play_forecast(day):
     print("  retrieving weather forecast for " + day + "...")
+    pressed_at = time.perf_counter()
     set_dot_color(COLOR_WORKING)
+    playback_cancelled.clear()
+    if player:
+        player.reset()
+
+    streaming = { 'started': False }
+    def on_audio(chunk):
+        if not streaming['started']:
+            streaming['started'] = True
+            observe('press_to_audio', time.perf_counter() - pressed_at, streamed=True)
+            print("  streaming voice playback of new forecast...")
+            set_dot_color(COLOR_TALKING)
+        player.write(chunk)
 
     forecast_text = None
     audio_file = PROBLEM_AUDIO_FILE
+    audio_streamed = False
     try:
-        data = get_forecast_data({ 'date': day })
+        # Open-Meteo, Gemini, and the TTS model share one budget, so a hung upstream can't keep the LEDs on "working"
+        with deadline(PRESS_DEADLINE):
+            data = get_forecast_data({ 'date': day }, on_audio=on_audio if player else None)
         forecast_text = data['forecast']
         audio_file = os.path.join(CACHE_DIR, data['audioFile'])
+        audio_streamed = data['audioStreamed']
     except Exception as e:
         print("  ERROR retrieving forecast: " + str(e))
         audio_file = PROBLEM_AUDIO_FILE
 
-    print("  initiating voice playback of message...")
-    print("  " + forecast_text)
-    set_dot_color(COLOR_TALKING)
-    
-    subprocess.run(['aplay', audio_file])
-
+    if player:
+        player.finish()
+
+    if playback_cancelled.is_set():
+        print("  playback cancelled.")
+    elif not audio_streamed:
+        print("  initiating voice playback of message...")
+        set_dot_color(COLOR_TALKING)
+        mark_played(audio_file)
+        observe('press_to_audio', time.perf_counter() - pressed_at, streamed=False)
+        with span('playback'):
+            if player:
+                player.play_file(audio_file)
+            else:
+                hardware.play_file(audio_file)
+
+    print("  " + str(forecast_text))
     print("  complete.")
-    time.sleep(1)
+    hardware.sleep(1)
 
 
 ##########################
@@ -2,26 +2,46 @@ import json
 import os
 from datetime import datetime, timedelta
 from pytz import timezone
-from google import genai
-from google.genai import types
-import wave
-import requests
 import base64
 import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
 load_dotenv()
 
-CACHE_DIR = os.path.join(os.path.dirname(__file__), '.cache')
-WEATHER_FORECAST_CACHE = os.path.join(CACHE_DIR, 'weather_forecast.json')
-WEATHER_HISTORY_CACHE = os.path.join(CACHE_DIR, 'weather_historical.json')
+try:
+    from .cacheStore import FORECAST_MAX_STALE, get_cache_store, purge_cache
+    from .audioCache import clean_audio_cache
+    from .clients import genai_http_options, get_genai_client, http_get, load_genai
+    from .promptPayload import PAYLOAD_FORMATS, build_payload
+    from .tts import synthesize_cached
+    from .incrementalRefresh import INCREMENTAL_REFRESH, weather_fingerprint, unchanged_reason
+    from .singleFlight import SingleFlight
+    from .ruleForecast import generate_rule_forecast
+    from .climatology import CLIMATOLOGY_RETRY, CLIMATOLOGY_YEARS, Climatology, climatology_years
+    from .coordinates import coord_key, nearest_coord
+    from .metrics import count, get_counters, observe, span
+    from .hourlySeries import HourlySeries
+    from .resilience import UpstreamError, acquire_within_deadline, call_upstream, carry_deadline, wait_within_deadline
+except ImportError:
+    from cacheStore import FORECAST_MAX_STALE, get_cache_store, purge_cache
+    from audioCache import clean_audio_cache
+    from clients import genai_http_options, get_genai_client, http_get, load_genai
+    from promptPayload import PAYLOAD_FORMATS, build_payload
+    from tts import synthesize_cached
+    from incrementalRefresh import INCREMENTAL_REFRESH, weather_fingerprint, unchanged_reason
+    from singleFlight import SingleFlight
+    from ruleForecast import generate_rule_forecast
+    from climatology import CLIMATOLOGY_RETRY, CLIMATOLOGY_YEARS, Climatology, climatology_years
+    from coordinates import coord_key, nearest_coord
+    from metrics import count, get_counters, observe, span
+    from hourlySeries import HourlySeries
+    from resilience import UpstreamError, acquire_within_deadline, call_upstream, carry_deadline, wait_within_deadline
 
-with open(os.path.join(os.path.dirname(__file__), 'weather-codes.json')) as f:
-    WEATHER_CODES = json.load(f)
 with open(os.path.join(os.path.dirname(__file__), 'ai-forecast-instruction.txt')) as f:
     AI_FORECAST_INSTRUCTION = f.read()
-with open(os.path.join(os.path.dirname(__file__), 'ai-voice-instruction.txt')) as f:
-    AI_VOICE_INSTRUCTION = f.read()
 
 DEFAULT_OPTIONS = {
     'date': 'today',
@@ -34,89 +54,255 @@ DEFAULT_OPTIONS = {
     'low_temp_break': 30,
     'wind_speed_unit': 'mph',
     'temperature_unit': 'fahrenheit',
-    'precipitation_unit': 'inch'
+    'precipitation_unit': 'inch',
+    'payload_format': 'verbose',
+    'engine': os.getenv('FORECAST_ENGINE', 'gemini').lower()
 }
+FORECAST_ENGINES = ['gemini', 'rules']
+# options other than the date and location that change the forecast text; cached forecasts for other values of
+# these are kept under a separate key, while ones with these values keep the plain "lat_lng" key
+VARIANT_DEFAULTS = {'temperature_unit': 'fahrenheit', 'wind_speed_unit': 'mph', 'precipitation_unit': 'inch', 'payload_format': 'verbose', 'engine': 'gemini'}
+RULE_OPTIONS = ['humidity_break', 'wind_break', 'high_temp_break', 'low_temp_break']  # only change the text of rule-based forecasts
 
 FORECAST_TTL = 60 * 60 * 2  # 2 hour timeout in milliseconds
+FALLBACK_FORECAST_TTL = int(os.getenv('FALLBACK_FORECAST_TTL_MINUTES', '15')) * 60  # retry Gemini sooner after falling back to the rules
+HOURLY_DATA_TTL = int(os.getenv('HOURLY_DATA_TTL_MINUTES', '15')) * 60
+HOURLY_DATA_CACHE = {}  # (lat, lng, timezone, units...) => { 'exp': timestamp, 'hourly': HourlySeries }
+HOURLY_DATA_LOCK = threading.Lock()  # only held to read or update HOURLY_DATA_CACHE, never while downloading
+HOURLY_DATA_FETCHES = SingleFlight()  # one download per key at a time, shared by everyone asking for it
+CLIMATOLOGY_CACHE = {}  # (coord, temperature unit) => Climatology, loaded from the cache store on first use
+CLIMATOLOGY_CACHE_SIZE = 32  # locations kept in memory, least recently used are dropped (they're still in the cache store)
+CLIMATOLOGY_LOCK = threading.Lock()
+CLIMATOLOGY_UPDATES = SingleFlight()  # one archive download per location and unit at a time
+GENERATION_LOCKS = {}  # (date, forecast cache key) => lock, button presses, the prefetch scheduler, and batches share the forecast cache
+GENERATION_LOCKS_LOCK = threading.Lock()
+OPEN_METEO_FORECAST_URL = os.getenv('OPEN_METEO_FORECAST_URL', 'https://api.open-meteo.com/v1/forecast')
+OPEN_METEO_ARCHIVE_URL = os.getenv('OPEN_METEO_ARCHIVE_URL', 'https://archive-api.open-meteo.com/v1/archive')
+BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', '3'))  # forecasts generated at once by get_forecast_data_batch()
+# two fetches for each forecast that can be generated at once (the server's, a batch's, a prefetch, and a button
+# press), so no caller waits in the queue behind another's fetches; threads are only started as they're needed
+FETCH_POOL = ThreadPoolExecutor(max_workers=2 * (int(os.getenv('SERVER_MAX_FORECASTS', '2')) + BATCH_CONCURRENCY + 2), thread_name_prefix='weather-fetch')
+STALE_WHILE_REVALIDATE = os.getenv('STALE_WHILE_REVALIDATE', '1') == '1'
+BACKGROUND_REFRESHES = SingleFlight()
 DAYS = ['sunday', 'monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday']
-FIELD_MAP = {
-    'time': 'time',
-    'temperature_2m': 'actual temperature',
-    'apparent_temperature': 'feels like temperature',
-    'precipitation_probability': 'probability of precipitation',
-    'precipitation': 'precipitation amount',
-    'uv_index': 'UV index',
-    'cloud_cover': 'cloud cover percent',
-    'relative_humidity_2m': 'relative humidity percent',
-    'wind_speed_10m': 'wind speed',
-    'wind_gusts_10m': 'wind gust speed',
-    'wind_direction_10m': 'wind direction degrees'
-}
 
 
-def get_forecast_data(input_options: dict = None):
+def get_forecast_data(input_options: dict = None, refresh: bool = False, on_audio=None):
     """
     Call this function from other modules.
 
     Args:
       input_options: dict with any keys from DEFAULT_OPTIONS. Any omitted keys will use default value.
+      refresh: when True, ignore any unexpired cached forecast and generate a new one.
+      on_audio: optional callable given each chunk of raw PCM audio as it streams from the TTS model.
+        Only called when a new forecast is generated; cached forecasts must be played from 'audioFile'.
 
     Returns:
-      dict with keys: 'forecast', 'forecastDate', and the input options.
+      dict with keys: 'forecast', 'forecastDate', 'audioFile', 'audioStreamed', 'cacheStatus', and the input options.
+      'cacheStatus' is 'hit', 'stale' (an expired forecast within FORECAST_MAX_STALE that is being
+      refreshed in the background, or an older one played because a new one couldn't be generated), or 'miss'.
 
     Raises:
       ValueError on user input issues.
-      IOError on external API errors.
+      IOError on external API errors. The normal temperatures and forecast data are fetched concurrently;
+        a failure of the forecast data request is raised, while a failure of the historical data
+        request only means the forecast is generated without the normal temperatures. When called
+        under a resilience.deadline(), the upstream calls share its budget and DeadlineExceeded (an
+        IOError) is raised once it runs out.
     """
+    with span('forecast_data', refresh=refresh):
+        return find_or_generate_forecast(input_options, refresh, on_audio)
+
+
+def find_or_generate_forecast(input_options, refresh, on_audio):
     options = parse_input_and_validate(input_options or {})
     forecast_simple_date = options['forecastDate'].strftime('%Y-%m-%d')
 
-    forecast = get_cached_forecast(options)
+    forecast = None
+    if not refresh:
+        with span('cache_lookup'):
+            forecast = get_cached_forecast(options, allow_stale=STALE_WHILE_REVALIDATE)
     if forecast:
-        print(f"Using cached forecast for {options['lat']}, {options['lng']} on {options['forecastDate']}")
+        if forecast['stale']:
+            print(f"Using stale cached forecast for {options['lat']}, {options['lng']} on {options['forecastDate']} and refreshing it in the background {count_forecast_cache('stale_hits')}")
+            refresh_key = (forecast_simple_date, forecast_cache_key(options))
+            BACKGROUND_REFRESHES.start(refresh_key, lambda: get_forecast_data(input_options, refresh=True), name='forecast-refresh')
+        else:
+            print(f"Using cached forecast for {options['lat']}, {options['lng']} on {options['forecastDate']} {count_forecast_cache('hits')}")
         return {
             'forecast': forecast['text'],
             'audioFile': forecast['audio_file'],
+            'audioStreamed': False,
+            'cacheStatus': 'stale' if forecast['stale'] else 'hit',
             'forecastDate': forecast_simple_date,
             'weatherData': None,
             'options': {k: v for k, v in options.items() if k not in ['forecastDate', 'now']}
         }
-    
-    forecast = f"Unable to retrieve forecast for {options['date']}"
 
-    historical_data = get_historical_data(options)
+    if not refresh:
+        print(f"No cached forecast for {options['lat']}, {options['lng']} on {options['forecastDate']} {count_forecast_cache('misses')}")
+
+    try:
+        return generate_forecast(options, refresh, on_audio)
+    except IOError as e:
+        # an upstream is down or the deadline ran out; an expired forecast is better than none
+        entry = None if refresh else find_cached_forecast(forecast_simple_date, forecast_cache_key(options))
+        if not entry or not os.path.exists(entry['wav']):
+            raise
+        print(f"Unable to generate a new forecast ({e}), using the cached forecast that expired {datetime.fromtimestamp(entry['exp'])} {count_forecast_cache('fallbacks')}")
+        return {
+            'forecast': entry['txt'],
+            'audioFile': entry['wav'],
+            'audioStreamed': False,
+            'cacheStatus': 'stale',
+            'forecastDate': forecast_simple_date,
+            'weatherData': None,
+            'options': {k: v for k, v in options.items() if k not in ['forecastDate', 'now']}
+        }
 
-    weather_data = get_weather_data(options)
-    weather_data['current date and time'] = options['now'].strftime('%B %d, %Y %H:%M')
-    weather_data['previous year weekly averages'] = historical_data
 
-    forecast = get_forecast(options, weather_data)
+def generate_forecast(options, refresh, on_audio):
+    forecast_simple_date = options['forecastDate'].strftime('%Y-%m-%d')
+    lock = get_generation_lock(forecast_simple_date, forecast_cache_key(options))
+    lock_requested = time.perf_counter()
+    acquire_within_deadline(lock, 'another request for this forecast')
+    try:
+        observe('generation_lock_wait', time.perf_counter() - lock_requested)
+        # another thread may have generated this forecast while we were waiting on the lock
+        requested_at = int(options['now'].timestamp())
+        forecast = get_cached_forecast(options)
+        if forecast and (not refresh or forecast['exp'] - FORECAST_TTL >= requested_at):
+            print(f"Using forecast generated while waiting for {options['lat']}, {options['lng']} on {options['forecastDate']}")
+            return {
+                'forecast': forecast['text'],
+                'audioFile': forecast['audio_file'],
+                'audioStreamed': False,
+                'cacheStatus': 'miss',
+                'forecastDate': forecast_simple_date,
+                'weatherData': None,
+                'options': {k: v for k, v in options.items() if k not in ['forecastDate', 'now']}
+            }
+
+        with span('upstream_fetch'):
+            normals, weather_data = fetch_upstream_data(options)
+        weather_data['current date and time'] = options['now'].strftime('%B %d, %Y %H:%M')
+        if normals:
+            weather_data['normal temperatures'] = normals
+
+        prompt = f"{forecast_scope(options)},{options['engine']},{options['payload_format']}"
+        fingerprint = weather_fingerprint(weather_data, int(datetime.now().timestamp()), prompt)
+        forecast = None
+        if INCREMENTAL_REFRESH:
+            forecast = extend_unchanged_forecast(options, fingerprint)
+        if not forecast:
+            forecast = get_forecast(options, weather_data, on_audio, fingerprint)
+    finally:
+        lock.release()
 
     return {
         'forecast': forecast['text'],
         'audioFile': forecast['audio_file'],
+        'audioStreamed': forecast['streamed'],
+        'cacheStatus': 'miss',
         'forecastDate': forecast_simple_date,
         'weatherData': weather_data,
         'options': {k: v for k, v in options.items() if k not in ['forecastDate', 'now']}
     }
 
 
-def ensure_cache_dir():
-    os.makedirs(CACHE_DIR, exist_ok=True)
+def get_forecast_data_batch(locations: list, refresh: bool = False):
+    """
+    Get forecasts for several locations at once. The hourly forecast data and the climatology for all
+    locations that need them are each fetched in one Open-Meteo request (one per set of units), then the
+    forecasts are looked up or generated concurrently, BATCH_CONCURRENCY at a time.
 
+    Args:
+      locations: list of dicts with any keys from DEFAULT_OPTIONS, e.g. [{'lat': 38.89, 'lng': -77.04}, ...]
+      refresh: when True, ignore any unexpired cached forecasts and generate new ones.
 
-def load_cache(cache_file):
-    ensure_cache_dir()
-    if os.path.exists(cache_file):
-        with open(cache_file, 'r') as f:
-            return json.load(f)
-    return {}
+    Returns:
+      list with the get_forecast_data() result for each location, in the same order, or a dict with
+      the 'error' message and 'options' for a location whose forecast failed
 
+    Raises:
+      ValueError if any location has invalid inputs (before anything is fetched).
+    """
+    all_options = [parse_input_and_validate(location or {}) for location in locations]
+    needed = [options for options in all_options if refresh or not get_cached_forecast(options)]
+
+    if needed:
+        try:
+            prefetch_hourly_data(needed)
+        except IOError as e:
+            print(f"Batched hourly data request failed, each location will be fetched separately: {e}")
+        try:
+            update_climatologies(needed)
+        except (IOError, KeyError, IndexError) as e:
+            print(f"Batched historical data request failed, each location will be fetched separately: {e}")
+
+    def get_one(location):
+        try:
+            return get_forecast_data(location, refresh=refresh)
+        except Exception as e:
+            print(f"Unable to get forecast for {location}: {e}")
+            return {'error': str(e), 'options': location}
 
-def save_cache(cache_file, data):
-    ensure_cache_dir()
-    with open(cache_file, 'w') as f:
-        json.dump(data, f)
+    with ThreadPoolExecutor(max_workers=BATCH_CONCURRENCY, thread_name_prefix='forecast-batch') as pool:
+        return list(pool.map(get_one, locations))
+
+
+def prefetch_hourly_data(all_options):
+    """Fill HOURLY_DATA_CACHE for every location that isn't already cached, with one request per set of units."""
+    now_ts = int(datetime.now().timestamp())
+    missing = {}
+    for options in all_options:
+        key = hourly_data_key(options)
+        cached = get_cached_hourly_data(key)
+        if not cached or cached['exp'] < now_ts:
+            missing.setdefault(key, options)
+
+    groups = {}
+    for key, options in missing.items():
+        groups.setdefault(key[2:], []).append((key, options))
+
+    for group in groups.values():
+        coords = ', '.join(options['coord'] for _, options in group)
+        print(f"Retrieving hourly weather data for {len(group)} locations: {coords}")
+        hourlies = fetch_hourly_data([options for _, options in group])
+        with HOURLY_DATA_LOCK:
+            for (key, _), hourly in zip(group, hourlies):
+                HOURLY_DATA_CACHE[key] = {'exp': now_ts + HOURLY_DATA_TTL, 'hourly': hourly}
+
+
+def get_generation_lock(date, key):
+    """Only one thread generates the forecast for a date and location at a time; different ones can run in parallel."""
+    with GENERATION_LOCKS_LOCK:
+        return GENERATION_LOCKS.setdefault((date, key), threading.Lock())
+
+
+def fetch_upstream_data(options):
+    """
+    Fetch the normal temperatures and forecast weather data at the same time.
+
+    Returns:
+      (normals, weather_data) tuple; normals is None if they could not be retrieved.
+
+    Raises:
+      IOError if the forecast data could not be retrieved (in time, under a deadline). We don't wait
+      on the historical request in that case; it finishes (and caches its result) in the background.
+    """
+    normals_future = FETCH_POOL.submit(carry_deadline(get_normal_temperatures), options)
+    weather_future = FETCH_POOL.submit(carry_deadline(get_weather_data), options)
+
+    weather_data = wait_within_deadline(weather_future, 'the hourly weather data')
+
+    normals = None
+    try:
+        normals = wait_within_deadline(normals_future, 'the normal temperatures')
+    except (IOError, KeyError, IndexError) as e:
+        print(f"Continuing without normal temperatures: {e}")
+
+    return normals, weather_data
 
 
 def parse_input_and_validate(input_dict: dict):
@@ -139,6 +325,12 @@ def parse_input_and_validate(input_dict: dict):
        options['lat'] < -90 or options['lat'] > 90 or options['lng'] < -180 or options['lng'] > 180:
         raise ValueError(f"Invalid lat, lng inputs: {options['lat']}, {options['lng']}")
 
+    if options['payload_format'] not in PAYLOAD_FORMATS:
+        raise ValueError(f"Invalid payload format: {options['payload_format']}")
+
+    if options['engine'] not in FORECAST_ENGINES:
+        raise ValueError(f"Invalid forecast engine: {options['engine']}")
+
     tz = timezone(options['timezone'])
     now = datetime.now(tz)
     forecast_date = now
@@ -162,208 +354,503 @@ def parse_input_and_validate(input_dict: dict):
     elif date_str != 'today':
         raise ValueError(f"Invalid date input for forecast: {date_str}")
 
-    return {**options, 'forecastDate': forecast_date, 'now': now}
+    return {**options, 'coord': coord_key(options['lat'], options['lng']), 'forecastDate': forecast_date, 'now': now}
+
+
+def count_forecast_cache(result):
+    """
+    Returns:
+      the updated counts formatted for logging
+    """
+    count(f"forecast_cache_{result}")
+    stats = get_forecast_cache_stats()
+    return f"(forecast cache hits: {stats['hits']}, stale hits: {stats['stale_hits']}, misses: {stats['misses']}, fallbacks: {stats['fallbacks']})"
 
 
-def get_cached_forecast(options):
-    forecast_cache = load_cache(WEATHER_FORECAST_CACHE)
-    today = options['now'].strftime('%Y-%m-%d')
+def get_forecast_cache_stats():
+    counters = get_counters('forecast_cache_')
+    return {result: counters.get(f"forecast_cache_{result}", 0) for result in ['hits', 'stale_hits', 'misses', 'fallbacks']}
+
+
+def get_cached_forecast(options, allow_stale=False):
+    """
+    Returns:
+      dict with the forecast 'text', 'audio_file', 'exp', and whether it is 'stale', or None if there is no
+      unexpired forecast (or, with allow_stale, none that expired less than FORECAST_MAX_STALE seconds ago)
+    """
     forecast_simple_date = options['forecastDate'].strftime('%Y-%m-%d')
+    now_ts = int(datetime.now().timestamp())
 
     forecast = None
 
-    if forecast_simple_date in forecast_cache:
-        coord = f"{options['lat']}_{options['lng']}"
-        if (
-            coord in forecast_cache[forecast_simple_date] and 
-            int(datetime.now().timestamp()) <= forecast_cache[forecast_simple_date][coord]['exp']
-            ):
-            forecast = {
-                'text': forecast_cache[forecast_simple_date][coord]['txt'],
-                'audio_file': forecast_cache[forecast_simple_date][coord]['wav']
-            }
+    entry = find_cached_forecast(forecast_simple_date, forecast_cache_key(options))
+    if entry and now_ts <= entry['exp']:
+        forecast = {
+            'text': entry['txt'],
+            'audio_file': entry['wav'],
+            'exp': entry['exp'],
+            'stale': False
+        }
+    elif entry and allow_stale and now_ts <= entry['exp'] + FORECAST_MAX_STALE and os.path.exists(entry['wav']):
+        forecast = {
+            'text': entry['txt'],
+            'audio_file': entry['wav'],
+            'exp': entry['exp'],
+            'stale': True
+        }
 
     return forecast
 
 
-def get_historical_data(options):
-    historical_cache = load_cache(WEATHER_HISTORY_CACHE)
-    last_year = str(int(options['forecastDate'].strftime('%Y')) - 1)
-    forecast_week = int(options['forecastDate'].strftime('%W')) - 1  # zero-based weeks in cache
-    coord = f"{options['lat']}_{options['lng']}"
+def forecast_cache_key(options):
+    """
+    Returns:
+      the key forecasts for these options are cached under: the "lat_lng" coord, followed by "|" and the
+      VARIANT_DEFAULTS options (and for the rules engine, the RULE_OPTIONS) when any of them aren't the default
+    """
+    variant = [options[name] for name in VARIANT_DEFAULTS]
+    if options['engine'] == 'rules':
+        variant += [f"{options[name]:g}" for name in RULE_OPTIONS]
+    if variant == list(VARIANT_DEFAULTS.values()):
+        return options['coord']
+    return f"{options['coord']}|{','.join(variant)}"
 
-    if last_year in historical_cache and coord in historical_cache[last_year]:
-        print(f"Using cached historical data for {last_year} at {coord}")
-        return {
-            'average low temperature': historical_cache[last_year][coord][forecast_week][0],
-            'average high temperature': historical_cache[last_year][coord][forecast_week][1]
-        }
 
-    print(f"Retrieving historical weather data for {last_year} at {coord}")
-    url = 'https://archive-api.open-meteo.com/v1/archive?' + '&'.join([
-        'daily=temperature_2m_max,temperature_2m_min,precipitation_sum',
-        f"latitude={options['lat']}",
-        f"longitude={options['lng']}",
-        f"start_date={last_year}-01-01",
+def find_cached_forecast(date, key):
+    """
+    Returns:
+      the cache store entry for the forecast cached under key (see forecast_cache_key()) on date, or for the
+      same options at the nearest location within COORD_MATCH_RADIUS_KM if that location has none, or None
+    """
+    store = get_cache_store()
+    entry = store.get_forecast(date, key)
+    if entry:
+        return entry
+    coord, separator, variant = key.partition('|')
+    candidates = [cached.partition('|')[0] for cached in store.forecast_coords(date) if cached.partition('|')[2] == variant]
+    nearby = nearest_coord(coord, candidates)
+    if nearby:
+        print(f"Using cached forecast for nearby location {nearby} for {coord}")
+        return store.get_forecast(date, nearby + separator + variant)
+    return None
+
+
+def extend_unchanged_forecast(options, fingerprint):
+    """
+    If the weather data hasn't materially changed since the cached forecast (even an expired one) was
+    generated, extend its expiration instead of generating the text and audio again.
+
+    Returns:
+      the cached forecast in the same form as get_forecast(), or None if it needs to be regenerated
+    """
+    store = get_cache_store()
+    forecast_simple_date = options['forecastDate'].strftime('%Y-%m-%d')
+    key = forecast_cache_key(options)
+    now_ts = int(datetime.now().timestamp())
+
+    entry = store.get_forecast(forecast_simple_date, key)
+    if not entry or not os.path.exists(entry['wav']):
+        return None
+    reason = unchanged_reason(entry.get('fp'), fingerprint, now_ts)
+    if not reason:
+        return None
+
+    print(f"Weather data for {options['coord']} on {forecast_simple_date} hasn't materially changed ({reason}), extending cached forecast")
+    store.put_forecast(forecast_simple_date, key, {**entry, 'exp': now_ts + FORECAST_TTL})
+    return { 'text': entry['txt'], 'audio_file': entry['wav'], 'streamed': False }
+
+
+def get_normal_temperatures(options):
+    """
+    Returns:
+      dict with the normal low and high temperatures for the forecast date, averaged over the last
+      CLIMATOLOGY_YEARS years, or None if there is no historical data for the location
+    """
+    key = climatology_key(options)
+    climatology = get_climatology(options)
+    if climatology.missing_years(climatology_years(options['now'])):
+        # concurrent requests for a new location share one download; a later one finds the years already added
+        climatology = CLIMATOLOGY_UPDATES.do(key, lambda: update_climatologies([options])[key])[0]
+
+    normals = climatology.normals(options['forecastDate'])
+    if not normals:
+        return None
+    return {
+        'normal low temperature': normals[0],
+        'normal high temperature': normals[1],
+        'years averaged': len(climatology.years)
+    }
+
+
+def climatology_key(options):
+    return options['coord'], options['temperature_unit']
+
+
+def get_climatology(options):
+    """Returns the Climatology for the location and temperature unit (empty if nothing is stored yet)."""
+    key = climatology_key(options)
+    with CLIMATOLOGY_LOCK:
+        climatology = CLIMATOLOGY_CACHE.pop(key, None)
+        if climatology is None:
+            store = get_cache_store()
+            record = store.get_climatology(*key)
+            if not record:
+                nearby = nearest_coord(key[0], store.climatology_coords(key[1]))
+                if nearby:
+                    print(f"Using climatology for nearby location {nearby} for {key[0]}")
+                    record = store.get_climatology(nearby, key[1])
+            climatology = Climatology.from_record(record) if record else Climatology()
+        remember_climatology(key, climatology)
+        return climatology
+
+
+def remember_climatology(key, climatology):
+    """Keep the climatology as the most recently used one in CLIMATOLOGY_CACHE; call with CLIMATOLOGY_LOCK held."""
+    CLIMATOLOGY_CACHE.pop(key, None)
+    CLIMATOLOGY_CACHE[key] = climatology
+    while len(CLIMATOLOGY_CACHE) > CLIMATOLOGY_CACHE_SIZE:
+        del CLIMATOLOGY_CACHE[next(iter(CLIMATOLOGY_CACHE))]
+
+
+def update_climatologies(all_options):
+    """
+    Add any years missing from the climatology of each location, downloading the archive data for
+    all of them in one request per temperature unit, and drop the oldest years beyond CLIMATOLOGY_YEARS.
+    Years already in a climatology aren't downloaded again, and a location is only retried once every
+    CLIMATOLOGY_RETRY seconds if the archive didn't have a complete year yet.
+
+    Returns:
+      dict of (coord, temperature unit) => Climatology for every location given
+
+    Raises:
+      IOError if the archive request fails
+    """
+    now_ts = int(datetime.now().timestamp())
+    climatologies = {}
+    groups = {}
+    for options in all_options:
+        key = climatology_key(options)
+        climatology = get_climatology(options)
+        wanted = climatology_years(options['now'])
+        climatologies[key] = climatology
+        missing = climatology.missing_years(wanted)
+        if missing and now_ts - climatology.checked > CLIMATOLOGY_RETRY:
+            groups.setdefault(options['temperature_unit'], {})[key] = (options, missing)
+
+    for group in groups.values():
+        all_missing = sorted(year for _, missing in group.values() for year in missing)
+        coords = ', '.join(coord for coord, _ in group.keys())
+        print(f"Retrieving historical weather data for {all_missing[0]} to {all_missing[-1]} at {coords}")
+        dailies = fetch_historical_daily([options for options, _ in group.values()], all_missing[0], all_missing[-1])
+        for (key, (_, missing)), daily in zip(group.items(), dailies):
+            # update a copy so other threads never look up normals from half-added years
+            current = climatologies[key]
+            climatology = Climatology(current.highs, current.lows, current.checked)
+            added = climatology.add_daily(daily, missing)
+            # years before the wanted ones are kept until the newer ones are complete in the archive
+            dropped = climatology.keep_latest(CLIMATOLOGY_YEARS)
+            climatology.checked = now_ts
+            print(f"Caching climatology for {key[0]} covering {', '.join(climatology.years) or 'no years'} (added {len(added)}, dropped {len(dropped)})")
+            get_cache_store().put_climatology(*key, climatology.to_record())
+            with CLIMATOLOGY_LOCK:
+                remember_climatology(key, climatology)
+            climatologies[key] = climatology
+
+    return climatologies
+
+
+def fetch_historical_daily(locations, first_year, last_year):
+    """
+    Download daily archive data for whole years for one or more locations in a single request.
+
+    Args:
+      locations: list of validated options that all use the same temperature unit
+
+    Returns:
+      list of Open-Meteo daily data dicts, in the same order as locations
+
+    Raises:
+      IOError if the request fails
+    """
+    url = OPEN_METEO_ARCHIVE_URL + '?' + '&'.join([
+        'daily=temperature_2m_max,temperature_2m_min',
+        f"latitude={','.join(str(options['lat']) for options in locations)}",
+        f"longitude={','.join(str(options['lng']) for options in locations)}",
+        f"start_date={first_year}-01-01",
         f"end_date={last_year}-12-31",
         'timezone=auto',
-        f"temperature_unit={options['temperature_unit']}",
-        f"precipitation_unit={options['precipitation_unit']}"
+        f"temperature_unit={locations[0]['temperature_unit']}"
     ])
 
-    resp = requests.get(url)
-    if resp.status_code > 299:
-        raise IOError(f"Unable to get historical weather data ({resp.status_code}): {resp.text}")
-
-    historical_data = resp.json()
-
-    if last_year not in historical_cache:
-        historical_cache[last_year] = {}
-    historical_cache[last_year][coord] = []
-
-    day_count = 0
-    week_high_total = 0
-    week_low_total = 0
-    for i in range(len(historical_data['daily']['time'])):
-        week_high_total += historical_data['daily']['temperature_2m_max'][i]
-        week_low_total += historical_data['daily']['temperature_2m_min'][i]
-        day_count += 1
-        if day_count > 6:
-            historical_cache[last_year][coord].append([
-                round(week_low_total / 7),
-                round(week_high_total / 7),
-            ])
-            day_count = 0
-            week_high_total = 0
-            week_low_total = 0
-
-    print(f"Caching historical data for {last_year} at {coord}")
-    save_cache(WEATHER_HISTORY_CACHE, historical_cache)
+    resp = open_meteo_get('open_meteo_archive', 'archive', url, 'historical weather data', len(locations))
 
-    return {
-        'average low temperature': historical_cache[last_year][coord][forecast_week][0],
-        'average high temperature': historical_cache[last_year][coord][forecast_week][1]
-    }
+    count('open_meteo_archive_bytes', len(resp.content))
+    with span('open_meteo_archive_parse'):
+        body = resp.json()
+    return [entry['daily'] for entry in (body if isinstance(body, list) else [body])]
 
 
-def get_weather_data(options):
-    prev_date = (options['forecastDate'] - timedelta(days=1)).strftime('%Y-%m-%d')
-    next_date = (options['forecastDate'] + timedelta(days=1)).strftime('%Y-%m-%d')
+def open_meteo_get(upstream, session, url, description, locations):
+    """
+    GET an Open-Meteo URL through the upstream's circuit breaker, retrying transient failures.
+
+    Raises:
+      IOError if the request fails, the circuit is open, or the deadline runs out
+    """
+    def attempt(timeout):
+        with span(upstream, locations=locations):
+            try:
+                resp = http_get(session, url, timeout)
+            except IOError as e:
+                raise IOError(f"Unable to get {description}: {e}")
+        if resp.status_code > 299:
+            raise UpstreamError(f"Unable to get {description} ({resp.status_code}): {resp.text}", resp.status_code)
+        return resp
+
+    return call_upstream(upstream, attempt)
+
+
+def get_hourly_data(options, refresh=False):
+    """
+    Retrieve the raw hourly forecast data for the full window that parse_input_and_validate() allows
+    (the day before today through the day after today + 6), sharing one download per location and units.
+
+    Returns:
+      HourlySeries of the whole window; the expired download if a new one can't be fetched
+    """
+    key = hourly_data_key(options)
+    cached = get_cached_hourly_data(key)
+    if cached and not refresh and cached['exp'] >= int(datetime.now().timestamp()):
+        print(f"Using cached hourly data for {options['lat']}, {options['lng']}")
+        return cached['hourly']
+
+    def fetch():
+        # another caller may have finished downloading this while we were looking at the cache
+        latest = get_cached_hourly_data(key)
+        if latest and latest is not cached and latest['exp'] >= int(datetime.now().timestamp()):
+            return latest['hourly']
+
+        print(f"Retrieving hourly weather data for {options['lat']}, {options['lng']}")
+        try:
+            hourly = fetch_hourly_data([options])[0]
+        except IOError as e:
+            if not latest:
+                raise
+            # find_hourly_window() decides whether it still covers the forecast date
+            print(f"Using expired hourly data for {options['lat']}, {options['lng']}: {e}")
+            return latest['hourly']
+        with HOURLY_DATA_LOCK:
+            HOURLY_DATA_CACHE[key] = {'exp': int(datetime.now().timestamp()) + HOURLY_DATA_TTL, 'hourly': hourly}
+        return hourly
+
+    return HOURLY_DATA_FETCHES.do(key, fetch)[0]
+
+
+def get_cached_hourly_data(key):
+    with HOURLY_DATA_LOCK:
+        return HOURLY_DATA_CACHE.get(key)
+
+
+def prune_memory_caches():
+    """
+    Drop the in-memory state that is no longer useful, so a long running forecaster asked about many
+    locations doesn't keep growing: hourly data that expired over FORECAST_MAX_STALE seconds ago (it is
+    only kept as a fallback for when a new download fails), and the generation locks of past dates.
+    """
+    now = datetime.now()
+    now_ts = int(now.timestamp())
+    with HOURLY_DATA_LOCK:
+        for key in [key for key, cached in HOURLY_DATA_CACHE.items() if cached['exp'] + FORECAST_MAX_STALE < now_ts]:
+            del HOURLY_DATA_CACHE[key]
+
+    # local dates differ by up to 26 hours between timezones, so dates before the day before yesterday here are
+    # in the past everywhere and no one can ask for a forecast for them anymore
+    oldest = (now - timedelta(days=2)).strftime('%Y-%m-%d')
+    with GENERATION_LOCKS_LOCK:
+        for key in [key for key, lock in GENERATION_LOCKS.items() if key[0] < oldest and not lock.locked()]:
+            del GENERATION_LOCKS[key]
+
+
+def hourly_data_key(options):
+    return (
+        options['coord'], options['timezone'],
+        options['wind_speed_unit'], options['temperature_unit'], options['precipitation_unit']
+    )
+
+
+def fetch_hourly_data(locations):
+    """
+    Download the hourly forecast data for one or more locations in a single request. Open-Meteo takes
+    comma separated coordinates (and timezones), but only one set of units per request.
+
+    Args:
+      locations: list of validated options that all use the same units
+
+    Returns:
+      list of HourlySeries, in the same order as locations
 
-    url = 'https://api.open-meteo.com/v1/forecast?' + '&'.join([
+    Raises:
+      IOError if the request fails
+    """
+    start_date = min(options['now'] - timedelta(days=1) for options in locations).strftime('%Y-%m-%d')
+    end_date = max(options['now'] + timedelta(days=7) for options in locations).strftime('%Y-%m-%d')
+    first = locations[0]
+
+    url = OPEN_METEO_FORECAST_URL + '?' + '&'.join([
         'hourly=temperature_2m,apparent_temperature,precipitation_probability,precipitation,uv_index,cloud_cover,relative_humidity_2m,wind_speed_10m,wind_direction_10m,wind_gusts_10m,weather_code',
         # we don't use "current" or "daily" data right now, but we could in the future
         # 'current=temperature_2m,apparent_temperature,precipitation_probability,precipitation,weather_code,cloud_cover,wind_speed_10m,wind_direction_10m',
         # 'daily=sunset,sunrise,temperature_2m_max,precipitation_sum,winddirection_10m_dominant',
-        f"latitude={options['lat']}",
-        f"longitude={options['lng']}",
-        f"start_date={prev_date}",
-        f"end_date={next_date}",
-        f"timezone={options['timezone']}",
-        f"wind_speed_unit={options['wind_speed_unit']}",
-        f"temperature_unit={options['temperature_unit']}",
-        f"precipitation_unit={options['precipitation_unit']}"
+        f"latitude={','.join(str(options['lat']) for options in locations)}",
+        f"longitude={','.join(str(options['lng']) for options in locations)}",
+        f"start_date={start_date}",
+        f"end_date={end_date}",
+        f"timezone={','.join(options['timezone'] for options in locations)}",
+        f"wind_speed_unit={first['wind_speed_unit']}",
+        f"temperature_unit={first['temperature_unit']}",
+        f"precipitation_unit={first['precipitation_unit']}"
     ])
 
-    resp = requests.get(url)
-    if resp.status_code > 299:
-        raise IOError(f"Unable to get weather forecast data ({resp.status_code}): {resp.text}")
-
-    raw_data = resp.json()
-    weather_data = {'previous day': [], 'forecast day': [], 'following day': []}
-    elements = [key for key in raw_data['hourly'].keys() if key in FIELD_MAP]
-
-    for i in range(len(raw_data['hourly']['time'])):
-        day = 'previous day'
-        if i > 23:
-            day = 'forecast day'
-        if i > 47:
-            day = 'following day'
-
-        hourly_data = {}
-        for e in elements:
-            hourly_data[FIELD_MAP[e]] = raw_data['hourly'][e][i]
-
-        weather_code = WEATHER_CODES[str(raw_data['hourly']['weather_code'][i])]
-        hourly_data['weather description'] = weather_code['description']
-
-        if weather_code['category'] in ['rain', 'snow']:
-            hourly_data['precipitation type'] = weather_code['category']
-        elif raw_data['hourly']['precipitation_probability'][i] > 4:
-            if raw_data['hourly']['temperature_2m'][i] < 35:
-                hourly_data['precipitation type'] = 'snow'
-            else:
-                hourly_data['precipitation type'] = 'rain'
+    resp = open_meteo_get('open_meteo_forecast', 'forecast', url, 'weather forecast data', len(locations))
 
-        weather_data[day].append(hourly_data)
+    count('open_meteo_forecast_bytes', len(resp.content))
+    with span('open_meteo_forecast_parse'):
+        body = resp.json()
+        # a single location returns one object, several return a list in the order requested
+        return [HourlySeries.from_open_meteo(entry['hourly']) for entry in (body if isinstance(body, list) else [body])]
 
-    return weather_data
 
+def find_hourly_window(hourly, prev_date, hours=72):
+    """
+    Returns:
+      index of midnight on prev_date in the hourly data, or None if the data doesn't cover all of
+      the requested hours starting from there.
+    """
+    start = hourly.index_of(f"{prev_date}T00:00")
+    if start is None or start + hours > len(hourly):
+        return None
+    return start
 
-def get_forecast(options, data):
-    forecast_date_simple = options['forecastDate'].strftime('%Y-%m-%d')
-    coord = f"{options['lat']}_{options['lng']}"
-    prompt = 'Generate a weather forecast'
 
-    if forecast_date_simple == options['now'].strftime('%Y-%m-%d'):
-        prompt = 'Generate a weather forecast for today. Include current conditions as well as any significant weather activity for the remainder of today. '
-        if int(options['forecastDate'].strftime('%H')) > 17:
-            prompt += 'Include a very brief summary of the weather for the following day as well.'
-    else:
-        prompt = f"Generate a weather forecast for {options['forecastDate'].strftime('%A')} whose date is {forecast_date_simple}. This is a date in the future. Do not include any information about current conditions. Do not use terms like \"this morning\" or \"this afternoon\" and instead use \"{options['forecastDate'].strftime('%A')} morning\" or \"{options['forecastDate'].strftime('%A')} afternoon\". Your forecast should cover weather for the entire day on {forecast_date_simple}, and should not include weather for any other day."
+def get_weather_data(options):
+    prev_date = (options['forecastDate'] - timedelta(days=1)).strftime('%Y-%m-%d')
 
-    print(f'Generating a weather forecast using prompt:\n{prompt}')
+    hourly = get_hourly_data(options)
+    start = find_hourly_window(hourly, prev_date)
+    if start is None:
+        # the cached window was fetched on an earlier day, so it may not reach this far
+        hourly = get_hourly_data(options, refresh=True)
+        start = find_hourly_window(hourly, prev_date)
+        if start is None:
+            raise IOError(f"Weather forecast data does not cover {options['forecastDate'].strftime('%Y-%m-%d')}")
 
-    client = genai.Client(api_key=os.getenv('GEN_AI_KEY'))
+    with span('weather_data_build'):
+        return build_weather_data(hourly, start)
+
+
+def build_weather_data(hourly, start=0):
+    """
+    Cut the previous, forecast, and following days out of 72 hours of hourly data starting at midnight
+    of the previous day. The days are HourlySeries views; build_payload() turns them into prompt data.
+
+    Args:
+      hourly: HourlySeries, or the raw Open-Meteo hourly data
+    """
+    if not isinstance(hourly, HourlySeries):
+        hourly = HourlySeries.from_open_meteo(hourly)
+    window = hourly.slice(start, start + 72)
+    return {'previous day': window.day(0), 'forecast day': window.day(1), 'following day': window.day(2)}
 
-    forecastResponse = client.models.generate_content(
-        model = "gemini-3-flash-preview",
-        contents = [
-            {'text': prompt},
-            {'inlineData': {'data': base64.b64encode(json.dumps(data).encode()).decode(), 'mimeType': 'application/json'}}
-        ],
-        config = types.GenerateContentConfig(system_instruction=AI_FORECAST_INSTRUCTION),
-    )
-    forecast = forecastResponse.text
-
-    voiceResponse = client.models.generate_content(
-        model = "gemini-2.5-flash-preview-tts",
-        contents = AI_VOICE_INSTRUCTION + "\n" + forecast,
-        config = types.GenerateContentConfig(
-            response_modalities = ["AUDIO"],
-            speech_config = types.SpeechConfig(
-                voice_config=types.VoiceConfig(
-                    prebuilt_voice_config = types.PrebuiltVoiceConfig(voice_name = 'Erinome')
-                )
-            )
-        )
-    )
 
-    wave_filename = os.path.join(CACHE_DIR, f"{forecast_date_simple}_{coord}.wav")
-    voiceData = voiceResponse.candidates[0].content.parts[0].inline_data.data
-    create_wave_file(wave_filename, voiceData)
+def get_forecast(options, data, on_audio=None, fingerprint=None):
+    forecast_date_simple = options['forecastDate'].strftime('%Y-%m-%d')
+    coord = options['coord']
+    has_api_key = bool(os.getenv('GEN_AI_KEY'))
+    ttl = FORECAST_TTL
+
+    forecast = None
+    if options['engine'] == 'gemini' and has_api_key:
+        try:
+            with span('gemini_text', payload_format=options['payload_format']):
+                forecast = generate_gemini_forecast(options, data)
+        except Exception as e:
+            count('gemini_text_failures')
+            print(f"Gemini forecast failed, using the rule-based forecast instead: {e}")
+    elif options['engine'] == 'gemini':
+        print('No GEN_AI_KEY set, using the rule-based forecast')
+
+    if forecast is None:
+        with span('rules_text'):
+            forecast = generate_rule_forecast(options, data)
+        print(f"Generated rule-based forecast:\n{forecast}")
+        if options['engine'] != 'rules':
+            # cache the fallback briefly and without a fingerprint, so Gemini is tried again soon
+            ttl = FALLBACK_FORECAST_TTL
+            fingerprint = None
+
+    with span('tts'):
+        voice = synthesize_cached(forecast, on_audio, None if has_api_key else 'local')
+    wave_filename = voice['audio_file']
 
-    forecast_cache = load_cache(WEATHER_FORECAST_CACHE)
     print(f"Caching forecast data for location {coord} on {forecast_date_simple}")
+    with span('cache_write'):
+        get_cache_store().put_forecast(forecast_date_simple, forecast_cache_key(options), {
+            'exp': int(datetime.now().timestamp()) + ttl,
+            'txt': forecast,
+            'wav': wave_filename,
+            'fp': fingerprint
+        })
+    with span('cache_cleanup'):
+        purge_cache()
+        clean_audio_cache()
+        prune_memory_caches()
+
+    return { 'text': forecast, 'audio_file': wave_filename, 'streamed': voice['streamed'] }
+
+
+def forecast_scope(options):
+    """
+    Returns:
+      what the forecast covers, which decides the prompt: 'today', 'today and tomorrow' (in the evening), or 'future day'
+    """
+    if options['forecastDate'].strftime('%Y-%m-%d') != options['now'].strftime('%Y-%m-%d'):
+        return 'future day'
+    return 'today and tomorrow' if int(options['forecastDate'].strftime('%H')) > 17 else 'today'
 
-    if forecast_date_simple not in forecast_cache:
-        forecast_cache[forecast_date_simple] = {}
 
-    forecast_cache[forecast_date_simple][coord] = {
-        'exp': int(datetime.now().timestamp()) + FORECAST_TTL,
-        'txt': forecast,
-        'wav': wave_filename
-    }
-    save_cache(WEATHER_FORECAST_CACHE, forecast_cache)
+def generate_gemini_forecast(options, data):
+    forecast_date_simple = options['forecastDate'].strftime('%Y-%m-%d')
+    scope = forecast_scope(options)
+
+    if scope != 'future day':
+        prompt = 'Generate a weather forecast for today. Include current conditions as well as any significant weather activity for the remainder of today. '
+        if scope == 'today and tomorrow':
+            prompt += 'Include a very brief summary of the weather for the following day as well.'
+    else:
+        prompt = f"Generate a weather forecast for {options['forecastDate'].strftime('%A')} whose date is {forecast_date_simple}. This is a date in the future. Do not include any information about current conditions. Do not use terms like \"this morning\" or \"this afternoon\" and instead use \"{options['forecastDate'].strftime('%A')} morning\" or \"{options['forecastDate'].strftime('%A')} afternoon\". Your forecast should cover weather for the entire day on {forecast_date_simple}, and should not include weather for any other day."
+
+    if options['payload_format'] != 'verbose':
+        prompt += ' The weather data is in a compact format with one array per weather element for each day; the "legend" explains each short key.'
 
-    return { 'text': forecast, 'audio_file': wave_filename }
+    print(f'Generating a weather forecast using prompt:\n{prompt}')
+
+    _, types = load_genai()
+    client = get_genai_client()
+    contents = [
+        {'text': prompt},
+        {'inlineData': {'data': encode_payload(build_payload(data, options['payload_format'])), 'mimeType': 'application/json'}}
+    ]
+
+    def attempt(timeout):
+        forecastResponse = client.models.generate_content(
+            model = "gemini-3-flash-preview",
+            contents = contents,
+            config = types.GenerateContentConfig(system_instruction=AI_FORECAST_INSTRUCTION, http_options=genai_http_options(types, timeout)),
+        )
+        return forecastResponse.text
 
+    return call_upstream('gemini_text', attempt)
 
-def create_wave_file(filename, data, channels=1, rate=24000, sample_width=2):
-    ensure_cache_dir()
-    with wave.open(filename, "wb") as wf:
-        wf.setnchannels(channels)
-        wf.setsampwidth(sample_width)
-        wf.setframerate(rate)
-        wf.writeframes(data)
 
+def encode_payload(payload):
+    return base64.b64encode(json.dumps(payload, separators=(',', ':')).encode()).decode()
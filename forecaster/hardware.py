@@ -0,0 +1,176 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+import wave
+
+try:
+    from .buttonInput import LONG_PRESS_SECONDS, SimulatedPin
+    from .metrics import span
+except ImportError:
+    from buttonInput import LONG_PRESS_SECONDS, SimulatedPin
+    from metrics import span
+
+HARDWARE_TYPES = ['pi', 'simulated']
+HARDWARE = os.getenv('HARDWARE', 'pi').lower()  # 'pi' for the real button, LEDs and speaker, 'simulated' to run headless
+DOTSTAR_COUNT = 3
+SIMULATED_PRESS_SECONDS = {'': 0.2, 'l': LONG_PRESS_SECONDS + 0.5}  # what typing Enter or "l" + Enter does in simulated mode
+
+_hardware = None
+_lock = threading.Lock()
+
+
+class PiHardware:
+    """The button on D17, the DotStar LEDs on D5/D6, and aplay (or a pyaudio stream) for the speaker."""
+    name = 'pi'
+
+    def __init__(self):
+        import board
+        from digitalio import DigitalInOut, Direction, Pull
+        import adafruit_dotstar
+
+        self.dots = adafruit_dotstar.DotStar(board.D6, board.D5, DOTSTAR_COUNT)
+        self.button = DigitalInOut(board.D17)
+        self.button.direction = Direction.INPUT
+        self.button.pull = Pull.UP
+        self.clock = time.monotonic
+        self.sleep = time.sleep
+        self._playback_process = None
+        self._playback_lock = threading.Lock()
+
+    def start(self):
+        pass
+
+    def set_leds(self, color):
+        for i in range(DOTSTAR_COUNT):
+            self.dots[i] = color
+
+    def create_player(self):
+        try:
+            from .playback import AudioPlayer
+        except ImportError:
+            from playback import AudioPlayer
+        return AudioPlayer()
+
+    def play_file(self, audio_file):
+        with self._playback_lock:
+            with span('aplay_spawn'):
+                self._playback_process = subprocess.Popen(['aplay', audio_file])
+        self._playback_process.wait()
+
+    def stop_playback(self):
+        with self._playback_lock:
+            if self._playback_process and self._playback_process.poll() is None:
+                self._playback_process.terminate()
+
+
+class SimulatedAudioPlayer:
+    """Stand-in for playback.AudioPlayer that counts the audio written to it instead of playing it."""
+
+    def __init__(self, hardware):
+        self.hardware = hardware
+        self.bytes_written = 0
+        self._stopped = threading.Event()
+
+    def stop(self):
+        self._stopped.set()
+
+    def reset(self):
+        self._stopped.clear()
+
+    def write(self, chunk):
+        if not self._stopped.is_set():
+            self.bytes_written += len(chunk)
+
+    def finish(self):
+        pass
+
+    def play_file(self, filename):
+        self.hardware.play_file(filename)
+
+    def close(self):
+        pass
+
+
+class SimulatedHardware:
+    """
+    Headless stand-in for the button, LEDs, and speaker. Audio files are opened and "played" for their
+    length without making a sound, and the LED color is just remembered.
+
+    Args:
+      clock, sleep: time source and sleep function; pass a buttonInput.SimulatedClock's time and sleep
+        to replay presses (and playback) faster than real time
+      presses: list of (start, duration) tuples in clock seconds to replay on the button
+      interactive: read presses from stdin (Enter for a short press, "l" and Enter for a long one)
+    """
+    name = 'simulated'
+
+    def __init__(self, clock=time.monotonic, sleep=None, presses=None, interactive=False):
+        self.clock = clock
+        self.sleep = sleep or time.sleep
+        self.button = SimulatedPin(presses or [], clock)
+        self.interactive = interactive
+        self.led_color = None
+        self.led_changes = 0
+        self.files_played = 0
+        self.seconds_played = 0.0
+        self._realtime = sleep is None
+        self._stopped = threading.Event()
+
+    def start(self):
+        if self.interactive:
+            print("  simulated button: press Enter for today's forecast, or type l and Enter for tomorrow's")
+            threading.Thread(target=self._read_presses, name='simulated-button', daemon=True).start()
+
+    def _read_presses(self):
+        for line in sys.stdin:
+            duration = SIMULATED_PRESS_SECONDS.get(line.strip().lower())
+            if duration is not None:
+                self.button.add_press(self.clock(), duration)
+
+    def set_leds(self, color):
+        if color != self.led_color:
+            self.led_color = color
+            self.led_changes += 1
+
+    def create_player(self):
+        return SimulatedAudioPlayer(self)
+
+    def play_file(self, audio_file):
+        with wave.open(audio_file, 'rb') as wf:
+            seconds = wf.getnframes() / wf.getframerate()
+        self._stopped.clear()
+        self.files_played += 1
+        self.seconds_played += seconds
+        if self._realtime:
+            self._stopped.wait(seconds)
+        else:
+            self.sleep(seconds)
+
+    def stop_playback(self):
+        self._stopped.set()
+
+
+def get_hardware():
+    """
+    Returns:
+      the shared hardware for HARDWARE ('pi' or 'simulated'), created on first use
+
+    Raises:
+      ValueError if HARDWARE isn't a known type
+    """
+    global _hardware
+    with _lock:
+        if _hardware is None:
+            if HARDWARE not in HARDWARE_TYPES:
+                raise ValueError(f"Invalid hardware type: {HARDWARE}")
+            _hardware = PiHardware() if HARDWARE == 'pi' else SimulatedHardware(interactive=sys.stdin.isatty())
+        return _hardware
+
+
+def use_hardware(hardware):
+    """Use the given hardware (e.g. a SimulatedHardware on a simulated clock in test/soak.py) instead of HARDWARE."""
+    global _hardware
+    with _lock:
+        _hardware = hardware
@@ -0,0 +1,199 @@
+import json
+import math
+import os
+from array import array
+
+with open(os.path.join(os.path.dirname(__file__), 'weather-codes.json')) as f:
+    WEATHER_CODES = json.load(f)
+
+# Open-Meteo hourly field => name used in the verbose prompt data
+FIELD_MAP = {
+    'temperature_2m': 'actual temperature',
+    'apparent_temperature': 'feels like temperature',
+    'precipitation_probability': 'probability of precipitation',
+    'precipitation': 'precipitation amount',
+    'uv_index': 'UV index',
+    'cloud_cover': 'cloud cover percent',
+    'relative_humidity_2m': 'relative humidity percent',
+    'wind_speed_10m': 'wind speed',
+    'wind_gusts_10m': 'wind gust speed',
+    'wind_direction_10m': 'wind direction degrees'
+}
+PRECIPITATION_TYPES = [None, 'rain', 'snow']
+POSSIBLE_PRECIPITATION = 4  # percent chance above which an hour gets a precipitation type even if its weather code has none
+SNOW_TEMPERATURE = 35  # below this, possible precipitation is called snow
+MISSING_INT = -2 ** 31  # stands in for null in integer columns (float columns use NaN)
+MISSING_CODE = 255
+
+# weather code => description, category, and PRECIPITATION_TYPES index, looked up once per code instead of once per hour
+CODE_DESCRIPTIONS = [None] * 256
+CODE_CATEGORIES = [None] * 256
+CODE_PRECIPITATION = [0] * 256
+for code, info in WEATHER_CODES.items():
+    CODE_DESCRIPTIONS[int(code)] = info['description']
+    CODE_CATEGORIES[int(code)] = info['category']
+    if info['category'] in PRECIPITATION_TYPES:
+        CODE_PRECIPITATION[int(code)] = PRECIPITATION_TYPES.index(info['category'])
+
+
+def to_column(values):
+    """Pack one Open-Meteo field into an array, keeping ints as ints so the prompt data is unchanged."""
+    if all(type(v) is int for v in values if v is not None):
+        return array('l', [MISSING_INT if v is None else v for v in values])
+    return array('d', [math.nan if v is None else v for v in values])
+
+
+class HourlySeries:
+    """
+    Hourly Open-Meteo data held as one array per field, with the weather code descriptions, categories,
+    and precipitation types worked out once when the data is loaded. slice() and day() return views that
+    share the arrays, so cutting a day out of a week of data doesn't copy anything. Values are read a
+    column at a time (with None for missing values); rows() builds per-hour dicts only for the prompt.
+    """
+
+    __slots__ = ('times', 'fields', 'columns', 'codes', 'precipitation', 'start', 'stop')
+
+    def __init__(self, times, fields, columns, codes, precipitation, start=0, stop=None):
+        self.times = times
+        self.fields = fields
+        self.columns = columns
+        self.codes = codes
+        self.precipitation = precipitation
+        self.start = start
+        self.stop = len(times) if stop is None else stop
+
+    @classmethod
+    def from_open_meteo(cls, hourly):
+        """
+        Args:
+          hourly: the 'hourly' object from an Open-Meteo forecast response (field => list of values)
+        """
+        fields = [key for key in hourly.keys() if key in FIELD_MAP]
+        columns = {field: to_column(hourly[field]) for field in fields}
+        codes = array('B', [MISSING_CODE if code is None else code for code in hourly['weather_code']])
+
+        code_precipitation = [CODE_PRECIPITATION[code] for code in codes]
+        probabilities = hourly.get('precipitation_probability') or [None] * len(codes)
+        temperatures = hourly.get('temperature_2m') or [None] * len(codes)
+        precipitation = array('B', [
+            kind or (0 if (probability or 0) <= POSSIBLE_PRECIPITATION else (2 if temperature is not None and temperature < SNOW_TEMPERATURE else 1))
+            for kind, probability, temperature in zip(code_precipitation, probabilities, temperatures)
+        ])
+        return cls(list(hourly['time']), fields, columns, codes, precipitation)
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def slice(self, start, stop=None):
+        """A view of hours start (inclusive) to stop (exclusive), counted from the start of this series."""
+        stop = len(self) if stop is None else min(stop, len(self))
+        start = min(start, stop)
+        return HourlySeries(self.times, self.fields, self.columns, self.codes, self.precipitation, self.start + start, self.start + stop)
+
+    def day(self, index):
+        """The 24 hours of the index'th day of this series (which should start at midnight)."""
+        return self.slice(index * 24, index * 24 + 24)
+
+    def index_of(self, time_str):
+        """
+        Returns:
+          index of the hour with the given "YYYY-MM-DDTHH:MM" time in this series, or None
+        """
+        try:
+            index = self.times.index(time_str, self.start, self.stop)
+        except ValueError:
+            return None
+        return index - self.start
+
+    def time(self, index):
+        return self.times[self.start + index]
+
+    def hours(self):
+        return [int(t[11:13]) for t in self.times[self.start:self.stop]]
+
+    def has(self, field):
+        return field in self.columns
+
+    def values(self, field):
+        """
+        Returns:
+          list of the field's values for each hour, with None where Open-Meteo had no value
+        """
+        column = self.columns.get(field)
+        if column is None:
+            return [None] * len(self)
+        values = column[self.start:self.stop]
+        if column.typecode == 'd':
+            return [None if v != v else v for v in values]
+        return [None if v == MISSING_INT else v for v in values]
+
+    def descriptions(self):
+        return [CODE_DESCRIPTIONS[code] for code in self.codes[self.start:self.stop]]
+
+    def categories(self):
+        return [CODE_CATEGORIES[code] for code in self.codes[self.start:self.stop]]
+
+    def precipitation_types(self):
+        return [PRECIPITATION_TYPES[kind] for kind in self.precipitation[self.start:self.stop]]
+
+    def extreme(self, field, highest=True):
+        """
+        Returns:
+          (value, index) of the highest (or lowest) value of field, or None if it has no values;
+          ties go to the latest hour for the highest and the earliest for the lowest
+        """
+        values = [(v, i) for i, v in enumerate(self.values(field)) if v is not None]
+        if not values:
+            return None
+        return max(values) if highest else min(values)
+
+    def total(self, field):
+        return sum(v for v in self.values(field) if v is not None)
+
+    def windows(self, field, threshold):
+        """
+        Returns:
+          list of (first, last) hour indexes of each run of hours where field is at least threshold
+        """
+        runs = []
+        first = None
+        values = self.values(field)
+        for i, value in enumerate(values + [None]):
+            if value is not None and value >= threshold:
+                if first is None:
+                    first = i
+            elif first is not None:
+                runs.append((first, i - 1))
+                first = None
+        return runs
+
+    def crossings(self, field, threshold):
+        """
+        Returns:
+          list of (index, rising) for each hour where field goes from below threshold to at least it
+          (rising) or back below it, compared to the hour before
+        """
+        values = self.values(field)
+        return [
+            (i, current >= threshold)
+            for i, (previous, current) in enumerate(zip(values, values[1:]), 1)
+            if previous is not None and current is not None and (previous >= threshold) != (current >= threshold)
+        ]
+
+    def rows(self):
+        """
+        Returns:
+          the verbose prompt data: one dict per hour with the time, each field under its FIELD_MAP name,
+          the weather description, and the precipitation type (only for hours that have one)
+        """
+        columns = [(FIELD_MAP[field], self.values(field)) for field in self.fields]
+        rows = []
+        for i, (time_str, description, kind) in enumerate(zip(self.times[self.start:self.stop], self.descriptions(), self.precipitation_types())):
+            row = {'time': time_str}
+            for name, values in columns:
+                row[name] = values[i]
+            row['weather description'] = description
+            if kind:
+                row['precipitation type'] = kind
+            rows.append(row)
+        return rows
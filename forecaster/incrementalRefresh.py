@@ -0,0 +1,61 @@
+import json
+import os
+
+INCREMENTAL_REFRESH = os.getenv('INCREMENTAL_REFRESH', '1') == '1'
+REFRESH_TEMP_TOLERANCE = float(os.getenv('REFRESH_TEMP_TOLERANCE', '2'))  # degrees, in the requested temperature unit
+REFRESH_PRECIP_TOLERANCE = float(os.getenv('REFRESH_PRECIP_TOLERANCE', '10'))  # percentage points of precipitation probability
+REFRESH_MAX_AGE = int(float(os.getenv('REFRESH_MAX_AGE_HOURS', '6')) * 60 * 60)  # always regenerate forecasts older than this
+
+DAYS = ['previous day', 'forecast day', 'following day']
+
+
+def weather_fingerprint(weather_data, generated_ts, prompt=None):
+    """
+    Summarize the weather data a forecast was generated from: hourly temperature, precipitation
+    probability, and weather category (plus precipitation type) for each day sent to the model.
+
+    Args:
+      prompt: string describing everything else that shapes the forecast text (what it covers, the engine,
+        and the payload format); a forecast is only kept when this is unchanged
+
+    Returns:
+      JSON string to store with the cached forecast
+    """
+    fingerprint = {'generated': generated_ts, 'prompt': prompt, 'temp': [], 'pop': [], 'wx': []}
+    for day in DAYS:
+        series = weather_data.get(day)
+        if not series:
+            continue
+        fingerprint['temp'] += series.values('temperature_2m')
+        fingerprint['pop'] += series.values('precipitation_probability')
+        for category, description, kind in zip(series.categories(), series.descriptions(), series.precipitation_types()):
+            wx = category or description
+            fingerprint['wx'].append(f"{wx}/{kind}" if kind else wx)
+    return json.dumps(fingerprint, separators=(',', ':'))
+
+
+def max_difference(old, new):
+    diffs = [abs(a - b) for a, b in zip(old, new) if a is not None and b is not None]
+    return max(diffs) if diffs else 0
+
+
+def unchanged_reason(old_fingerprint, new_fingerprint, now_ts):
+    """
+    Compare the fingerprint stored with a cached forecast to the one for fresh weather data.
+
+    Returns:
+      None if the forecast should be regenerated, otherwise a short description of why it doesn't need to be
+    """
+    if not old_fingerprint:
+        return None
+    old = json.loads(old_fingerprint)
+    new = json.loads(new_fingerprint)
+    if now_ts - old['generated'] > REFRESH_MAX_AGE or old.get('prompt') != new.get('prompt'):
+        return None
+    if len(old['temp']) != len(new['temp']) or old['wx'] != new['wx']:
+        return None
+    temp_diff = max_difference(old['temp'], new['temp'])
+    pop_diff = max_difference(old['pop'], new['pop'])
+    if temp_diff > REFRESH_TEMP_TOLERANCE or pop_diff > REFRESH_PRECIP_TOLERANCE:
+        return None
+    return f"max temperature change {round(temp_diff, 1)}, max precipitation probability change {round(pop_diff)}, same conditions"
@@ -0,0 +1,157 @@
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+try:
+    from .cacheStore import CACHE_DIR
+except ImportError:
+    from cacheStore import CACHE_DIR
+
+METRICS_LOG = os.getenv('METRICS_LOG', '1') == '1'  # print a JSON line for every timed stage
+METRICS_FILE = os.getenv('METRICS_FILE', os.path.join(CACHE_DIR, 'metrics.prom'))  # Prometheus text file, empty to turn off
+METRICS_FILE_INTERVAL = int(os.getenv('METRICS_FILE_INTERVAL', '15'))  # seconds between rewrites of METRICS_FILE
+METRICS_WINDOW = int(os.getenv('METRICS_WINDOW', '200'))  # recent timings per stage used for the percentiles
+QUANTILES = [0.5, 0.95]
+
+_lock = threading.Lock()
+_local = threading.local()
+_timings = {}  # stage => deque of recent durations in seconds
+_totals = {}  # stage => [count, sum of seconds] since start
+_counters = {}
+_gauges = {}  # name => (help text, {labels tuple => value})
+_last_file_write = 0
+
+
+@contextmanager
+def span(stage, **labels):
+    """
+    Time a block of work as one stage (e.g. 'gemini_text'). Spans can be nested; the structured log line
+    names the enclosing stage as the parent. Any labels are only added to the log line.
+    """
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    parent = stack[-1] if stack else None
+    stack.append(stage)
+    start = time.perf_counter()
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        stack.pop()
+        observe(stage, time.perf_counter() - start, parent=parent, error=error, **labels)
+
+
+def observe(stage, seconds, **labels):
+    """Record a duration for stage that wasn't measured with span(), e.g. the time until the first audio chunk."""
+    with _lock:
+        _timings.setdefault(stage, deque(maxlen=METRICS_WINDOW)).append(seconds)
+        totals = _totals.setdefault(stage, [0, 0.0])
+        totals[0] += 1
+        totals[1] += seconds
+    if METRICS_LOG:
+        fields = {k: v for k, v in labels.items() if v is not None}
+        print(json.dumps({'metric': 'stage', 'stage': stage, 'seconds': round(seconds, 4), **fields}, default=str))
+    maybe_write_file()
+
+
+def count(name, amount=1):
+    """
+    Returns:
+      the new value of the counter
+    """
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+        return _counters[name]
+
+
+def set_gauge(name, value, help_text, **labels):
+    """Set the current value of a gauge, e.g. a circuit breaker's state, exported as forecaster_<name>."""
+    with _lock:
+        _gauges.setdefault(name, (help_text, {}))[1][tuple(sorted(labels.items()))] = value
+
+
+def get_counters(prefix=''):
+    with _lock:
+        return {name: value for name, value in _counters.items() if name.startswith(prefix)}
+
+
+def percentile(values, quantile):
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(quantile * len(ordered)) - 1))]
+
+
+def get_stage_summary():
+    """
+    Returns:
+      dict of stage => count, total seconds, and p50/p95 over the last METRICS_WINDOW timings
+    """
+    with _lock:
+        stages = {stage: (list(recent), list(_totals[stage])) for stage, recent in _timings.items()}
+    return {
+        stage: {
+            'count': totals[0],
+            'seconds': round(totals[1], 4),
+            **{f"p{int(q * 100)}": round(percentile(recent, q), 4) for q in QUANTILES}
+        }
+        for stage, (recent, totals) in sorted(stages.items())
+    }
+
+
+def prometheus_text():
+    """Render the stage timings (as summaries), counters, and gauges in the Prometheus text exposition format."""
+    with _lock:
+        stages = {stage: (list(recent), list(_totals[stage])) for stage, recent in _timings.items()}
+        counters = dict(_counters)
+        gauges = {name: (help_text, dict(values)) for name, (help_text, values) in _gauges.items()}
+
+    lines = [
+        '# HELP forecaster_stage_seconds Time spent in each stage of getting and playing a forecast.',
+        '# TYPE forecaster_stage_seconds summary'
+    ]
+    for stage, (recent, totals) in sorted(stages.items()):
+        for q in QUANTILES:
+            lines.append(f'forecaster_stage_seconds{{stage="{stage}",quantile="{q}"}} {percentile(recent, q):.6f}')
+        lines.append(f'forecaster_stage_seconds_sum{{stage="{stage}"}} {totals[1]:.6f}')
+        lines.append(f'forecaster_stage_seconds_count{{stage="{stage}"}} {totals[0]}')
+    lines += [
+        '# HELP forecaster_events_total Cache hits and misses and other counted events.',
+        '# TYPE forecaster_events_total counter'
+    ]
+    for name, value in sorted(counters.items()):
+        lines.append(f'forecaster_events_total{{event="{name}"}} {value}')
+    for name, (help_text, values) in sorted(gauges.items()):
+        lines += [f'# HELP forecaster_{name} {help_text}', f'# TYPE forecaster_{name} gauge']
+        for labels, value in sorted(values.items()):
+            label_text = ','.join(f'{k}="{v}"' for k, v in labels)
+            lines.append(f'forecaster_{name}{{{label_text}}} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+def maybe_write_file(force=False):
+    """Rewrite METRICS_FILE (for the node exporter textfile collector) at most every METRICS_FILE_INTERVAL seconds."""
+    global _last_file_write
+    if not METRICS_FILE:
+        return
+    now = time.time()
+    with _lock:
+        if not force and now - _last_file_write < METRICS_FILE_INTERVAL:
+            return
+        _last_file_write = now
+    try:
+        os.makedirs(os.path.dirname(METRICS_FILE) or '.', exist_ok=True)
+        temp_file = f"{METRICS_FILE}.{os.getpid()}.tmp"
+        with open(temp_file, 'w') as f:
+            f.write(prometheus_text())
+        os.replace(temp_file, METRICS_FILE)
+    except OSError as e:
+        print(f"Unable to write metrics file {METRICS_FILE}: {e}")
@@ -0,0 +1,100 @@
+import math
+import os
+import struct
+import threading
+import time
+import wave
+
+AUDIO_CHANNELS = 1
+AUDIO_RATE = 24000
+AUDIO_SAMPLE_WIDTH = 2
+PLAYBACK_MODE = os.getenv('PLAYBACK_MODE', 'aplay').lower()  # 'aplay' or 'stream'
+FILE_CHUNK_FRAMES = 2048
+
+
+class AudioPlayer:
+    """
+    Keeps a single pyaudio output stream open so that audio can be written to the speaker
+    as soon as it is available instead of waiting on a finished WAV file and a new aplay process.
+    """
+
+    def __init__(self, rate=AUDIO_RATE, channels=AUDIO_CHANNELS, sample_width=AUDIO_SAMPLE_WIDTH):
+        import pyaudio
+
+        self.rate = rate
+        self.channels = channels
+        self.sample_width = sample_width
+        self._frame_size = channels * sample_width
+        self._remainder = b''
+        self._stopped = threading.Event()
+        self._audio = pyaudio.PyAudio()
+        self._stream = self._open_stream(rate, channels, sample_width)
+
+    def _open_stream(self, rate, channels, sample_width):
+        return self._audio.open(
+            format=self._audio.get_format_from_width(sample_width),
+            channels=channels,
+            rate=rate,
+            output=True
+        )
+
+    def stop(self):
+        """Cut off the current playback; anything written until reset() is called is dropped."""
+        self._stopped.set()
+
+    def reset(self):
+        self._stopped.clear()
+        self._remainder = b''
+
+    def write(self, chunk):
+        """Write raw PCM to the speaker, holding back any partial frame until the next chunk."""
+        if self._stopped.is_set():
+            return
+        data = self._remainder + chunk
+        usable = len(data) - (len(data) % self._frame_size)
+        self._remainder = data[usable:]
+        if usable:
+            self._stream.write(data[:usable])
+
+    def finish(self):
+        """Drop any trailing partial frame left over from the last streamed chunk."""
+        self._remainder = b''
+
+    def play_file(self, filename):
+        with wave.open(filename, 'rb') as wf:
+            params = (wf.getframerate(), wf.getnchannels(), wf.getsampwidth())
+            stream = self._stream
+            if params != (self.rate, self.channels, self.sample_width):
+                # e.g. problem.wav or a locally generated file; use a one-off stream for it
+                stream = self._open_stream(*params)
+            try:
+                data = wf.readframes(FILE_CHUNK_FRAMES)
+                while data and not self._stopped.is_set():
+                    stream.write(data)
+                    data = wf.readframes(FILE_CHUNK_FRAMES)
+            finally:
+                if stream is not self._stream:
+                    stream.stop_stream()
+                    stream.close()
+
+    def close(self):
+        self._stream.stop_stream()
+        self._stream.close()
+        self._audio.terminate()
+
+
+def synthetic_pcm_chunks(seconds=3, chunk_ms=100, first_chunk_delay=0.5, chunk_delay=0.02, frequency=440, rate=AUDIO_RATE):
+    """
+    Local stand-in for a streaming TTS response: yields 16 bit mono PCM chunks of a sine tone,
+    sleeping before each chunk to simulate network latency.
+    """
+    frames_per_chunk = int(rate * chunk_ms / 1000)
+    total_frames = int(rate * seconds)
+    frame = 0
+    time.sleep(first_chunk_delay)
+    while frame < total_frames:
+        count = min(frames_per_chunk, total_frames - frame)
+        samples = [int(12000 * math.sin(2 * math.pi * frequency * (frame + i) / rate)) for i in range(count)]
+        frame += count
+        yield struct.pack(f"<{count}h", *samples)
+        time.sleep(chunk_delay)
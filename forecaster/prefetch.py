@@ -0,0 +1,112 @@
+import os
+import threading
+import time
+
+try:
+    from .getWeather import get_forecast_data, get_cached_forecast, parse_input_and_validate
+    from .cacheStore import purge_cache
+    from .audioCache import clean_audio_cache
+except ImportError:
+    from getWeather import get_forecast_data, get_cached_forecast, parse_input_and_validate
+    from cacheStore import purge_cache
+    from audioCache import clean_audio_cache
+
+PREFETCH_DAYS = ['today', 'tomorrow']
+PREFETCH_CHECK_INTERVAL = 60  # seconds between checks of the forecast cache
+
+
+def parse_refresh_times(value):
+    """
+    Parse a comma separated list of "HH:MM" times (24 hour clock), e.g. "05:30,11:30,17:30".
+
+    Returns:
+      sorted list of (hour, minute) tuples
+
+    Raises:
+      ValueError on badly formatted times.
+    """
+    times = []
+    for part in (value or '').split(','):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            hour, minute = [int(p) for p in part.split(':')]
+        except ValueError:
+            raise ValueError(f"Invalid prefetch refresh time: {part}")
+        if hour < 0 or hour > 23 or minute < 0 or minute > 59:
+            raise ValueError(f"Invalid prefetch refresh time: {part}")
+        times.append((hour, minute))
+    return sorted(times)
+
+
+PREFETCH_ENABLED = os.getenv('PREFETCH_ENABLED', '1') == '1'
+PREFETCH_REFRESH_TIMES = parse_refresh_times(os.getenv('PREFETCH_REFRESH_TIMES', '05:00,11:00,17:00'))
+PREFETCH_LEAD_TIME = int(os.getenv('PREFETCH_LEAD_MINUTES', '10')) * 60
+
+
+class PrefetchScheduler(threading.Thread):
+    """
+    Background thread that keeps the cached forecasts for PREFETCH_DAYS warm so that a
+    button press can play a cached forecast right away.
+
+    A forecast is regenerated when it is missing, when it expires within lead_time seconds,
+    or when one of the refresh_times (local time in the configured timezone) has passed.
+    """
+
+    def __init__(self, days=None, refresh_times=None, lead_time=None, interval=PREFETCH_CHECK_INTERVAL, options=None):
+        super().__init__(name='forecast-prefetch', daemon=True)
+        self.days = days or PREFETCH_DAYS
+        self.refresh_times = PREFETCH_REFRESH_TIMES if refresh_times is None else refresh_times
+        self.lead_time = PREFETCH_LEAD_TIME if lead_time is None else lead_time
+        self.interval = interval
+        self.options = options or {}
+        self.last_check = None
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        print("  prefetch scheduler started")
+        while not self._stop_event.is_set():
+            try:
+                self.check()
+            except Exception as e:
+                print(f"  ERROR in prefetch scheduler: {e}")
+            self._stop_event.wait(self.interval)
+
+    def check(self):
+        # taken before prefetching, so a refresh time that passes while the prefetches run is caught next check
+        now = parse_input_and_validate({**self.options, 'date': 'today'})['now']
+        for day in self.days:
+            options = {**parse_input_and_validate({**self.options, 'date': day}), 'now': now}
+            reason = self.refresh_reason(options)
+            if reason:
+                print(f"  prefetching forecast for {day} ({reason})...")
+                start = time.time()
+                # a forecast that is expiring soon is still a cache hit, so anything already cached has to be refreshed
+                get_forecast_data({**self.options, 'date': day}, refresh=(reason != 'not cached'))
+                print(f"  prefetch for {day} complete in {round(time.time() - start, 1)} seconds")
+        self.last_check = now
+        if purge_cache() is not None:
+            clean_audio_cache()
+
+    def refresh_reason(self, options):
+        forecast = get_cached_forecast(options)
+        if not forecast:
+            return 'not cached'
+        if forecast['exp'] - int(options['now'].timestamp()) <= self.lead_time:
+            return 'expiring soon'
+        if self.refresh_time_passed(options['now']):
+            return 'scheduled refresh'
+        return None
+
+    def refresh_time_passed(self, now):
+        if self.last_check is None:
+            return False
+        for hour, minute in self.refresh_times:
+            refresh_at = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+            if self.last_check < refresh_at <= now:
+                return True
+        return False
@@ -0,0 +1,121 @@
+try:
+    from .hourlySeries import FIELD_MAP, HourlySeries
+except ImportError:
+    from hourlySeries import FIELD_MAP, HourlySeries
+
+PAYLOAD_FORMATS = ['verbose', 'compact', 'compact_aggregates']
+PRECIPITATION_WINDOW_PROBABILITY = 30  # percent chance of precipitation that counts as a "precipitation window"
+
+# Open-Meteo field => (compact column name, decimal places to round to)
+COMPACT_FIELDS = {
+    'temperature_2m': ('temp', 0),
+    'apparent_temperature': ('feel', 0),
+    'precipitation_probability': ('pop', 0),
+    'precipitation': ('pcp', 2),
+    'uv_index': ('uv', 1),
+    'cloud_cover': ('cld', 0),
+    'relative_humidity_2m': ('rh', 0),
+    'wind_speed_10m': ('wnd', 0),
+    'wind_gusts_10m': ('gst', 0),
+    'wind_direction_10m': ('dir', 0)
+}
+DAYS = ['previous day', 'forecast day', 'following day']
+PRECIPITATION_TYPE_CODES = {'rain': 'r', 'snow': 's'}
+
+
+def round_value(value, places):
+    if value is None:
+        return None
+    if places == 0:
+        return int(round(value))
+    return round(value, places)
+
+
+def build_payload(weather_data, payload_format='verbose'):
+    """
+    Returns:
+      the weather data to send to the forecast model, in the requested format
+    """
+    if payload_format == 'verbose':
+        return {key: value.rows() if isinstance(value, HourlySeries) else value for key, value in weather_data.items()}
+    return build_compact_payload(weather_data, aggregates=(payload_format == 'compact_aggregates'))
+
+
+def build_compact_payload(weather_data, aggregates=False):
+    """
+    Encode the days from get_weather_data() as one array per field for each day, with the long field
+    names given once in a legend, weather descriptions given once and referenced by index, and values
+    rounded. Other keys in weather_data are passed through unchanged.
+    """
+    payload = {
+        'legend': {
+            'date': 'date of the day, each array has one value per hour starting at 00:00 local time',
+            **{short: FIELD_MAP[field] for field, (short, _) in COMPACT_FIELDS.items()},
+            'wx': 'index into "weather descriptions"',
+            'ptype': 'precipitation type per hour: r = rain, s = snow, - = none'
+        },
+        'weather descriptions': []
+    }
+    descriptions = payload['weather descriptions']
+
+    for day in DAYS:
+        series = weather_data.get(day)
+        if not series:
+            continue
+        columns = {'date': series.time(0)[:10]}
+        for field, (short, places) in COMPACT_FIELDS.items():
+            if series.has(field):
+                columns[short] = [round_value(value, places) for value in series.values(field)]
+
+        wx = []
+        for description in series.descriptions():
+            if description not in descriptions:
+                descriptions.append(description)
+            wx.append(descriptions.index(description))
+        columns['wx'] = wx
+        columns['ptype'] = ''.join(PRECIPITATION_TYPE_CODES.get(kind, '-') for kind in series.precipitation_types())
+
+        if aggregates:
+            columns['summary'] = summarize_day(series)
+        payload[day] = columns
+
+    for key, value in weather_data.items():
+        if key not in payload and key not in DAYS:
+            payload[key] = value
+    return payload
+
+
+def summarize_day(series):
+    """Precomputed daily aggregates for an HourlySeries: temperature extremes, precipitation windows, and peak gusts."""
+    def extreme(field, highest):
+        found = series.extreme(field, highest)
+        if not found:
+            return None
+        value, hour = found
+        return {'value': round_value(value, 0), 'hour': hour}
+
+    summary = {
+        'high temperature': extreme('temperature_2m', True),
+        'low temperature': extreme('temperature_2m', False),
+        'high feels like temperature': extreme('apparent_temperature', True),
+        'low feels like temperature': extreme('apparent_temperature', False),
+        'peak wind gust': extreme('wind_gusts_10m', True),
+        'total precipitation': round_value(series.total('precipitation'), 2),
+        'precipitation windows': []
+    }
+
+    probabilities = series.values('precipitation_probability')
+    kinds = series.precipitation_types()
+    for first, last in series.windows('precipitation_probability', PRECIPITATION_WINDOW_PROBABILITY):
+        types = []
+        for kind in kinds[first:last + 1]:
+            if kind and kind not in types:
+                types.append(kind)
+        summary['precipitation windows'].append({
+            'start hour': first,
+            'end hour': last,
+            'max probability': max(probabilities[first:last + 1]),
+            'types': types
+        })
+
+    return {key: value for key, value in summary.items() if value is not None}
@@ -0,0 +1,307 @@
+import os
+import random
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeout
+from contextlib import contextmanager
+
+try:
+    from .metrics import count, set_gauge
+except ImportError:
+    from metrics import count, set_gauge
+
+PRESS_DEADLINE = float(os.getenv('PRESS_DEADLINE_SECONDS', '30'))  # end to end budget from a press (or voice trigger) to audio
+UPSTREAM_RETRIES = int(os.getenv('UPSTREAM_RETRIES', '2'))  # extra attempts after a transient failure
+RETRY_BASE_DELAY = float(os.getenv('RETRY_BASE_DELAY', '0.5'))  # seconds, doubled for each retry and fully jittered
+RETRY_MAX_DELAY = float(os.getenv('RETRY_MAX_DELAY', '4'))
+BREAKER_FAILURES = int(os.getenv('BREAKER_FAILURES', '3'))  # consecutive failures that open an upstream's circuit
+BREAKER_RESET = float(os.getenv('BREAKER_RESET_SECONDS', '60'))  # how long it stays open before one trial call is let through
+MIN_ATTEMPT_SECONDS = 0.5  # don't start an upstream call with less of the budget left than this
+
+UPSTREAMS = ['open_meteo_forecast', 'open_meteo_archive', 'gemini_text', 'gemini_tts']
+# the share of the remaining budget one attempt may use, so a slow stage leaves time for the ones after it
+# (or for their local fallbacks: cached hourly data, the rules forecast, and the local voice)
+STAGE_SHARES = {'open_meteo_forecast': 0.4, 'open_meteo_archive': 0.4, 'gemini_text': 0.5, 'gemini_tts': 0.75}
+BREAKER_STATES = ['closed', 'half_open', 'open']  # exported as 0, 1, 2
+
+_local = threading.local()
+
+
+class DeadlineExceeded(IOError):
+    pass
+
+
+class CircuitOpen(IOError):
+    pass
+
+
+class UpstreamError(IOError):
+    """An upstream answered with an error status; only 5xx, 408, and 429 are worth retrying."""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class Deadline:
+    """A latency budget that runs out at a fixed time, shared by every stage of one forecast request."""
+
+    def __init__(self, seconds, clock=time.monotonic):
+        self.seconds = seconds
+        self.clock = clock
+        self.expires = clock() + seconds
+
+    def remaining(self):
+        return max(0.0, self.expires - self.clock())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def timeout(self, stage):
+        """
+        Returns:
+          seconds the next attempt at stage may take: its STAGE_SHARES share of the remaining budget
+
+        Raises:
+          DeadlineExceeded if less than MIN_ATTEMPT_SECONDS of the budget is left
+        """
+        remaining = self.remaining()
+        if remaining < MIN_ATTEMPT_SECONDS:
+            count('deadline_exceeded')
+            raise DeadlineExceeded(f"No time left for {stage} within the {self.seconds:g} second budget")
+        return max(MIN_ATTEMPT_SECONDS, remaining * STAGE_SHARES.get(stage, 1))
+
+
+@contextmanager
+def deadline(seconds=PRESS_DEADLINE):
+    """Give the upstream calls made by this thread (and the pool threads it hands work to with carry_deadline()) a budget."""
+    previous = getattr(_local, 'deadline', None)
+    _local.deadline = Deadline(seconds)
+    try:
+        yield _local.deadline
+    finally:
+        _local.deadline = previous
+
+
+def current_deadline():
+    """
+    Returns:
+      the Deadline this thread is working under, or None (e.g. for prefetches and background refreshes)
+    """
+    return getattr(_local, 'deadline', None)
+
+
+def carry_deadline(fn):
+    """Wrap fn so it runs under the calling thread's deadline when submitted to a thread pool."""
+    budget = current_deadline()
+
+    def run(*args, **kwargs):
+        previous = getattr(_local, 'deadline', None)
+        _local.deadline = budget
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _local.deadline = previous
+    return run
+
+
+def wait_within_deadline(future, stage):
+    """
+    Returns:
+      the future's result, waiting no longer than the current deadline allows (forever without one)
+
+    Raises:
+      DeadlineExceeded if the deadline ran out first; the work carries on in its thread
+    """
+    budget = current_deadline()
+    if budget is None:
+        return future.result()
+    try:
+        return future.result(timeout=budget.remaining())
+    except FutureTimeout:
+        if future.done():
+            raise
+        count('deadline_exceeded')
+        raise DeadlineExceeded(f"Gave up waiting on {stage} after the {budget.seconds:g} second budget ran out")
+
+
+def acquire_within_deadline(lock, stage):
+    """
+    Raises:
+      DeadlineExceeded if the lock could not be acquired before the current deadline ran out
+    """
+    budget = current_deadline()
+    if not lock.acquire(timeout=budget.remaining() if budget else -1):
+        count('deadline_exceeded')
+        raise DeadlineExceeded(f"Gave up waiting on {stage} after the {budget.seconds:g} second budget ran out")
+
+
+class CircuitBreaker:
+    """
+    Remembers the recent failures of one upstream. After BREAKER_FAILURES failures in a row the circuit opens
+    and calls fail fast with CircuitOpen (so callers go straight to their fallback) for BREAKER_RESET seconds;
+    then a single trial call is let through (half open), which closes the circuit again if it succeeds.
+    """
+
+    def __init__(self, name, failures=BREAKER_FAILURES, reset_seconds=BREAKER_RESET, clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = failures
+        self.reset_seconds = reset_seconds
+        self.clock = clock
+        self.state = 'closed'
+        self.failures = 0
+        self.trips = 0
+        self.opened_at = None
+        self.last_error = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+        self._export()
+
+    def allow(self):
+        """
+        Returns:
+          True if a call may be made now
+        """
+        with self._lock:
+            if self.state == 'open' and self.clock() - self.opened_at >= self.reset_seconds:
+                self._set_state('half_open')
+            if self.state == 'half_open':
+                if self._trial_running:
+                    return False
+                self._trial_running = True
+                return True
+            return self.state == 'closed'
+
+    def record_success(self):
+        with self._lock:
+            self._trial_running = False
+            self.failures = 0
+            if self.state != 'closed':
+                print(f"Circuit for {self.name} closed again")
+                self._set_state('closed')
+
+    def record_failure(self, error):
+        with self._lock:
+            self._trial_running = False
+            self.failures += 1
+            self.last_error = str(error)
+            if self.state == 'half_open' or (self.state == 'closed' and self.failures >= self.failure_threshold):
+                print(f"Circuit for {self.name} opened for {self.reset_seconds:g} seconds after {self.failures} failures: {error}")
+                self.opened_at = self.clock()
+                self.trips += 1
+                count(f"{self.name}_breaker_trips")
+                self._set_state('open')
+
+    def record_inconclusive(self):
+        """The call failed in a way that says nothing about the upstream's health (e.g. a bad request); leave the count alone."""
+        with self._lock:
+            self._trial_running = False
+
+    def status(self):
+        """
+        Returns:
+          dict with the 'state', consecutive 'failures', 'trips' since start, seconds until a trial call
+          is let through ('retryIn', open circuits only), and the 'lastError'
+        """
+        with self._lock:
+            status = {'state': self.state, 'failures': self.failures, 'trips': self.trips, 'lastError': self.last_error}
+            if self.state == 'open':
+                status['retryIn'] = round(max(0.0, self.opened_at + self.reset_seconds - self.clock()), 1)
+            return status
+
+    def _set_state(self, state):
+        self.state = state
+        self._export()
+
+    def _export(self):
+        set_gauge('breaker_state', BREAKER_STATES.index(self.state), 'Circuit breaker state of each upstream: 0 closed, 1 half open, 2 open.', upstream=self.name)
+
+
+BREAKERS = {name: CircuitBreaker(name) for name in UPSTREAMS}
+
+
+def get_breaker_status():
+    return {name: breaker.status() for name, breaker in BREAKERS.items()}
+
+
+def error_status(error):
+    """The HTTP status of an UpstreamError (status_code) or a Gemini SDK APIError (code), or None."""
+    status_code = getattr(error, 'status_code', None) or getattr(error, 'code', None)
+    return status_code if isinstance(status_code, int) else None
+
+
+def is_retryable(error):
+    """
+    Timeouts, connection errors, and 5xx/408/429 responses are transient; anything else (a bad request, or a
+    bug like a TypeError or KeyError) would fail again the same way.
+    """
+    if isinstance(error, (CircuitOpen, DeadlineExceeded, ValueError)):
+        return False
+    status_code = error_status(error)
+    if status_code is not None:
+        return status_code >= 500 or status_code in (408, 429)
+    # requests' errors are IOErrors, but httpx's (which the Gemini SDK uses) are not
+    return isinstance(error, (IOError, TimeoutError, FutureTimeout)) or is_httpx_transport_error(error)
+
+
+def is_httpx_transport_error(error):
+    return any(cls.__name__ == 'TransportError' and cls.__module__.startswith('httpx') for cls in type(error).__mro__)
+
+
+def is_auth_failure(error):
+    """
+    A missing, invalid, or revoked API key: not worth retrying, but every call will fail until someone fixes it,
+    so it counts against the circuit. Gemini answers an invalid key with a 400 that says API_KEY_INVALID.
+    """
+    return error_status(error) in (401, 403) or 'API_KEY_INVALID' in str(error)
+
+
+def retry_delay(retry):
+    """Exponential backoff with full jitter, so retries from several callers don't arrive together."""
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** retry))
+
+
+def call_upstream(upstream, attempt, retryable=is_retryable, retries=None, sleep=time.sleep):
+    """
+    Call an upstream through its circuit breaker, retrying transient failures with jittered backoff while
+    the current deadline (if any) leaves time for another attempt.
+
+    Args:
+      upstream: one of UPSTREAMS
+      attempt: callable given the timeout in seconds for this attempt (None without a deadline), returns the result
+      retryable: callable given an error, returns whether another attempt could succeed
+
+    Raises:
+      CircuitOpen if the upstream's circuit is open
+      DeadlineExceeded if there isn't enough of the budget left to try
+      the last attempt's error otherwise
+    """
+    breaker = BREAKERS[upstream]
+    retries = UPSTREAM_RETRIES if retries is None else retries
+    budget = current_deadline()
+    tries = 0
+    while True:
+        timeout = budget.timeout(upstream) if budget else None
+        if not breaker.allow():
+            count(f"{upstream}_fast_failures")
+            raise CircuitOpen(f"{upstream} is unavailable (circuit open after {breaker.failures} failures: {breaker.last_error})")
+        tries += 1
+        try:
+            result = attempt(timeout)
+        except Exception as e:
+            transient = retryable(e)
+            if transient or is_auth_failure(e):
+                breaker.record_failure(e)
+            else:
+                breaker.record_inconclusive()  # it answered, this request was the problem
+            if not transient or tries > retries or breaker.state == 'open':
+                raise
+            delay = retry_delay(tries - 1)
+            if budget and budget.remaining() - delay < MIN_ATTEMPT_SECONDS:
+                raise
+            count(f"{upstream}_retries")
+            print(f"{upstream} failed ({e}), retrying in {delay:.1f} seconds")
+            sleep(delay)
+            continue
+        breaker.record_success()
+        return result
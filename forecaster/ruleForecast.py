@@ -0,0 +1,163 @@
+from collections import Counter
+
+try:
+    from .promptPayload import summarize_day
+except ImportError:
+    from promptPayload import summarize_day
+
+WIND_UNIT_NAMES = {'mph': 'miles per hour', 'kmh': 'kilometers per hour', 'ms': 'meters per second', 'kn': 'knots'}
+PRECIPITATION_UNIT_NAMES = {'inch': 'inches', 'mm': 'millimeters'}
+NOTABLE_PRECIPITATION = {'inch': 0.1, 'mm': 2.5}  # only mention totals at least this large
+MUGGY_TEMPERATURE = {'fahrenheit': 70, 'celsius': 21}  # humidity is only worth mentioning when it's warm
+UNUSUAL_TEMP_DIFFERENCE = {'fahrenheit': 8, 'celsius': 5}  # difference from the normal high worth mentioning
+FREEZING_TEMPERATURE = {'fahrenheit': 32, 'celsius': 0}
+DAYTIME_HOURS = range(7, 20)
+
+
+def spoken_hour(time_str):
+    hour = int(time_str[11:13])
+    if hour == 0:
+        return 'midnight'
+    if hour == 12:
+        return 'noon'
+    return f"{hour % 12} {'AM' if hour < 12 else 'PM'}"
+
+
+def hour_at(series, index):
+    return spoken_hour(series.time(index))
+
+
+def precipitation_kind(window):
+    return ' and '.join(window['types']) or 'precipitation'
+
+
+def generate_rule_forecast(options, weather_data):
+    """
+    Build a short forecast script from the hourly weather data using fixed rules, without calling the
+    forecast model. The humidity_break, wind_break, high_temp_break, and low_temp_break options decide
+    which conditions are significant enough to mention.
+
+    Args:
+      options: validated options from parse_input_and_validate()
+      weather_data: the days of HourlySeries from get_weather_data(), plus the optional normal temperatures
+
+    Returns:
+      the forecast text
+
+    Raises:
+      ValueError if there is no hourly data for the forecast date
+    """
+    is_today = options['forecastDate'].strftime('%Y-%m-%d') == options['now'].strftime('%Y-%m-%d')
+    day_name = options['forecastDate'].strftime('%A')
+    current_hour = int(options['now'].strftime('%H'))
+    series = weather_data.get('forecast day')
+    if series is not None and is_today:
+        series = series.slice(current_hour)
+    if not series:
+        raise ValueError(f"No hourly weather data for {options['forecastDate'].strftime('%Y-%m-%d')}")
+
+    temperature_unit = options['temperature_unit']
+    precipitation_unit = options['precipitation_unit']
+    descriptions = series.descriptions()
+    categories = series.categories()
+    summary = summarize_day(series)
+    sentences = []
+
+    temperatures = series.values('temperature_2m')
+    if is_today:
+        # an hour missing from the data is skipped rather than failing the whole forecast
+        current = next((t for t in temperatures[:2] if t is not None), None)
+        if current is not None:
+            sentences.append(f"Right now it's {round(current)} degrees{f' with {descriptions[0]}' if descriptions[0] else ''}.")
+        elif descriptions[0]:
+            sentences.append(f"Right now we have {descriptions[0]}.")
+    else:
+        sentences.append(f"Here's your forecast for {day_name}.")
+
+    # sky conditions come from the non-precipitation hours, precipitation is described by its windows below
+    daytime = [i for i, hour in enumerate(series.hours()) if hour in DAYTIME_HOURS] or list(range(len(series)))
+    skies = Counter(descriptions[i] for i in daytime if categories[i] in ['clouds', 'atmosphere'])
+    when = 'the rest of today' if is_today else day_name
+    high = summary.get('high temperature')
+    low = summary.get('low temperature')
+    temps = None
+    if high:
+        temps = f"a high of {high['value']} around {hour_at(series, high['hour'])}"
+        if low and (low['hour'] > high['hour'] or not is_today):
+            temps += f" and a low of {low['value']}"
+    sky = skies.most_common(1)[0][0] if skies else None
+    if sky and temps:
+        sentences.append(f"Expect {sky} {when}, with {temps}.")
+    elif sky:
+        sentences.append(f"Expect {sky} {when}.")
+    elif temps:
+        sentences.append(f"Look for {temps} {when}.")
+
+    windows = summary['precipitation windows']
+    for window in windows[:2]:
+        if window['end hour'] - window['start hour'] >= 12:
+            sentences.append(f"{precipitation_kind(window).capitalize()} is likely much of the day, with up to a {round(window['max probability'])} percent chance.")
+        else:
+            sentences.append(f"{precipitation_kind(window).capitalize()} is likely from {hour_at(series, window['start hour'])} to {hour_at(series, window['end hour'])}, with up to a {round(window['max probability'])} percent chance.")
+    if windows and summary['total precipitation'] >= NOTABLE_PRECIPITATION.get(precipitation_unit, 0):
+        sentences.append(f"Totals could reach {summary['total precipitation']} {PRECIPITATION_UNIT_NAMES.get(precipitation_unit, precipitation_unit)}.")
+    if any('thunderstorm' in description for description in descriptions if description):
+        sentences.append("Thunderstorms are possible, so keep an eye on the sky.")
+    fog = [i for i, category in enumerate(categories) if category == 'atmosphere']
+    if fog and sky != descriptions[fog[0]]:
+        sentences.append(f"Watch for {descriptions[fog[0]]} around {hour_at(series, fog[0])}.")
+
+    freezing = series.crossings('temperature_2m', FREEZING_TEMPERATURE.get(temperature_unit, 32))
+    if freezing:
+        hour, rising = freezing[0]
+        text = f"Temperatures {'climb above' if rising else 'drop below'} freezing around {hour_at(series, hour)}"
+        if len(freezing) > 1:
+            hour, rising = freezing[1]
+            text += f" and {'climb back above' if rising else 'drop below'} it around {hour_at(series, hour)}"
+        sentences.append(text + '.')
+
+    wind = series.extreme('wind_speed_10m')
+    if wind and wind[0] >= options['wind_break']:
+        speed, hour = wind
+        text = f"It will be breezy, with winds up to {round(speed)} {WIND_UNIT_NAMES.get(options['wind_speed_unit'], options['wind_speed_unit'])} around {hour_at(series, hour)}"
+        gust = summary.get('peak wind gust')
+        if gust and gust['value'] >= speed + options['wind_break']:
+            text += f" and gusts near {gust['value']}"
+        sentences.append(text + '.')
+
+    feels_high = summary.get('high feels like temperature')
+    feels_low = summary.get('low feels like temperature')
+    if feels_high and feels_high['value'] >= options['high_temp_break']:
+        sentences.append(f"It will feel as hot as {feels_high['value']} degrees, so stay cool and hydrated.")
+    elif feels_low and feels_low['value'] <= options['low_temp_break']:
+        sentences.append(f"It will feel as cold as {feels_low['value']} degrees, so bundle up.")
+
+    # humidity_break is a fraction like the default 0.8, Open-Meteo reports humidity as a percentage
+    humidity_break = options['humidity_break'] * 100 if options['humidity_break'] <= 1 else options['humidity_break']
+    humidity = series.values('relative_humidity_2m')
+    muggy = [i for i in daytime
+             if (humidity[i] or 0) >= humidity_break
+             and (temperatures[i] or 0) >= MUGGY_TEMPERATURE.get(temperature_unit, 70)]
+    if muggy:
+        sentences.append("It will be humid, too.")
+
+    normals = weather_data.get('normal temperatures')
+    if normals and high and not is_today:
+        difference = high['value'] - normals['normal high temperature']
+        if abs(difference) >= UNUSUAL_TEMP_DIFFERENCE.get(temperature_unit, 8):
+            sentences.append(f"That's {'warmer' if difference > 0 else 'cooler'} than normal for this time of year, when highs are typically around {normals['normal high temperature']}.")
+
+    following = weather_data.get('following day')
+    if is_today and current_hour > 17 and following:
+        tomorrow = summarize_day(following)
+        if 'high temperature' in tomorrow:
+            text = f"Tomorrow, look for a high of {tomorrow['high temperature']['value']}"
+            if tomorrow['precipitation windows']:
+                text += f" with a chance of {precipitation_kind(tomorrow['precipitation windows'][0])}"
+            sentences.append(text + '.')
+        elif tomorrow['precipitation windows']:
+            sentences.append(f"Tomorrow, look for a chance of {precipitation_kind(tomorrow['precipitation windows'][0])}.")
+    elif not windows:
+        sentences.append("No precipitation is expected.")
+
+    return ' '.join(sentences)
@@ -0,0 +1,204 @@
+import json
+import os
+import re
+import shutil
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlparse
+
+try:
+    from .getWeather import STALE_WHILE_REVALIDATE, forecast_cache_key, get_cached_forecast, get_forecast_data, get_forecast_cache_stats, parse_input_and_validate
+    from .cacheStore import CACHE_DIR
+    from .audioCache import mark_played
+    from .tts import get_tts_cache_stats
+    from .clients import warm_up
+    from .prefetch import PrefetchScheduler, PREFETCH_ENABLED
+    from .singleFlight import SingleFlight
+    from .metrics import get_stage_summary, prometheus_text
+    from .promptPayload import build_payload
+    from .resilience import get_breaker_status
+except ImportError:
+    from getWeather import STALE_WHILE_REVALIDATE, forecast_cache_key, get_cached_forecast, get_forecast_data, get_forecast_cache_stats, parse_input_and_validate
+    from cacheStore import CACHE_DIR
+    from audioCache import mark_played
+    from tts import get_tts_cache_stats
+    from clients import warm_up
+    from prefetch import PrefetchScheduler, PREFETCH_ENABLED
+    from singleFlight import SingleFlight
+    from metrics import get_stage_summary, prometheus_text
+    from promptPayload import build_payload
+    from resilience import get_breaker_status
+
+SERVER_HOST = os.getenv('SERVER_HOST', '0.0.0.0')
+SERVER_PORT = int(os.getenv('SERVER_PORT', '8080'))
+SERVER_MAX_REQUESTS = int(os.getenv('SERVER_MAX_REQUESTS', '8'))  # requests handled at once, including cache hits and audio downloads
+SERVER_MAX_FORECASTS = int(os.getenv('SERVER_MAX_FORECASTS', '2'))  # distinct forecasts being generated at once (cached ones are always served)
+SERVER_RETRY_AFTER = 5  # seconds, sent with 503 responses
+AUDIO_FILE_PATTERN = re.compile(r'^[\w.-]+\.wav$')
+
+FORECASTS = SingleFlight()
+REQUEST_SLOTS = threading.BoundedSemaphore(SERVER_MAX_REQUESTS)
+FORECAST_SLOTS = threading.BoundedSemaphore(SERVER_MAX_FORECASTS)
+
+
+class ServerBusy(Exception):
+    pass
+
+
+def forecast_key(options):
+    """Requests for the same date, location, and text options share one forecast lookup or generation."""
+    return options['forecastDate'].strftime('%Y-%m-%d'), forecast_cache_key(options)
+
+
+def get_shared_forecast(input_options):
+    """
+    Get a forecast with get_forecast_data(), sharing the result with any identical request already in flight.
+
+    Returns:
+      (forecast data, shared) tuple; shared is True if another request did the work
+
+    Raises:
+      ServerBusy if a new forecast is needed and SERVER_MAX_FORECASTS are already being generated
+      ValueError, IOError from get_forecast_data()
+    """
+    options = parse_input_and_validate(input_options)
+    key = forecast_key(options)
+
+    def lookup():
+        if get_cached_forecast(options, allow_stale=STALE_WHILE_REVALIDATE):
+            # a cache hit is cheap, don't turn it away because slow generations hold the slots
+            return get_forecast_data(input_options)
+        if not FORECAST_SLOTS.acquire(blocking=False):
+            raise ServerBusy(f"{SERVER_MAX_FORECASTS} forecasts are already in progress")
+        try:
+            return get_forecast_data(input_options)
+        finally:
+            FORECAST_SLOTS.release()
+
+    return FORECASTS.do(key, lookup)
+
+
+class ForecastRequestHandler(BaseHTTPRequestHandler):
+    """
+    GET /forecast?date=tomorrow&lat=..&lng=..  forecast JSON, any DEFAULT_OPTIONS key is accepted as a query parameter
+        (add weather_data=1 to include the hourly data the forecast was generated from)
+    GET /audio/<file>.wav                      cached forecast audio, as linked by "audioUrl"
+    GET /status                                cache statistics, stage timings, upstream circuit breakers, and requests in flight
+    GET /metrics                               stage timings, counters, and breaker states in the Prometheus text format
+    """
+    server_version = 'PiForecaster/1.0'
+
+    def do_GET(self):
+        if not REQUEST_SLOTS.acquire(blocking=False):
+            return self.send_busy(f"{SERVER_MAX_REQUESTS} requests are already in progress")
+        try:
+            url = urlparse(self.path)
+            if url.path == '/forecast':
+                self.handle_forecast(dict(parse_qsl(url.query)))
+            elif url.path.startswith('/audio/'):
+                self.handle_audio(url.path[len('/audio/'):])
+            elif url.path == '/status':
+                self.send_json(200, {
+                    'forecastCache': get_forecast_cache_stats(),
+                    'ttsCache': get_tts_cache_stats(),
+                    'stages': get_stage_summary(),
+                    'breakers': get_breaker_status(),
+                    'inFlight': [list(key) for key in FORECASTS.in_flight()]
+                })
+            elif url.path == '/metrics':
+                content = prometheus_text().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+            else:
+                self.send_json(404, {'error': f"Unknown path: {url.path}"})
+        finally:
+            REQUEST_SLOTS.release()
+
+    def handle_forecast(self, params):
+        include_weather = params.pop('weather_data', '0') == '1'
+        try:
+            data, shared = get_shared_forecast(params)
+        except ServerBusy as e:
+            return self.send_busy(str(e))
+        except ValueError as e:
+            return self.send_json(400, {'error': str(e)})
+        except IOError as e:
+            return self.send_json(502, {'error': str(e)})
+        except Exception as e:
+            print(f"Error generating forecast for {params}: {e}")
+            return self.send_json(500, {'error': str(e)})
+
+        response = {k: v for k, v in data.items() if k != 'weatherData'}
+        if include_weather:
+            response['weatherData'] = build_payload(data['weatherData']) if data['weatherData'] else None
+        response['audioFile'] = os.path.basename(data['audioFile'])
+        response['audioUrl'] = f"/audio/{response['audioFile']}"
+        response['shared'] = shared
+        self.send_json(200, response)
+
+    def handle_audio(self, name):
+        audio_file = os.path.join(CACHE_DIR, name)
+        if not AUDIO_FILE_PATTERN.match(name) or not os.path.isfile(audio_file):
+            return self.send_json(404, {'error': f"No cached audio named {name}"})
+        mark_played(audio_file)
+        with open(audio_file, 'rb') as f:
+            self.send_response(200)
+            self.send_header('Content-Type', 'audio/wav')
+            self.send_header('Content-Length', str(os.fstat(f.fileno()).st_size))
+            self.end_headers()
+            shutil.copyfileobj(f, self.wfile)
+
+    def send_busy(self, message):
+        self.send_json(503, {'error': f"Server busy: {message}"}, {'Retry-After': str(SERVER_RETRY_AFTER)})
+
+    def send_json(self, status, body, headers=None):
+        content = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+
+def create_server(host=SERVER_HOST, port=SERVER_PORT):
+    server = ThreadingHTTPServer((host, port), ForecastRequestHandler)
+    server.daemon_threads = True
+    return server
+
+
+def warm_up_clients():
+    try:
+        warm_up()
+    except Exception as e:
+        print(f"Error warming up clients: {e}")
+
+
+def serve(host=SERVER_HOST, port=SERVER_PORT):
+    server = create_server(host, port)
+    threading.Thread(target=warm_up_clients, name='warm-up', daemon=True).start()
+    prefetcher = None
+    if PREFETCH_ENABLED:
+        prefetcher = PrefetchScheduler()
+        prefetcher.start()
+    print(f"Serving forecasts on http://{host}:{port}/forecast")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print("Shutting down forecast server...")
+        if prefetcher:
+            prefetcher.stop()
+        server.server_close()
+
+
+##########################
+if __name__ == '__main__':
+    serve(port=int(sys.argv[1]) if len(sys.argv) > 1 else SERVER_PORT)
+##########################
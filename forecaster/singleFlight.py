@@ -0,0 +1,69 @@
+import threading
+
+
+class SingleFlight:
+    """
+    Makes sure only one call for a given key is in progress at a time. Callers asking for a key
+    that is already in flight wait for (and share) the result of that call instead of starting another.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        """
+        Run fn() unless a call for key is already running, in which case wait for that call's result.
+
+        Returns:
+          (result, shared) tuple; shared is True if the result came from another caller's call
+
+        Raises:
+          whatever fn() raised, for every caller sharing the call
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = {'done': threading.Event(), 'result': None, 'error': None}
+                self._calls[key] = call
+
+        if not leader:
+            call['done'].wait()
+        else:
+            try:
+                call['result'] = fn()
+            except BaseException as e:
+                call['error'] = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call['done'].set()
+
+        if call['error'] is not None:
+            raise call['error']
+        return call['result'], not leader
+
+    def start(self, key, fn, name='single-flight'):
+        """
+        Run fn() in a background thread unless a call for key is already running.
+
+        Returns:
+          True if a new call was started
+        """
+        with self._lock:
+            if key in self._calls:
+                return False
+
+        def run():
+            try:
+                self.do(key, fn)
+            except Exception as e:
+                print(f"Background call for {key} failed: {e}")
+
+        threading.Thread(target=run, name=name, daemon=True).start()
+        return True
+
+    def in_flight(self):
+        with self._lock:
+            return list(self._calls.keys())
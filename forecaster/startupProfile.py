@@ -0,0 +1,38 @@
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+STARTUP_PROFILE = os.getenv('STARTUP_PROFILE', '0') == '1' or '--profile-startup' in sys.argv
+
+_process_start = time.perf_counter()
+_steps = []
+
+
+@contextmanager
+def step(name):
+    """Time a block of startup work (imports, hardware init, etc) for the startup report."""
+    modules_before = len(sys.modules)
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        yield
+    finally:
+        _steps.append((
+            name,
+            time.perf_counter() - wall_start,
+            time.process_time() - cpu_start,
+            len(sys.modules) - modules_before
+        ))
+
+
+def report():
+    """Print the time spent in each startup step, slowest first, if STARTUP_PROFILE is on."""
+    if not STARTUP_PROFILE:
+        return
+    total = time.perf_counter() - _process_start
+    print("\nStartup profile (wall seconds, cpu seconds, modules loaded):")
+    for name, wall, cpu, modules in sorted(_steps, key=lambda s: s[1], reverse=True):
+        print(f"  {wall:7.3f}  {cpu:7.3f}  {modules:5d}  {name}")
+    print(f"  {total:7.3f}  total from profiler import until ready")
+    print("  (run with `python -X importtime` for a per-module import breakdown)\n")
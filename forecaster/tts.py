@@ -0,0 +1,329 @@
+import hashlib
+import os
+import re
+import threading
+import time
+import uuid
+import wave
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+try:
+    from .cacheStore import CACHE_DIR, ensure_cache_dir
+    from .clients import genai_http_options, get_genai_client, load_genai
+    from .metrics import count, get_counters, observe, span
+    from .resilience import call_upstream, carry_deadline, is_retryable
+except ImportError:
+    from cacheStore import CACHE_DIR, ensure_cache_dir
+    from clients import genai_http_options, get_genai_client, load_genai
+    from metrics import count, get_counters, observe, span
+    from resilience import call_upstream, carry_deadline, is_retryable
+
+with open(os.path.join(os.path.dirname(__file__), 'ai-voice-instruction.txt')) as f:
+    AI_VOICE_INSTRUCTION = f.read()
+
+TTS_ENGINES = ['gemini', 'local', 'hedged']
+TTS_ENGINE = os.getenv('TTS_ENGINE', 'gemini').lower()
+TTS_HEDGE_DEADLINE = float(os.getenv('TTS_HEDGE_DEADLINE', '8'))  # seconds to wait on the cloud voice before starting the local one
+GEMINI_TTS_MODEL = 'gemini-2.5-flash-preview-tts'
+GEMINI_VOICE_NAME = 'Erinome'
+LOCAL_VOICE_PATTERN = os.getenv('LOCAL_TTS_VOICE', '/en')  # regex matched against the pyttsx3 voice ids
+LOCAL_VOICE_RATE = int(os.getenv('LOCAL_TTS_RATE', '160'))  # words per minute
+
+TTS_AUDIO_PREFIX = 'tts_'
+
+TTS_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix='tts')  # a losing cloud call may still be running
+LOCAL_TTS_POOL = ThreadPoolExecutor(max_workers=1, thread_name_prefix='tts-local')  # pyttsx3 wants to stay on one thread
+
+
+class GeminiTTS:
+    """Cloud voice; can stream PCM chunks to on_audio while writing the WAV file."""
+    name = 'gemini'
+
+    def voice_id(self):
+        return f"{GEMINI_TTS_MODEL}\n{GEMINI_VOICE_NAME}\n{AI_VOICE_INSTRUCTION}"
+
+    def synthesize(self, text, filename, on_audio=None):
+        """
+        Call the Gemini TTS model through its circuit breaker, retrying transient failures (a streamed
+        call only until its first audio has been played).
+
+        Returns:
+          True if the audio was streamed to on_audio, False otherwise
+        """
+        _, types = load_genai()
+        client = get_genai_client()
+
+        def voice_config(timeout=None):
+            return types.GenerateContentConfig(
+                response_modalities = ["AUDIO"],
+                speech_config = types.SpeechConfig(
+                    voice_config=types.VoiceConfig(
+                        prebuilt_voice_config = types.PrebuiltVoiceConfig(voice_name = GEMINI_VOICE_NAME)
+                    )
+                ),
+                http_options = genai_http_options(types, timeout)
+            )
+
+        if on_audio:
+            first_audio = {'seen': False}
+
+            def stream(timeout):
+                with span('gemini_tts', streamed=True):
+                    start = time.perf_counter()
+
+                    def on_chunk(chunk):
+                        if not first_audio['seen']:
+                            first_audio['seen'] = True
+                            observe('gemini_tts_first_audio', time.perf_counter() - start)
+                        on_audio(chunk)
+
+                    # the deadline isn't passed on here: it would cut off audio that is already playing
+                    voiceStream = client.models.generate_content_stream(
+                        model = GEMINI_TTS_MODEL,
+                        contents = AI_VOICE_INSTRUCTION + "\n" + text,
+                        config = voice_config()
+                    )
+                    chunks = (
+                        part.inline_data.data
+                        for chunk in voiceStream if chunk.candidates and chunk.candidates[0].content
+                        for part in chunk.candidates[0].content.parts if part.inline_data
+                    )
+                    create_wave_file_from_stream(filename, chunks, on_chunk)
+
+            call_upstream('gemini_tts', stream, retryable=lambda e: not first_audio['seen'] and is_retryable(e))
+            return True
+
+        def generate(timeout):
+            with span('gemini_tts', streamed=False):
+                return client.models.generate_content(
+                    model = GEMINI_TTS_MODEL,
+                    contents = AI_VOICE_INSTRUCTION + "\n" + text,
+                    config = voice_config(timeout)
+                )
+
+        voiceResponse = call_upstream('gemini_tts', generate)
+        voiceData = voiceResponse.candidates[0].content.parts[0].inline_data.data
+        create_wave_file(filename, voiceData)
+        return False
+
+
+class LocalTTS:
+    """Offline voice using pyttsx3 (espeak on the Pi); writes a WAV file, never streams."""
+    name = 'local'
+
+    def voice_id(self):
+        return f"pyttsx3\n{LOCAL_VOICE_PATTERN}\n{LOCAL_VOICE_RATE}"
+
+    def synthesize(self, text, filename, on_audio=None):
+        with span('local_tts'):
+            return LOCAL_TTS_POOL.submit(self._synthesize, text, filename).result()
+
+    def _synthesize(self, text, filename):
+        import pyttsx3
+
+        ensure_cache_dir()
+        engine = pyttsx3.init()
+        try:
+            for voice in engine.getProperty('voices'):
+                if re.search(LOCAL_VOICE_PATTERN, voice.id):
+                    engine.setProperty('voice', voice.id)
+                    break
+            engine.setProperty('rate', LOCAL_VOICE_RATE)
+            engine.save_to_file(text, filename)
+            engine.runAndWait()
+        finally:
+            engine.stop()
+        if not os.path.exists(filename) or os.path.getsize(filename) == 0:
+            raise IOError("Local text to speech did not produce any audio")
+        return False
+
+
+TTS_BACKENDS = {'gemini': GeminiTTS(), 'local': LocalTTS()}
+
+
+def audio_filename(text, backend):
+    """
+    Cached audio is named by a hash of the voice (model, voice name, instructions) and the text,
+    so the same forecast wording is only ever synthesized once per voice.
+    """
+    digest = hashlib.sha256(f"{backend.voice_id()}\n{text}".encode()).hexdigest()
+    return os.path.join(CACHE_DIR, f"{TTS_AUDIO_PREFIX}{digest[:24]}.wav")
+
+
+def count_tts_cache(result):
+    count(f"tts_cache_{result}")
+    return get_tts_cache_stats()
+
+
+def get_tts_cache_stats():
+    counters = get_counters('tts_cache_')
+    return {result: counters.get(f"tts_cache_{result}", 0) for result in ['hits', 'misses']}
+
+
+def synthesize_cached(text, on_audio=None, engine=None):
+    """
+    Speak text into the content addressed audio cache, reusing an existing file for the same text and voice.
+
+    Returns:
+      dict with the 'audio_file', the 'engine' whose voice it is, whether it was 'streamed' to on_audio,
+      and whether it came from the 'cache'
+    """
+    engine = engine or TTS_ENGINE
+    if engine not in TTS_ENGINES:
+        raise ValueError(f"Invalid text to speech engine: {engine}")
+
+    acceptable = ['local'] if engine == 'local' else (['gemini', 'local'] if engine == 'hedged' else ['gemini'])
+    for name in acceptable:
+        filename = audio_filename(text, TTS_BACKENDS[name])
+        if os.path.exists(filename):
+            stats = count_tts_cache('hits')
+            print(f"Using cached {name} audio for this forecast text (TTS cache hits: {stats['hits']}, misses: {stats['misses']})")
+            return {'audio_file': filename, 'engine': name, 'streamed': False, 'cache': True}
+
+    stats = count_tts_cache('misses')
+    print(f"No cached audio for this forecast text (TTS cache hits: {stats['hits']}, misses: {stats['misses']})")
+    ensure_cache_dir()
+    # unique to this call: a losing hedged call keeps writing to its own files after we've returned
+    temp_filename = os.path.join(CACHE_DIR, f"{TTS_AUDIO_PREFIX}{uuid.uuid4().hex}.tmp")
+    try:
+        result = synthesize(text, temp_filename, on_audio, engine)
+        filename = audio_filename(text, TTS_BACKENDS[result['engine']])
+        os.replace(temp_filename, filename)
+    finally:
+        if os.path.exists(temp_filename):
+            os.remove(temp_filename)
+    return {**result, 'audio_file': filename, 'cache': False}
+
+
+def synthesize(text, filename, on_audio=None, engine=None):
+    """
+    Speak text into the WAV file at filename.
+
+    Args:
+      on_audio: optional callable given raw PCM chunks as they arrive (only the Gemini voice streams)
+      engine: 'gemini', 'local', or 'hedged' (defaults to TTS_ENGINE). With 'gemini', the local voice
+        is used if the cloud call fails. With 'hedged', the local voice is also started once the cloud
+        voice hasn't produced any audio within TTS_HEDGE_DEADLINE seconds, and whichever finishes first is used.
+
+    Returns:
+      dict with the 'engine' used and whether the audio was 'streamed' to on_audio
+    """
+    engine = engine or TTS_ENGINE
+    if engine not in TTS_ENGINES:
+        raise ValueError(f"Invalid text to speech engine: {engine}")
+
+    if engine == 'local':
+        TTS_BACKENDS['local'].synthesize(text, filename)
+        return {'engine': 'local', 'streamed': False}
+
+    if engine == 'gemini':
+        try:
+            streamed = TTS_BACKENDS['gemini'].synthesize(text, filename, on_audio)
+            return {'engine': 'gemini', 'streamed': streamed}
+        except Exception as e:
+            print(f"Cloud text to speech failed, using the local voice: {e}")
+            TTS_BACKENDS['local'].synthesize(text, filename)
+            return {'engine': 'local', 'streamed': False}
+
+    return synthesize_hedged(text, filename, on_audio)
+
+
+def synthesize_hedged(text, filename, on_audio=None, deadline=None):
+    deadline = TTS_HEDGE_DEADLINE if deadline is None else deadline
+    state = {'winner': None}
+    lock = threading.Lock()
+    cloud_audio = threading.Event()
+
+    def claim(name):
+        with lock:
+            if state['winner'] is None:
+                state['winner'] = name
+            return state['winner'] == name
+
+    def cloud_chunk(chunk):
+        # the cloud voice wins as soon as it starts streaming, unless the local voice already finished
+        if not cloud_audio.is_set():
+            cloud_audio.set()
+            claim('gemini')
+        if state['winner'] == 'gemini':
+            on_audio(chunk)
+
+    # the loser keeps running after this returns, so its file must not be one a later call could use
+    call_id = uuid.uuid4().hex[:8]
+    candidate_files = {name: f"{filename}.{name}.{call_id}.tmp" for name in TTS_BACKENDS}
+
+    def run(name):
+        backend = TTS_BACKENDS[name]
+        backend.synthesize(text, candidate_files[name], cloud_chunk if (name == 'gemini' and on_audio) else None)
+        if claim(name):
+            os.replace(candidate_files[name], filename)
+        elif os.path.exists(candidate_files[name]):
+            os.remove(candidate_files[name])
+        return name
+
+    start = time.time()
+    cloud = TTS_POOL.submit(carry_deadline(run), 'gemini')
+    futures = [cloud]
+    done, _ = wait(futures, timeout=deadline)
+    if not done and not cloud_audio.is_set():
+        print(f"Cloud text to speech has taken over {deadline} seconds, starting the local voice as well")
+        futures.append(TTS_POOL.submit(run, 'local'))
+
+    # wait until one of them has succeeded, or all of them have failed
+    errors = []
+    pending = set(futures)
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception():
+                print(f"{'Cloud' if future is cloud else 'Local'} text to speech failed: {future.exception()}")
+                errors.append(future.exception())
+                if future is cloud:
+                    with lock:
+                        if state['winner'] == 'gemini':
+                            state['winner'] = None  # it failed part way through streaming, let the local voice win
+        if state['winner'] == 'gemini' and cloud.done() and not cloud.exception():
+            break
+        if state['winner'] == 'local' and os.path.exists(filename):
+            break
+        if len(futures) == 1 and cloud.done() and cloud.exception():
+            # the cloud voice failed before the deadline, fall back to the local voice right away
+            futures.append(TTS_POOL.submit(run, 'local'))
+            pending = {futures[-1]}
+
+    if state['winner'] is None or not os.path.exists(filename):
+        raise IOError(f"Unable to generate forecast audio: {errors[-1] if errors else 'unknown error'}")
+
+    print(f"Text to speech won by the {state['winner']} voice in {round(time.time() - start, 1)} seconds")
+    return {'engine': state['winner'], 'streamed': state['winner'] == 'gemini' and on_audio is not None}
+
+
+def create_wave_file(filename, data, channels=1, rate=24000, sample_width=2):
+    ensure_cache_dir()
+    with span('wav_write'), wave.open(filename, "wb") as wf:
+        wf.setnchannels(channels)
+        wf.setsampwidth(sample_width)
+        wf.setframerate(rate)
+        wf.writeframes(data)
+
+
+def create_wave_file_from_stream(filename, chunks, on_chunk=None, channels=1, rate=24000, sample_width=2):
+    """
+    Write PCM chunks to a WAV file as they arrive, passing each one to on_chunk as well.
+    The file only replaces filename once the stream has completed.
+    """
+    ensure_cache_dir()
+    partial_filename = filename + '.part'
+    try:
+        with wave.open(partial_filename, "wb") as wf:
+            wf.setnchannels(channels)
+            wf.setsampwidth(sample_width)
+            wf.setframerate(rate)
+            for chunk in chunks:
+                wf.writeframes(chunk)
+                if on_chunk:
+                    on_chunk(chunk)
+        os.replace(partial_filename, filename)
+    finally:
+        if os.path.exists(partial_filename):
+            os.remove(partial_filename)
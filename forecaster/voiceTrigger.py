@@ -0,0 +1,302 @@
+import json
+import math
+import os
+import wave
+import warnings
+from array import array
+
+try:
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', DeprecationWarning)
+        import audioop  # C implementation of the RMS, gone in Python 3.13
+except ImportError:
+    audioop = None
+
+try:
+    from .metrics import count, span
+except ImportError:
+    from metrics import count, span
+
+VOICE_TRIGGER = os.getenv('VOICE_TRIGGER', '0') == '1'
+VOICE_RATE = int(os.getenv('VOICE_RATE', '16000'))
+VOICE_CHANNELS = int(os.getenv('VOICE_CHANNELS', '1'))  # only the first channel is listened to
+VOICE_INPUT_DEVICE = os.getenv('VOICE_INPUT_DEVICE')  # pyaudio input device index, the default input if unset
+VOICE_ENERGY_RATIO = float(os.getenv('VOICE_ENERGY_RATIO', '3'))  # a frame is loud when it's this many times the noise floor
+VOICE_MIN_ENERGY = int(os.getenv('VOICE_MIN_ENERGY', '300'))  # ...and at least this loud (16 bit RMS), however quiet the room is
+VOSK_MODEL = os.getenv('VOSK_MODEL', '')  # vosk model directory, e.g. vosk-model-small-en-us-0.15
+VOICE_FRAME_MS = 30
+VOICE_PREROLL_MS = 300  # audio from before the gate opened that is given to the recognizer, so the start of a word isn't lost
+VOICE_MIN_LOUD_MS = 120  # loud audio needed to open the gate; shorter clicks and knocks never reach the recognizer
+VOICE_HANGOVER_MS = 400  # quiet that ends a phrase
+VOICE_MAX_PHRASE_MS = 2500
+ENERGY_STRIDE = 4  # without audioop, only every 4th sample is used for the RMS
+NOISE_FLOOR_ADAPT = 0.05
+VOICE_DAYS = ['today', 'tomorrow', 'sunday', 'monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday']
+
+
+class RingBuffer:
+    """A fixed number of equal sized frames kept in one preallocated bytearray; the oldest frame is overwritten."""
+
+    def __init__(self, capacity, frame_bytes):
+        self.capacity = capacity
+        self.frame_bytes = frame_bytes
+        self._data = bytearray(capacity * frame_bytes)
+        self._next = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def write(self, frame):
+        offset = self._next * self.frame_bytes
+        self._data[offset:offset + self.frame_bytes] = frame
+        self._next = (self._next + 1) % self.capacity
+        self._count = min(self._count + 1, self.capacity)
+
+    def frames(self):
+        """
+        Returns:
+          the frames in the buffer, oldest first
+        """
+        first = self._next - self._count
+        return [self._frame((first + i) % self.capacity) for i in range(self._count)]
+
+    def _frame(self, index):
+        offset = index * self.frame_bytes
+        return bytes(self._data[offset:offset + self.frame_bytes])
+
+    def clear(self):
+        self._next = 0
+        self._count = 0
+
+
+def frame_energy(frame):
+    """RMS of a frame of 16 bit mono PCM."""
+    if audioop:
+        return audioop.rms(frame, 2)
+    samples = array('h', frame)[::ENERGY_STRIDE]
+    if not samples:
+        return 0
+    return math.sqrt(sum(s * s for s in samples) / len(samples))
+
+
+class EnergyGate:
+    """
+    Decides whether a frame is loud compared to a noise floor that follows the quiet frames, so a
+    fan or the room tone doesn't keep the gate open. This runs on every frame, so it has to be cheap.
+    """
+
+    def __init__(self, ratio=VOICE_ENERGY_RATIO, min_energy=VOICE_MIN_ENERGY):
+        self.ratio = ratio
+        self.min_energy = min_energy
+        self.noise_floor = None
+
+    def is_loud(self, frame):
+        energy = frame_energy(frame)
+        if self.noise_floor is None:
+            self.noise_floor = energy
+        loud = energy >= max(self.min_energy, self.noise_floor * self.ratio)
+        if not loud:
+            self.noise_floor += (energy - self.noise_floor) * NOISE_FLOOR_ADAPT
+        return loud
+
+
+class VoskKeywords:
+    """Offline speech recognition limited to a grammar of the trigger words, which keeps a small vosk model fast enough for a Pi Zero."""
+
+    def __init__(self, model_path=None, rate=VOICE_RATE):
+        from vosk import KaldiRecognizer, Model, SetLogLevel
+
+        SetLogLevel(-1)
+        model_path = model_path or VOSK_MODEL
+        if not model_path or not os.path.isdir(model_path):
+            raise IOError(f"No vosk model found at {model_path!r}, set VOSK_MODEL")
+        self._recognizer = KaldiRecognizer(Model(model_path), rate, json.dumps(VOICE_DAYS + ['[unk]']))
+
+    def accept(self, frame):
+        self._recognizer.AcceptWaveform(frame)
+
+    def finish(self):
+        """
+        Returns:
+          the words heard since the last finish()
+        """
+        return json.loads(self._recognizer.FinalResult()).get('text', '')
+
+
+def create_recognizer(rate=VOICE_RATE):
+    """
+    Returns:
+      a VoskKeywords recognizer, or None (after logging why) if vosk or its model isn't available; the
+      energy gate alone can't tell a word from a door slam or the TV, so there is no trigger without it
+    """
+    if not VOSK_MODEL:
+        print("  VOICE_TRIGGER is on but VOSK_MODEL isn't set, voice trigger disabled")
+        return None
+    try:
+        return VoskKeywords(rate=rate)
+    except ImportError:
+        print("  VOICE_TRIGGER is on but the optional vosk package isn't installed (pip install vosk), voice trigger disabled")
+    except IOError as e:
+        print(f"  {e}, voice trigger disabled")
+    return None
+
+
+def keyword_day(text):
+    """
+    Returns:
+      the first of VOICE_DAYS in text, as a date option for get_forecast_data(), or None
+    """
+    for word in text.lower().split():
+        if word in VOICE_DAYS:
+            return word
+    return None
+
+
+class VoiceTrigger:
+    """
+    Listens to a stream of fixed size frames of 16 bit mono PCM. The energy gate looks at every frame;
+    the recognizer only sees the frames of a phrase (plus the pre-roll from the ring buffer), from the
+    point the gate has been open for VOICE_MIN_LOUD_MS until VOICE_HANGOVER_MS of quiet.
+
+    Args:
+      recognizer: object with accept(frame) and finish() -> text, e.g. VoskKeywords
+    """
+
+    def __init__(self, recognizer, rate=VOICE_RATE, frame_ms=VOICE_FRAME_MS, gate=None):
+        self.recognizer = recognizer
+        self.gate = gate or EnergyGate()
+        self.frame_bytes = int(rate * frame_ms / 1000) * 2
+        frames = lambda ms: max(1, round(ms / frame_ms))
+        self.min_loud_frames = frames(VOICE_MIN_LOUD_MS)
+        self.hangover_frames = frames(VOICE_HANGOVER_MS)
+        self.max_phrase_frames = frames(VOICE_MAX_PHRASE_MS)
+        self.preroll = RingBuffer(frames(VOICE_PREROLL_MS) + self.min_loud_frames, self.frame_bytes)
+        self.frames = 0
+        self.recognized_frames = 0
+        self.phrases = 0
+        self._active = False
+        self._loud_run = 0
+        self._phrase_frames = 0
+        self._quiet_frames = 0
+
+    def feed(self, frame):
+        """
+        Returns:
+          the date option ('today', 'tomorrow', or a weekday) if a phrase asking for one just ended, otherwise None
+        """
+        self.frames += 1
+        loud = self.gate.is_loud(frame)
+
+        if not self._active:
+            self.preroll.write(frame)
+            self._loud_run = self._loud_run + 1 if loud else 0
+            if self._loud_run < self.min_loud_frames:
+                return None
+            self._active = True
+            self._phrase_frames = 0
+            self._quiet_frames = 0
+            for buffered in self.preroll.frames():
+                self._accept(buffered)
+            self.preroll.clear()
+            return None
+
+        self._accept(frame)
+        self._quiet_frames = 0 if loud else self._quiet_frames + 1
+        if self._quiet_frames < self.hangover_frames and self._phrase_frames < self.max_phrase_frames:
+            return None
+        return self._finish_phrase()
+
+    def _accept(self, frame):
+        self._phrase_frames += 1
+        self.recognized_frames += 1
+        self.recognizer.accept(frame)
+
+    def _finish_phrase(self):
+        self._active = False
+        self._loud_run = 0
+        self.phrases += 1
+        count('voice_phrases')
+        with span('voice_keyword'):
+            text = self.recognizer.finish()
+        day = keyword_day(text)
+        if day:
+            count('voice_triggers')
+        print(f"  heard {text!r}" + (f", getting the forecast for {day}" if day else ''))
+        return day
+
+    def reset(self):
+        """Forget any phrase in progress, e.g. while the forecast is playing (so it can't trigger itself)."""
+        if self._active:
+            self.recognizer.finish()
+        self._active = False
+        self._loud_run = 0
+        self.preroll.clear()
+
+
+def to_mono(pcm, channels):
+    if channels == 1:
+        return pcm
+    return array('h', pcm)[::channels].tobytes()
+
+
+def read_wav(filename):
+    """
+    Returns:
+      (sample rate, 16 bit mono PCM) of a recorded WAV file, using its first channel
+    """
+    with wave.open(filename, 'rb') as wf:
+        if wf.getsampwidth() != 2:
+            raise ValueError(f"{filename} is not 16 bit PCM")
+        return wf.getframerate(), to_mono(wf.readframes(wf.getnframes()), wf.getnchannels())
+
+
+def split_frames(pcm, frame_bytes):
+    """Yield fixed size frames of pcm, padding the last one with silence."""
+    for offset in range(0, len(pcm), frame_bytes):
+        frame = pcm[offset:offset + frame_bytes]
+        yield frame + bytes(frame_bytes - len(frame))
+
+
+def microphone_frames(frame_bytes, stop_event, rate=VOICE_RATE, channels=VOICE_CHANNELS, device=VOICE_INPUT_DEVICE):
+    """Yield mono frames from the microphone (the Voice Bonnet's, on the Pi) until stop_event is set."""
+    import pyaudio
+
+    audio = pyaudio.PyAudio()
+    frames_per_buffer = frame_bytes // 2
+    stream = audio.open(
+        format=pyaudio.paInt16,
+        channels=channels,
+        rate=rate,
+        input=True,
+        input_device_index=int(device) if device else None,
+        frames_per_buffer=frames_per_buffer
+    )
+    try:
+        while not stop_event.is_set():
+            yield to_mono(stream.read(frames_per_buffer, exception_on_overflow=False), channels)
+    finally:
+        stream.stop_stream()
+        stream.close()
+        audio.terminate()
+
+
+def listen_for_voice(on_trigger, is_busy, stop_event):
+    """
+    Listen to the microphone and call on_trigger(day) when someone asks for a forecast. Frames are
+    dropped without any processing while is_busy() (a forecast is being fetched or played).
+    """
+    try:
+        recognizer = create_recognizer()
+        if recognizer is None:
+            return
+        trigger = VoiceTrigger(recognizer)
+        for frame in microphone_frames(trigger.frame_bytes, stop_event):
+            if is_busy():
+                trigger.reset()
+                continue
+            day = trigger.feed(frame)
+            if day:
+                on_trigger(day)
+    except Exception as e:
+        print(f"  ERROR listening for voice triggers: {e}")
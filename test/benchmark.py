@@ -0,0 +1,147 @@
+import sys
+import os
+import argparse
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta
+from fakeUpstreams import UPSTREAM_CALLS, fake_genai, quietly, start_fake_upstreams
+
+# Runs get_forecast_data() end to end against local stand-ins for the Open-Meteo forecast and archive APIs
+# and for Gemini text and TTS, with injected latencies, and reports per-scenario latency distributions,
+# bytes downloaded and parsed, upstream calls, and cache file sizes. Nothing here touches the real APIs
+# or the device's cache (a temporary CACHE_DIR is used).
+#
+#   python test/benchmark.py --runs 20 --forecast-latency 300 --archive-latency 800 --text-latency 2000 --tts-latency 3000
+
+parser = argparse.ArgumentParser(description='Benchmark the forecast pipeline against fake upstream services')
+parser.add_argument('--runs', type=int, default=10, help='requests per scenario')
+parser.add_argument('--forecast-latency', type=float, default=50, help='ms added to each Open-Meteo forecast response')
+parser.add_argument('--archive-latency', type=float, default=100, help='ms added to each Open-Meteo archive response')
+parser.add_argument('--text-latency', type=float, default=200, help='ms for each Gemini forecast text call')
+parser.add_argument('--tts-latency', type=float, default=300, help='ms for each Gemini TTS call')
+parser.add_argument('--audio-seconds', type=float, default=20, help='length of the fake spoken forecast')
+parser.add_argument('--scenarios', default='cold,warm,stale,expired,multi-date', help='comma separated scenarios to run')
+args = parser.parse_args()
+
+CACHE_DIR = tempfile.mkdtemp(prefix='forecaster-benchmark-')
+server = start_fake_upstreams(
+    forecast_latency=args.forecast_latency,
+    archive_latency=args.archive_latency,
+    text_latency=args.text_latency,
+    tts_latency=args.tts_latency,
+    audio_seconds=args.audio_seconds
+)
+os.environ.update({'CACHE_DIR': CACHE_DIR, 'METRICS_LOG': '0', 'METRICS_FILE': ''})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from forecaster import cacheStore, clients, getWeather, metrics
+
+clients.use_genai_client(*fake_genai())
+
+
+def reset_caches():
+    store = cacheStore._store
+    if isinstance(store, cacheStore.SqliteCacheStore):
+        store._conn.close()
+    cacheStore._store = None
+    cacheStore._last_purge = 0
+    getWeather.HOURLY_DATA_CACHE.clear()
+    getWeather.CLIMATOLOGY_CACHE.clear()
+    shutil.rmtree(CACHE_DIR, ignore_errors=True)
+
+
+def expire_forecasts(past_stale):
+    store = cacheStore.get_cache_store()
+    now_ts = int(time.time())
+    for forecast_date, coord, entry in list(store.forecast_entries()):
+        exp = now_ts - (cacheStore.FORECAST_MAX_STALE + 60 if past_stale else 60)
+        store.put_forecast(forecast_date, coord, {**entry, 'exp': exp})
+
+
+def wait_for_background_refreshes():
+    while getWeather.BACKGROUND_REFRESHES.in_flight():
+        time.sleep(0.01)
+
+
+def cache_sizes():
+    sizes = {}
+    for name in os.listdir(CACHE_DIR) if os.path.isdir(CACHE_DIR) else []:
+        kind = 'audio' if name.endswith('.wav') else os.path.splitext(name)[1].lstrip('.') or name
+        sizes[kind] = sizes.get(kind, 0) + os.path.getsize(os.path.join(CACHE_DIR, name))
+    return sizes
+
+
+# each scenario prepares the caches for run i and returns the options to request (warm-up requests count towards the upstream calls)
+def cold(i):
+    reset_caches()
+    return [{'date': 'tomorrow'}]
+
+
+def warm(i):
+    if i == 0:
+        reset_caches()
+        quietly(getWeather.get_forecast_data, {'date': 'tomorrow'})
+    return [{'date': 'tomorrow'}]
+
+
+def stale(i):
+    quietly(wait_for_background_refreshes)
+    if i == 0:
+        reset_caches()
+        quietly(getWeather.get_forecast_data, {'date': 'tomorrow'})
+    expire_forecasts(past_stale=False)
+    return [{'date': 'tomorrow'}]
+
+
+def expired(i):
+    # the hourly data is downloaded again, but the weather hasn't changed so incremental refresh keeps the text and audio
+    if i == 0:
+        reset_caches()
+        quietly(getWeather.get_forecast_data, {'date': 'tomorrow'})
+    expire_forecasts(past_stale=True)
+    getWeather.HOURLY_DATA_CACHE.clear()
+    return [{'date': 'tomorrow'}]
+
+
+def multi_date(i):
+    reset_caches()
+    today = datetime.now()
+    return [{'date': (today + timedelta(days=d)).strftime('%Y-%m-%d')} for d in range(7)]
+
+
+SCENARIOS = {'cold': cold, 'warm': warm, 'stale': stale, 'expired': expired, 'multi-date': multi_date}
+
+
+def run(name, setup):
+    latencies = []
+    statuses = {}
+    calls_before = dict(UPSTREAM_CALLS)
+    bytes_before = metrics.get_counters('open_meteo_')
+    for i in range(args.runs):
+        for options in setup(i):
+            start = time.perf_counter()
+            result = quietly(getWeather.get_forecast_data, options)
+            latencies.append((time.perf_counter() - start) * 1000)
+            statuses[result['cacheStatus']] = statuses.get(result['cacheStatus'], 0) + 1
+    quietly(wait_for_background_refreshes)
+    bytes_after = metrics.get_counters('open_meteo_')
+    downloaded = sum(bytes_after.get(k, 0) - bytes_before.get(k, 0) for k in bytes_after)
+    calls = {k: UPSTREAM_CALLS[k] - calls_before[k] for k in UPSTREAM_CALLS if UPSTREAM_CALLS[k] != calls_before[k]}
+    return latencies, statuses, downloaded, calls
+
+
+print(f"Fake latencies (ms): forecast {args.forecast_latency}, archive {args.archive_latency}, text {args.text_latency}, tts {args.tts_latency}; cache in {CACHE_DIR}\n")
+print(f"{'scenario':11} {'n':>4} {'min ms':>8} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} {'KB parsed':>10}  cache status / upstream calls / cache files")
+try:
+    for name in args.scenarios.split(','):
+        latencies, statuses, downloaded, calls = run(name, SCENARIOS[name])
+        sizes = ', '.join(f"{kind} {size / 1024:.0f}KB" for kind, size in sorted(cache_sizes().items()))
+        print(f"{name:11} {len(latencies):4d} {min(latencies):8.1f} {metrics.percentile(latencies, 0.5):8.1f} {metrics.percentile(latencies, 0.95):8.1f} {max(latencies):8.1f} {downloaded / 1024:10.1f}  {statuses} / {calls} / {sizes}")
+
+    print("\nStage timings over all scenarios:")
+    print(f"  {'stage':28} {'count':>6} {'p50 ms':>8} {'p95 ms':>8}")
+    for stage, summary in metrics.get_stage_summary().items():
+        print(f"  {stage:28} {summary['count']:6d} {summary['p50'] * 1000:8.1f} {summary['p95'] * 1000:8.1f}")
+finally:
+    server.shutdown()
+    reset_caches()
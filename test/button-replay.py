@@ -0,0 +1,27 @@
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from forecaster.buttonInput import ButtonWatcher, SimulatedClock, SimulatedPin, press_day
+
+# (start, duration) in seconds, with 5ms of contact bounce on every press and release
+PRESSES = [(1.0, 0.2), (3.0, 1.2), (5.0, 1.7), (9.0, 3.0), (13.0, 0.08), (14.0, 0.03)]
+EXPECTED = ['today', 'today', 'tomorrow', 'tomorrow', 'today']  # the 30ms tap is filtered by the debounce
+
+clock = SimulatedClock()
+pin = SimulatedPin(PRESSES, clock.time, bounce=0.005)
+days = []
+
+def on_press(duration):
+    day = press_day(duration)
+    print("  t=" + str(round(clock.time(), 2)) + " held for " + str(round(duration, 3)) + " seconds: " + day)
+    days.append(day)
+
+watcher = ButtonWatcher(pin, on_press, clock=clock.time, sleep=clock.sleep)
+polls = 0
+while clock.time() < 16:
+    watcher.poll()
+    clock.sleep(watcher.poll_interval)
+    polls += 1
+
+print(str(polls) + " polls over " + str(round(clock.time())) + " simulated seconds")
+print("PASS" if days == EXPECTED else "FAIL: expected " + str(EXPECTED) + " but got " + str(days))
@@ -0,0 +1,166 @@
+import builtins
+import hashlib
+import json
+import math
+import os
+import random
+import threading
+import time
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlparse
+
+# Local stand-ins for the Open-Meteo forecast and archive APIs and for the Gemini client, shared by
+# test/benchmark.py, test/soak.py, and test/resilience.py. Call start_fake_upstreams() before importing the forecaster modules
+# (it sets the Open-Meteo URLs and GEN_AI_KEY in the environment), then hand fake_genai() to
+# clients.use_genai_client().
+
+UPSTREAM_CALLS = {'forecast': 0, 'archive': 0, 'gemini_text': 0, 'gemini_tts': 0}
+SETTINGS = {'forecast_latency': 50, 'archive_latency': 100, 'text_latency': 200, 'tts_latency': 300, 'audio_seconds': 20, 'variation': 0}
+FAILURES = {'forecast': 0, 'archive': 0, 'gemini_text': 0, 'gemini_tts': 0}  # upcoming calls to each upstream that fail with a 503
+HOURLY_FIELDS = ['temperature_2m', 'apparent_temperature', 'precipitation_probability', 'precipitation', 'uv_index', 'cloud_cover', 'relative_humidity_2m', 'wind_speed_10m', 'wind_direction_10m', 'wind_gusts_10m']
+
+
+def fake_hourly(start, end):
+    hours = ((end - start).days + 1) * 24
+    # with a variation, every response is a little different, as if the forecast had been updated
+    shift = random.uniform(-SETTINGS['variation'], SETTINGS['variation'])
+    hourly = {'time': [(datetime(start.year, start.month, start.day) + timedelta(hours=i)).strftime('%Y-%m-%dT%H:%M') for i in range(hours)]}
+    for n, field in enumerate(HOURLY_FIELDS):
+        hourly[field] = [round(50 + 15 * math.sin((i % 24 - 9) / 24 * 2 * math.pi) + n + shift, 1) for i in range(hours)]
+    hourly['precipitation_probability'] = [60 if 40 <= i % 96 <= 46 else 5 for i in range(hours)]
+    hourly['weather_code'] = [61 if 40 <= i % 96 <= 46 else (3 if i % 7 == 0 else 1) for i in range(hours)]
+    return {'hourly': hourly}
+
+
+def should_fail(upstream):
+    if FAILURES[upstream] > 0:
+        FAILURES[upstream] -= 1
+        return True
+    return False
+
+
+class FakeServerError(Exception):
+    """Like google.genai.errors.ServerError, it has the HTTP status as code."""
+    code = 503
+
+
+def fake_daily(start, end):
+    days = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+    return {'daily': {
+        'time': [d.isoformat() for d in days],
+        'temperature_2m_max': [round(60 + 20 * math.sin((d.timetuple().tm_yday - 100) / 365 * 2 * math.pi), 1) for d in days],
+        'temperature_2m_min': [round(42 + 18 * math.sin((d.timetuple().tm_yday - 100) / 365 * 2 * math.pi), 1) for d in days]
+    }}
+
+
+class FakeOpenMeteo(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        start, end = date.fromisoformat(query['start_date'][0]), date.fromisoformat(query['end_date'][0])
+        locations = query['latitude'][0].split(',')
+        upstream = 'forecast' if url.path == '/v1/forecast' else 'archive'
+        UPSTREAM_CALLS[upstream] += 1
+        time.sleep(SETTINGS[f"{upstream}_latency"] / 1000)
+        if should_fail(upstream):
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if upstream == 'forecast':
+            entries = [fake_hourly(start, end) for _ in locations]
+        else:
+            entries = [fake_daily(start, end) for _ in locations]
+        body = json.dumps(entries if len(entries) > 1 else entries[0]).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *a):
+        pass
+
+
+class FakeModels:
+    """Stands in for genai.Client().models: forecast text, and TTS audio as a sine tone (whole or streamed)."""
+
+    def generate_content(self, model, contents, config=None):
+        if 'tts' in model:
+            UPSTREAM_CALLS['gemini_tts'] += 1
+            time.sleep(SETTINGS['tts_latency'] / 1000)
+            if should_fail('gemini_tts'):
+                raise FakeServerError('503 UNAVAILABLE')
+            return self.audio_chunk(self.tone(SETTINGS['audio_seconds']))
+        UPSTREAM_CALLS['gemini_text'] += 1
+        time.sleep(SETTINGS['text_latency'] / 1000)
+        if should_fail('gemini_text'):
+            raise FakeServerError('503 UNAVAILABLE')
+        payload = contents[1]['inlineData']['data']
+        digest = hashlib.sha256(payload.encode() if isinstance(payload, str) else payload).hexdigest()[:8]
+        return SimpleNamespace(text=f"Benchmark forecast {digest} for: {contents[0]['text'][:60]}")
+
+    def generate_content_stream(self, model, contents, config=None):
+        UPSTREAM_CALLS['gemini_tts'] += 1
+        time.sleep(SETTINGS['tts_latency'] / 1000 / 3)
+        if should_fail('gemini_tts'):
+            raise FakeServerError('503 UNAVAILABLE')
+        pcm = self.tone(SETTINGS['audio_seconds'])
+        for i in range(0, len(pcm), 24000 * 2):
+            time.sleep(0.01)
+            yield self.audio_chunk(pcm[i:i + 24000 * 2])
+
+    def tone(self, seconds):
+        return b''.join(int(3000 * math.sin(i * 440 * 2 * math.pi / 24000)).to_bytes(2, 'little', signed=True) for i in range(int(24000 * seconds)))
+
+    def audio_chunk(self, pcm):
+        part = SimpleNamespace(inline_data=SimpleNamespace(data=pcm))
+        return SimpleNamespace(candidates=[SimpleNamespace(content=SimpleNamespace(parts=[part]))])
+
+
+class FakeTypes:
+    GenerateContentConfig = SpeechConfig = VoiceConfig = PrebuiltVoiceConfig = HttpOptions = SimpleNamespace
+
+
+def start_fake_upstreams(**settings):
+    """
+    Start the fake Open-Meteo server and point the forecaster at it (and at a fake Gemini key).
+
+    Args:
+      settings: any of the SETTINGS keys; latencies are in milliseconds
+
+    Returns:
+      the running server, call shutdown() on it when done
+    """
+    SETTINGS.update(settings)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeOpenMeteo)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    os.environ.update({
+        'OPEN_METEO_FORECAST_URL': f"{base_url}/forecast",
+        'OPEN_METEO_ARCHIVE_URL': f"{base_url}/archive",
+        'GEN_AI_KEY': 'benchmark',
+        'TTS_ENGINE': 'gemini'
+    })
+    return server
+
+
+def fake_genai():
+    """
+    Returns:
+      (client, types) for clients.use_genai_client()
+    """
+    return SimpleNamespace(models=FakeModels()), FakeTypes
+
+
+def quietly(fn, *fn_args, **fn_kwargs):
+    """The pipeline logs every step with print(); keep the report readable."""
+    real_print = builtins.print
+    builtins.print = lambda *a, **k: None
+    try:
+        return fn(*fn_args, **fn_kwargs)
+    finally:
+        builtins.print = real_print
@@ -0,0 +1,95 @@
+import sys
+import os
+import base64
+import json
+import math
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from forecaster.getWeather import build_weather_data, get_weather_data, parse_input_and_validate
+from forecaster.hourlySeries import FIELD_MAP
+from forecaster.promptPayload import DAYS, PAYLOAD_FORMATS, build_payload
+
+# Compares the size of the weather data sent to the forecast model in each payload format.
+# Uses synthetic hourly data by default; pass --live to use real Open-Meteo data, and
+# --count-tokens to ask Gemini for real token counts (needs GEN_AI_KEY) instead of estimating them
+# as a quarter of the bytes. The "original" row is the payload as it was sent before the payload
+# formats were added: per-hour dicts without a time, and last year's averages, dumped with json.dumps().
+LIVE = '--live' in sys.argv
+COUNT_TOKENS = '--count-tokens' in sys.argv
+RUNS = 200
+
+
+def synthetic_hourly(start_date='2026-03-01'):
+    hourly = {k: [] for k in ['time', 'temperature_2m', 'apparent_temperature', 'precipitation_probability', 'precipitation', 'uv_index', 'cloud_cover', 'relative_humidity_2m', 'wind_speed_10m', 'wind_direction_10m', 'wind_gusts_10m', 'weather_code']}
+    for i in range(72):
+        day = int(start_date[-2:]) + i // 24
+        hourly['time'].append(f"{start_date[:-2]}{day:02d}T{i % 24:02d}:00")
+        temp = 45 + 12 * math.sin((i % 24 - 9) / 24 * 2 * math.pi) + i / 10
+        hourly['temperature_2m'].append(round(temp, 1))
+        hourly['apparent_temperature'].append(round(temp - 4.3, 1))
+        hourly['precipitation_probability'].append(70 if 30 <= i <= 38 else 3)
+        hourly['precipitation'].append(0.04 if 30 <= i <= 38 else 0.0)
+        hourly['uv_index'].append(round(max(0, 5 * math.sin((i % 24 - 6) / 12 * math.pi)), 2))
+        hourly['cloud_cover'].append(90 if 28 <= i <= 40 else 20)
+        hourly['relative_humidity_2m'].append(60 + (i % 24))
+        hourly['wind_speed_10m'].append(round(6 + 3 * math.sin(i / 5), 1))
+        hourly['wind_direction_10m'].append((180 + i * 7) % 360)
+        hourly['wind_gusts_10m'].append(round(12 + 6 * math.sin(i / 5), 1))
+        hourly['weather_code'].append(61 if 30 <= i <= 38 else (3 if 28 <= i <= 40 else 1))
+    return hourly
+
+
+def count_tokens(text):
+    if not COUNT_TOKENS:
+        return round(len(text) / 4)  # rough estimate for JSON-ish text
+    from forecaster.clients import get_genai_client
+    return get_genai_client().models.count_tokens(model="gemini-3-flash-preview", contents=text).total_tokens
+
+
+def original_payload(weather_data):
+    """The prompt data in the shape the forecaster originally built it, from the same hourly data."""
+    payload = {}
+    for day in DAYS:
+        series = weather_data[day]
+        columns = [(FIELD_MAP[field], series.values(field)) for field in series.fields]
+        hours = []
+        for i, (description, kind) in enumerate(zip(series.descriptions(), series.precipitation_types())):
+            hour = {name: values[i] for name, values in columns}
+            hour['weather description'] = description
+            if kind:
+                hour['precipitation type'] = kind
+            hours.append(hour)
+        payload[day] = hours
+    payload['current date and time'] = weather_data['current date and time']
+    normals = weather_data['normal temperatures']
+    payload['previous year weekly averages'] = {
+        'average low temperature': normals['normal low temperature'],
+        'average high temperature': normals['normal high temperature']
+    }
+    return payload
+
+
+if LIVE:
+    weather_data = get_weather_data(parse_input_and_validate({'date': 'tomorrow'}))
+else:
+    weather_data = build_weather_data(synthetic_hourly())
+weather_data['current date and time'] = 'March 02, 2026 08:00'
+weather_data['normal temperatures'] = {'normal low temperature': 34, 'normal high temperature': 52, 'years averaged': 5}
+
+results = [('original (json.dumps)', json.dumps(original_payload(weather_data)), None)]
+for payload_format in PAYLOAD_FORMATS:
+    start = time.perf_counter()
+    for _ in range(RUNS):
+        payload = build_payload(weather_data, payload_format)
+    build_ms = (time.perf_counter() - start) / RUNS * 1000
+    results.append((payload_format, json.dumps(payload, separators=(',', ':')), build_ms))
+
+baseline_bytes = len(results[0][1])
+tokens_heading = 'tokens' if COUNT_TOKENS else '~tokens'
+print(f"{'format':24} {'bytes':>7} {'base64':>7} {tokens_heading:>7} {'vs orig':>8} {'build ms':>9}")
+for name, text, build_ms in results:
+    encoded = base64.b64encode(text.encode())
+    build = f"{build_ms:9.3f}" if build_ms is not None else f"{'-':>9}"
+    print(f"{name:24} {len(text):7d} {len(encoded):7d} {count_tokens(text):7d} {len(text) / baseline_bytes:8.0%} {build}")
+if not COUNT_TOKENS:
+    print("~tokens are estimated as bytes / 4; pass --count-tokens for Gemini's counts")
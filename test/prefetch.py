@@ -0,0 +1,62 @@
+import sys
+import os
+import shutil
+import tempfile
+import time
+from fakeUpstreams import UPSTREAM_CALLS, fake_genai, quietly, start_fake_upstreams
+
+# Runs the prefetch scheduler's checks against the fake Open-Meteo and Gemini services from test/benchmark.py:
+# a missing forecast is generated, a forecast expiring within the lead time is regenerated (its expiration
+# moves out), and one that is neither is left alone.
+#
+#   python test/prefetch.py
+
+CACHE_DIR = tempfile.mkdtemp(prefix='forecaster-prefetch-')
+server = start_fake_upstreams(forecast_latency=5, archive_latency=5, text_latency=5, tts_latency=5, audio_seconds=1)
+os.environ.update({'CACHE_DIR': CACHE_DIR, 'METRICS_LOG': '0', 'METRICS_FILE': '', 'INCREMENTAL_REFRESH': '0'})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from forecaster import cacheStore, clients, getWeather
+from forecaster.prefetch import PrefetchScheduler
+
+clients.use_genai_client(*fake_genai())
+problems = []
+
+
+def check(ok, message):
+    print(f"  {'ok' if ok else 'FAILED'}: {message}")
+    if not ok:
+        problems.append(message)
+
+
+def cached_forecast(day):
+    return getWeather.get_cached_forecast(getWeather.parse_input_and_validate({'date': day}))
+
+
+scheduler = PrefetchScheduler(days=['today'], lead_time=600)
+try:
+    print("Nothing cached")
+    quietly(scheduler.check)
+    forecast = cached_forecast('today')
+    check(forecast is not None, 'forecast for today generated')
+
+    print("Cached forecast expires in 300 seconds, lead time is 600")
+    options = getWeather.parse_input_and_validate({'date': 'today'})
+    store = cacheStore.get_cache_store()
+    date = options['forecastDate'].strftime('%Y-%m-%d')
+    entry = store.get_forecast(date, options['coord'])
+    soon = int(time.time()) + 300
+    store.put_forecast(date, options['coord'], {**entry, 'exp': soon})
+    calls = UPSTREAM_CALLS['gemini_text']
+    quietly(scheduler.check)
+    check(UPSTREAM_CALLS['gemini_text'] == calls + 1, 'forecast text regenerated')
+    check(cached_forecast('today')['exp'] > soon + 600, f"expiration moved from +300 to +{cached_forecast('today')['exp'] - int(time.time())} seconds")
+
+    print("Cached forecast is fresh")
+    calls = dict(UPSTREAM_CALLS)
+    quietly(scheduler.check)
+    check(UPSTREAM_CALLS == calls, 'no upstream calls')
+finally:
+    server.shutdown()
+    shutil.rmtree(CACHE_DIR, ignore_errors=True)
+
+print("PASS" if not problems else "FAIL: " + ', '.join(problems))
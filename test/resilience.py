@@ -0,0 +1,130 @@
+import sys
+import os
+import shutil
+import tempfile
+import time
+from fakeUpstreams import FAILURES, SETTINGS, UPSTREAM_CALLS, fake_genai, quietly, start_fake_upstreams
+
+# Checks the retries, circuit breakers, and press deadline against the fake Open-Meteo and Gemini services
+# from test/benchmark.py, injecting 503s and a hung forecast request:
+#   - a forecast request that fails twice is retried and succeeds
+#   - Gemini text failing on every call opens its circuit, so the next forecast goes straight to the rules
+#     without calling Gemini, and a trial call closes the circuit again once Gemini is back
+#   - a hung forecast request is given up on when the press deadline runs out, and an expired cached
+#     forecast is played instead
+#   - Gemini TTS rejecting the API key isn't retried, but opens the circuit like any other failure
+#   - a bug (a TypeError) in an upstream call isn't retried or counted against the circuit
+#
+#   python test/resilience.py
+
+CACHE_DIR = tempfile.mkdtemp(prefix='forecaster-resilience-')
+server = start_fake_upstreams(forecast_latency=20, archive_latency=20, text_latency=20, tts_latency=20, audio_seconds=1)
+os.environ.update({
+    'CACHE_DIR': CACHE_DIR,
+    'METRICS_LOG': '0',
+    'METRICS_FILE': '',
+    'PREFETCH_ENABLED': '0',
+    'INCREMENTAL_REFRESH': '0',
+    'BREAKER_FAILURES': '3',
+    'BREAKER_RESET_SECONDS': '1',
+    'RETRY_BASE_DELAY': '0.05'
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from forecaster import cacheStore, clients, getWeather, metrics, resilience
+
+clients.use_genai_client(*fake_genai())
+problems = []
+
+
+def check(ok, message):
+    print(f"  {'ok' if ok else 'FAILED'}: {message}")
+    if not ok:
+        problems.append(message)
+
+
+def calls_during(fn, *fn_args, **fn_kwargs):
+    before = dict(UPSTREAM_CALLS)
+    result = quietly(fn, *fn_args, **fn_kwargs)
+    return result, {name: UPSTREAM_CALLS[name] - before[name] for name in UPSTREAM_CALLS}
+
+
+try:
+    print("Forecast request fails twice with a 503")
+    FAILURES['forecast'] = 2
+    data, calls = calls_during(getWeather.get_forecast_data, {'date': 'tomorrow'}, refresh=True)
+    check(calls['forecast'] == 3 and data['forecast'], f"retried into a forecast with {calls['forecast']} forecast requests")
+    check(resilience.BREAKERS['open_meteo_forecast'].state == 'closed', 'forecast circuit is still closed')
+
+    print("Gemini text fails on every call")
+    FAILURES['gemini_text'] = 1000
+    data, calls = calls_during(getWeather.get_forecast_data, {'date': 'today'}, refresh=True)
+    check(calls['gemini_text'] == 3 and not data['forecast'].startswith('Benchmark forecast'), f"{calls['gemini_text']} Gemini text calls, then the rule-based forecast")
+    check(resilience.BREAKERS['gemini_text'].state == 'open', 'Gemini text circuit opened')
+    data, calls = calls_during(getWeather.get_forecast_data, {'date': 'today'}, refresh=True)
+    check(calls['gemini_text'] == 0 and data['forecast'], 'next forecast went straight to the rules without calling Gemini')
+    check('forecaster_breaker_state{upstream="gemini_text"} 2' in metrics.prometheus_text(), 'open circuit is in the Prometheus text')
+
+    print("Gemini text is back")
+    FAILURES['gemini_text'] = 0
+    time.sleep(resilience.BREAKER_RESET + 0.1)
+    data, calls = calls_during(getWeather.get_forecast_data, {'date': 'today'}, refresh=True)
+    check(calls['gemini_text'] == 1 and data['forecast'].startswith('Benchmark forecast'), 'trial call made and its forecast used')
+    check(resilience.get_breaker_status()['gemini_text']['state'] == 'closed', 'Gemini text circuit closed again')
+
+    print("Forecast request hangs for 10 seconds, with a 3 second press deadline")
+    store = cacheStore.get_cache_store()
+    for forecast_date, coord, entry in list(store.forecast_entries()):
+        store.put_forecast(forecast_date, coord, {**entry, 'exp': int(time.time()) - cacheStore.FORECAST_MAX_STALE - 60})
+    getWeather.HOURLY_DATA_CACHE.clear()
+    SETTINGS['forecast_latency'] = 10000
+    start = time.perf_counter()
+    with resilience.deadline(3):
+        data, calls = calls_during(getWeather.get_forecast_data, {'date': 'today'})
+    elapsed = time.perf_counter() - start
+    check(elapsed < 3.5, f"answered in {elapsed:.1f} seconds")
+    check(data['cacheStatus'] == 'stale', f"played the expired cached forecast ({data['cacheStatus']})")
+    start = time.perf_counter()
+    try:
+        with resilience.deadline(3):
+            quietly(getWeather.get_forecast_data, {'date': 'tomorrow'}, refresh=True)
+        check(False, "refresh without a fallback should have failed")
+    except IOError as e:
+        check(time.perf_counter() - start < 3.5, f"refresh (which has no fallback) failed in {time.perf_counter() - start:.1f} seconds: {e}")
+
+    print("Gemini TTS rejects the API key")
+    attempts = []
+
+    def rejected(timeout):
+        attempts.append(timeout)
+        raise resilience.UpstreamError('401 UNAUTHENTICATED', 401)
+
+    for _ in range(resilience.BREAKER_FAILURES + 1):
+        try:
+            quietly(resilience.call_upstream, 'gemini_tts', rejected)
+        except IOError:
+            pass
+    check(len(attempts) == resilience.BREAKER_FAILURES, f"{len(attempts)} calls without retries, then failing fast")
+    check(resilience.BREAKERS['gemini_tts'].state == 'open', 'Gemini TTS circuit opened')
+
+    print("Gemini text call hits a bug")
+    attempts = []
+
+    def broken(timeout):
+        attempts.append(timeout)
+        raise TypeError("'NoneType' object is not subscriptable")
+
+    try:
+        quietly(resilience.call_upstream, 'gemini_text', broken)
+    except TypeError:
+        pass
+    check(len(attempts) == 1, f"{len(attempts)} calls, without retries")
+    check(resilience.BREAKERS['gemini_text'].failures == 0, 'not counted against the Gemini text circuit')
+
+    print(f"\nupstream calls: {UPSTREAM_CALLS}")
+    print(f"breakers: {resilience.get_breaker_status()}")
+    print(f"counters: {metrics.get_counters()}")
+finally:
+    server.shutdown()
+    shutil.rmtree(CACHE_DIR, ignore_errors=True)
+
+print("PASS" if not problems else "FAIL: " + ', '.join(problems))
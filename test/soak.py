@@ -0,0 +1,162 @@
+import sys
+import os
+import argparse
+import importlib
+import random
+import resource
+import shutil
+import tempfile
+import time
+from fakeUpstreams import UPSTREAM_CALLS, fake_genai, quietly, start_fake_upstreams
+
+# Soak test for the button service: runs forecaster.py on simulated hardware (HARDWARE=simulated) against
+# the fake Open-Meteo and Gemini services, replaying thousands of scripted presses (short for today, long
+# for tomorrow) spread over many simulated hours. Simulated time ages the cached forecasts, hourly data,
+# and audio files, so forecasts expire, are served stale, refreshed, and evicted as they would be on the Pi.
+# Reports press to first audio (real time), CPU time, RSS, and cache directory size as the run goes, to
+# catch leaks and anything that slows down as the caches grow. CPU time includes the fake services.
+#
+#   python test/soak.py --presses 5000 --hours 72 --cache-backend json
+
+parser = argparse.ArgumentParser(description='Replay scripted button presses against the forecaster on simulated hardware')
+parser.add_argument('--presses', type=int, default=2000)
+parser.add_argument('--hours', type=float, default=48, help='simulated hours the presses are spread over')
+parser.add_argument('--long-presses', type=float, default=0.3, help='fraction of presses that are long (tomorrow)')
+parser.add_argument('--report-every', type=int, default=250, help='presses between progress lines')
+parser.add_argument('--variation', type=float, default=3, help='degrees the fake forecast changes by on each download')
+parser.add_argument('--cache-backend', default='sqlite', choices=['sqlite', 'json'])
+parser.add_argument('--playback', default='aplay', choices=['aplay', 'stream'], help='PLAYBACK_MODE to simulate')
+parser.add_argument('--max-rss-growth', type=float, default=20, help='MB the RSS may grow after the first report before failing')
+parser.add_argument('--seed', type=int, default=1)
+args = parser.parse_args()
+
+random.seed(args.seed)
+AGE_STEP = 300  # simulated seconds between moving the caches' timestamps back
+CACHE_DIR = tempfile.mkdtemp(prefix='forecaster-soak-')
+server = start_fake_upstreams(forecast_latency=5, archive_latency=10, text_latency=20, tts_latency=30, audio_seconds=5, variation=args.variation)
+os.environ.update({
+    'CACHE_DIR': CACHE_DIR,
+    'CACHE_BACKEND': args.cache_backend,
+    'CACHE_PURGE_INTERVAL_MINUTES': '0',  # purge timing is real time, so let every write purge
+    'PLAYBACK_MODE': args.playback,
+    'HARDWARE': 'simulated',
+    'PREFETCH_ENABLED': '0',
+    'METRICS_LOG': '0',
+    'METRICS_FILE': ''
+})
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'forecaster'))
+from buttonInput import LONG_PRESS_SECONDS, ButtonWatcher, SimulatedClock, press_day
+import cacheStore
+import clients
+import getWeather
+import hardware
+from metrics import percentile
+
+clock = SimulatedClock()
+presses = []
+gap = args.hours * 3600 / args.presses
+for i in range(args.presses):
+    duration = random.uniform(LONG_PRESS_SECONDS + 0.2, 3) if random.random() < args.long_presses else random.uniform(0.1, 1)
+    presses.append((i * gap + random.uniform(0, gap / 2), duration))
+
+device = hardware.SimulatedHardware(clock=clock.time, sleep=clock.sleep, presses=presses)
+hardware.use_hardware(device)
+clients.use_genai_client(*fake_genai())
+forecaster = quietly(importlib.import_module, 'forecaster')
+
+press_to_audio = []
+real_observe = forecaster.observe
+
+
+def observe(stage, seconds, **labels):
+    if stage == 'press_to_audio':
+        press_to_audio.append(seconds)
+    real_observe(stage, seconds, **labels)
+
+
+forecaster.observe = observe
+
+
+def rss_mb():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # peak, in KB on Linux
+
+
+def cache_usage():
+    files = [os.path.join(CACHE_DIR, name) for name in os.listdir(CACHE_DIR)] if os.path.isdir(CACHE_DIR) else []
+    return sum(os.path.getsize(f) for f in files) / 1024 / 1024, len(files), len([f for f in files if f.endswith('.wav')])
+
+
+def age_caches(seconds):
+    """Move everything the caches know about time back by seconds, as if that much time had passed."""
+    store = cacheStore.get_cache_store()
+    for forecast_date, coord, entry in list(store.forecast_entries()):
+        store.put_forecast(forecast_date, coord, {**entry, 'exp': entry['exp'] - seconds})
+    with getWeather.HOURLY_DATA_LOCK:
+        for entry in getWeather.HOURLY_DATA_CACHE.values():
+            entry['exp'] -= seconds
+    for name in os.listdir(CACHE_DIR):
+        if name.endswith('.wav'):
+            path = os.path.join(CACHE_DIR, name)
+            stat = os.stat(path)
+            os.utime(path, (stat.st_atime - seconds, stat.st_mtime - seconds))
+
+
+def wait_for_background_refreshes():
+    while getWeather.BACKGROUND_REFRESHES.in_flight():
+        time.sleep(0.01)
+
+
+def on_press(duration):
+    quietly(forecaster.handle_request, press_day(duration))
+    quietly(wait_for_background_refreshes)
+
+
+print(f"Replaying {args.presses} presses over {args.hours} simulated hours ({args.cache_backend} cache, {args.playback} playback) in {CACHE_DIR}\n")
+print(f"{'presses':>7} {'sim h':>6} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} {'CPU s':>7} {'RSS MB':>7} {'cache MB':>9} {'files':>6} {'wavs':>5}")
+watcher = ButtonWatcher(device.button, on_press, clock=clock.time, sleep=clock.sleep)
+reports = []
+handled = 0
+aged_until = 0
+next_press = 0
+cpu_start = time.process_time()
+real_start = time.time()
+try:
+    while next_press < len(presses):
+        # skip ahead through the quiet time between presses instead of polling through it
+        start, duration = presses[next_press]
+        if start - clock.time() > 1:
+            clock.now = start - 0.5
+        while clock.time() - aged_until >= AGE_STEP:
+            aged_until += AGE_STEP
+            quietly(age_caches, AGE_STEP)
+
+        if watcher.poll() is not None:
+            handled += 1
+        clock.sleep(watcher.poll_interval)
+        if clock.time() > start + duration + 1:
+            next_press += 1
+
+        if press_to_audio and (len(press_to_audio) % args.report_every == 0 or next_press == len(presses)) and len(press_to_audio) != (reports[-1]['presses'] if reports else 0):
+            recent = press_to_audio[-args.report_every:]
+            cache_mb, files, wavs = cache_usage()
+            reports.append({'presses': len(press_to_audio), 'rss': rss_mb(), 'p95': percentile(recent, 0.95)})
+            print(f"{len(press_to_audio):7d} {clock.time() / 3600:6.1f} {percentile(recent, 0.5) * 1000:8.1f} {reports[-1]['p95'] * 1000:8.1f} {max(recent) * 1000:8.1f} {time.process_time() - cpu_start:7.1f} {reports[-1]['rss']:7.1f} {cache_mb:9.2f} {files:6d} {wavs:5d}")
+finally:
+    server.shutdown()
+
+print(f"\n{handled} presses handled in {round(time.time() - real_start, 1)} real seconds; upstream calls: {UPSTREAM_CALLS}")
+print(f"simulated speaker: {device.files_played} files, {round(device.seconds_played / 3600, 1)} hours of audio; LED changes: {device.led_changes}")
+problems = []
+if handled != args.presses:
+    problems.append(f"expected {args.presses} presses but {handled} were handled")
+if len(reports) > 1:
+    rss_growth = reports[-1]['rss'] - reports[0]['rss']
+    print(f"RSS growth after the first {reports[0]['presses']} presses: {rss_growth:.1f} MB; p95 press to audio went from {reports[0]['p95'] * 1000:.1f} to {reports[-1]['p95'] * 1000:.1f} ms")
+    if rss_growth > args.max_rss_growth:
+        problems.append(f"RSS grew by {rss_growth:.1f} MB")
+shutil.rmtree(CACHE_DIR, ignore_errors=True)
+print("PASS" if not problems else "FAIL: " + ', '.join(problems))
@@ -0,0 +1,31 @@
+import sys
+import os
+import tempfile
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from forecaster.playback import AudioPlayer, synthetic_pcm_chunks
+from forecaster.tts import create_wave_file_from_stream
+
+WAVE_OUTPUT_FILENAME = os.path.join(tempfile.mkdtemp(prefix='forecaster-stream-'), "stream-test.wav")
+
+player = AudioPlayer()
+start = time.time()
+first_chunk = {}
+
+def on_chunk(chunk):
+    if 'ts' not in first_chunk:
+        first_chunk['ts'] = time.time()
+        print("First audio after " + str(round(first_chunk['ts'] - start, 3)) + " seconds")
+    player.write(chunk)
+
+try:
+    create_wave_file_from_stream(WAVE_OUTPUT_FILENAME, synthetic_pcm_chunks(seconds=3), on_chunk)
+    player.finish()
+    print("Stream complete after " + str(round(time.time() - start, 3)) + " seconds")
+    print("Replaying tee'd file " + WAVE_OUTPUT_FILENAME + "...")
+    player.play_file(WAVE_OUTPUT_FILENAME)
+finally:
+    player.close()
+    if os.path.exists(WAVE_OUTPUT_FILENAME):
+        os.remove(WAVE_OUTPUT_FILENAME)
+    os.rmdir(os.path.dirname(WAVE_OUTPUT_FILENAME))
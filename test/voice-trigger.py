@@ -0,0 +1,85 @@
+import sys
+import os
+import math
+import random
+import struct
+import time
+os.environ.setdefault('METRICS_LOG', '0')
+os.environ.setdefault('METRICS_FILE', '')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from forecaster.voiceTrigger import VOSK_MODEL, VoiceTrigger, VoskKeywords, read_wav, split_frames
+
+# Feeds recorded WAV files through the voice trigger instead of the microphone, e.g.
+#   VOSK_MODEL=~/vosk-model-small-en-us-0.15 python test/voice-trigger.py tomorrow.wav whats-it-like-friday.wav
+# (record them on the Pi with test/audio.py). Without VOSK_MODEL, the files only show where the gate finds
+# phrases. Without any files, a synthetic recording with two bursts of "speech" and a click is used with a
+# stand-in recognizer, to check the gate and the ring buffer.
+RATE = 16000
+
+
+class AnyPhrase:
+    """Stands in for vosk when there is no model: every phrase the gate lets through counts as "today"."""
+
+    def accept(self, frame):
+        pass
+
+    def finish(self):
+        return 'today'
+
+
+class ScriptedRecognizer:
+    """Stands in for vosk: answers each phrase with the next scripted text and counts the audio it was given."""
+
+    def __init__(self, answers):
+        self.answers = list(answers)
+        self.frames = 0
+
+    def accept(self, frame):
+        self.frames += 1
+
+    def finish(self):
+        return self.answers.pop(0) if self.answers else ''
+
+
+def synthetic_recording():
+    random.seed(1)
+    def noise(seconds):
+        return [random.gauss(0, 60) for _ in range(int(RATE * seconds))]
+    def speech(seconds):
+        # a few harmonics with a syllable-like envelope, well above the room noise
+        n = int(RATE * seconds)
+        return [6000 * abs(math.sin(math.pi * 3 * i / n)) * sum(math.sin(2 * math.pi * f * i / RATE) for f in (180, 360, 720)) / 3 + random.gauss(0, 60) for i in range(n)]
+    def click():
+        return [12000 * (-1) ** i for i in range(int(RATE * 0.02))]
+    samples = noise(2) + speech(0.6) + noise(3) + click() + noise(3) + speech(0.9) + noise(2)
+    return struct.pack(f"<{len(samples)}h", *[max(-32768, min(32767, int(s))) for s in samples])
+
+
+def listen(trigger, pcm):
+    days = []
+    start = time.perf_counter()
+    for i, frame in enumerate(split_frames(pcm, trigger.frame_bytes)):
+        day = trigger.feed(frame)
+        if day:
+            print(f"  {i * trigger.frame_bytes / 2 / RATE:6.2f}s: {day}")
+            days.append(day)
+    elapsed = time.perf_counter() - start
+    seconds = len(pcm) / 2 / RATE
+    print(f"  {trigger.frames} frames, {trigger.recognized_frames / trigger.frames:.0%} given to the recognizer, {trigger.phrases} phrases")
+    print(f"  {elapsed * 1000:.1f} ms for {seconds:.1f} seconds of audio ({elapsed / seconds:.1%} of real time, {elapsed / trigger.frames * 1e6:.0f} us per frame)")
+    return days
+
+
+files = sys.argv[1:]
+if files:
+    for filename in files:
+        rate, pcm = read_wav(filename)
+        RATE = rate
+        print(filename)
+        listen(VoiceTrigger(VoskKeywords(rate=rate) if VOSK_MODEL else AnyPhrase(), rate=rate), pcm)
+else:
+    recognizer = ScriptedRecognizer(['tomorrow', 'um what about friday'])
+    trigger = VoiceTrigger(recognizer, rate=RATE)
+    days = listen(trigger, synthetic_recording())
+    ok = days == ['tomorrow', 'friday'] and trigger.phrases == 2 and recognizer.frames < trigger.frames / 2
+    print("PASS" if ok else f"FAIL: expected ['tomorrow', 'friday'] from 2 phrases but got {days} from {trigger.phrases}")